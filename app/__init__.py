@@ -0,0 +1,4 @@
+import time
+
+# Reference point for measuring how long a worker takes to start.
+STARTED_AT = time.perf_counter()
@@ -0,0 +1,20 @@
+import hmac
+
+from fastapi import Header, HTTPException
+
+from app.config import settings
+
+
+def is_admin_token(token: str) -> bool:
+    """Check a token against the configured admin token."""
+    return bool(settings.ADMIN_TOKEN) and hmac.compare_digest(
+        token.encode(), settings.ADMIN_TOKEN.encode()
+    )
+
+
+def require_admin(x_admin_token: str = Header(default="")) -> None:
+    """Reject requests that do not carry the admin token."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled.")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
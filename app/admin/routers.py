@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.admin.dependencies import require_admin
+from app.admin.schemas import (
+    AdmissionStats,
+    JobQueueStats,
+    RequestProfileDetail,
+    RequestProfileSummary,
+    SlowQuery,
+    StatementStats,
+)
+from app.cities.jobs import job_pool, read_queue_stats
+from app.database import get_session
+from app.utils.admission import admission_controller
+from app.utils.profiling import profile_store
+from app.utils.slow_queries import slow_query_log
+from app.utils.statements import statement_registry
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/slow-queries", response_model=list[SlowQuery], status_code=200)
+def list_slow_queries():
+    """Get the most recent slow statements, newest first."""
+    return slow_query_log.entries()
+
+
+@router.delete("/slow-queries", status_code=204)
+def clear_slow_queries():
+    """Clear the recorded slow statements."""
+    slow_query_log.clear()
+
+
+@router.get("/profiles", response_model=list[RequestProfileSummary], status_code=200)
+def list_profiles():
+    """Get the most recent request profiles, newest first."""
+    return [
+        RequestProfileSummary.model_validate(profile)
+        for profile in profile_store.list()
+    ]
+
+
+@router.get(
+    "/profiles/{profile_id}", response_model=RequestProfileDetail, status_code=200
+)
+def read_profile(profile_id: str):
+    """Get a request profile with its call statistics."""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found.")
+    return RequestProfileDetail.model_validate(profile)
+
+
+@router.get("/statements", response_model=list[StatementStats], status_code=200)
+def list_statements():
+    """Get the execution counts of the registered statements."""
+    return statement_registry.stats()
+
+
+@router.get("/admission", response_model=list[AdmissionStats], status_code=200)
+def list_admission_budgets():
+    """Get the queue depth and rejection counters of the admission budgets."""
+    return admission_controller.stats()
+
+
+@router.get("/jobs", response_model=JobQueueStats, status_code=200)
+def read_job_queue(db: Session = Depends(get_session)):
+    """Get the pending and failed jobs, the queue lag and this worker's counters."""
+    return {**read_queue_stats(db.connection()), **job_pool.stats()}
@@ -0,0 +1,71 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class SlowQuery(BaseModel):
+    """Model for returning a recorded slow statement."""
+
+    statement: str
+    parameters: str
+    duration_ms: float
+    executemany: bool
+    recorded_at: datetime
+    plan: Optional[str] = None
+    explain_error: Optional[str] = None
+
+
+class RequestProfileSummary(BaseModel):
+    """Model for returning the timings of a profiled request."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    profile_id: str
+    method: str
+    path: str
+    recorded_at: datetime
+    wall_ms: float
+    endpoint_ms: float
+    sql_ms: float
+    sql_statements: int
+
+
+class RequestProfileDetail(RequestProfileSummary):
+    """Model for returning a profiled request with its call statistics."""
+
+    stats: str
+
+
+class StatementStats(BaseModel):
+    """Model for returning the execution counts of a registered statement."""
+
+    name: str
+    executions: int
+    prepares: int
+    prepared: bool
+
+
+class AdmissionStats(BaseModel):
+    """Model for returning the queue depth and counters of an admission budget."""
+
+    name: str
+    max_concurrent: int
+    max_queue: int
+    active: int
+    queued: int
+    admitted: int
+    rejected_queue_full: int
+    rejected_deadline: int
+    service_ms: float
+
+
+class JobQueueStats(BaseModel):
+    """Model for returning the depth and lag of the job queue."""
+
+    pending: int
+    failed: int
+    lag_seconds: float
+    processed: int
+    retried: int
+    failed_jobs: int
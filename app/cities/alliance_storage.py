@@ -0,0 +1,107 @@
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.cities.models import Alliance, AlliedCity
+from app.cities.partitioning import _set_aside
+from app.config import settings
+from app.database import get_engine
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+# Suffix of the old layout's relations while the alliances are copied.
+OLD_SUFFIX = "_old"
+
+
+def read_alliance_storage(connection: Connection) -> str:
+    """Return the alliance storage in use: canonical when allied_city is a view."""
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('allied_city')")
+    ).scalar()
+    return "canonical" if relkind == "v" else "mirrored"
+
+
+def _to_canonical(connection: Connection) -> int:
+    _set_aside(connection, "allied_city", OLD_SUFFIX)
+    # Also creates the allied_city view over the new table.
+    Alliance.__table__.create(bind=connection, checkfirst=True)
+    return connection.execute(
+        text(
+            f"""
+            INSERT INTO alliance (city_uuid, ally_uuid)
+            SELECT DISTINCT LEAST(city_uuid, ally_uuid), GREATEST(city_uuid, ally_uuid)
+            FROM allied_city{OLD_SUFFIX}
+            """
+        )
+    ).rowcount
+
+
+def _to_mirrored(connection: Connection) -> int:
+    connection.execute(text("DROP VIEW allied_city"))
+    _set_aside(connection, "alliance", OLD_SUFFIX)
+    AlliedCity.__table__.create(bind=connection, checkfirst=True)
+    return connection.execute(
+        text(
+            f"""
+            INSERT INTO allied_city (city_uuid, ally_uuid)
+            SELECT city_uuid, ally_uuid FROM alliance{OLD_SUFFIX}
+            UNION
+            SELECT ally_uuid, city_uuid FROM alliance{OLD_SUFFIX}
+            """
+        )
+    ).rowcount
+
+
+def convert_alliance_storage(engine: Engine) -> str:
+    """Move the alliances to the ALLIANCE_STORAGE layout.
+
+    Canonical storage keeps one row per alliance, ordered lower UUID first, and
+    replaces the allied_city table with a view reading both directions, so
+    readers see the same rows before and after. Runs in one transaction holding
+    an exclusive lock on the alliances: requests wait for the copy, and a failed
+    copy leaves the old layout as it was. Returns the layout now in use.
+    """
+    target = settings.ALLIANCE_STORAGE
+    with engine.begin() as connection:
+        source = read_alliance_storage(connection)
+        if source == target:
+            logger.info("alliances already have the configured storage")
+            return target
+
+        old_table, new_table = (
+            ("alliance", "allied_city")
+            if source == "canonical"
+            else ("allied_city", "alliance")
+        )
+        connection.execute(text(f"LOCK TABLE {old_table} IN ACCESS EXCLUSIVE MODE"))
+
+        started = time.perf_counter()
+        convert = _to_canonical if target == "canonical" else _to_mirrored
+        rows = convert(connection)
+        logger.info(
+            "copied %s alliance rows from %s to %s storage in %.1fs",
+            rows,
+            source,
+            target,
+            time.perf_counter() - started,
+        )
+        connection.execute(text(f"DROP TABLE {old_table}{OLD_SUFFIX}"))
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(f"ANALYZE {new_table}"))
+
+    return target
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(
+        description="Convert the stored alliances to the layout set by "
+        "ALLIANCE_STORAGE (mirrored rows in allied_city, or canonical ordered "
+        "pairs in alliance read through an allied_city view)."
+    ).parse_args()
+
+    logger.info("alliances now use %s storage", convert_alliance_storage(get_engine()))
@@ -0,0 +1,161 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from app.cities.schemas import CityCreate, CityInDB
+from app.cities.services import CityService
+from app.config import settings
+from app.database import SessionLocal, get_engine
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+
+class CoalescerStoppedException(Exception):
+    """Custom exception raised for a city the stopped coalescer did not create."""
+
+    def __init__(self):
+        super().__init__("City creation batching is stopped.")
+
+
+class CreateCoalescer:
+    """Groups concurrent city creations into shared transactions.
+
+    Requests wait on a future while a writer thread collects everything that
+    arrives within ``max_wait_ms`` of the first request, up to ``max_batch_size``,
+    and creates the batch with one commit. Each caller gets its own city or its
+    own error back (see CityService.create_cities). Once stopped, new and still
+    queued cities get CoalescerStoppedException so callers can create them
+    themselves.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self, max_batch_size: int, max_wait_ms: float, result_timeout: float = 30.0
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.result_timeout = result_timeout
+        self.batches = 0
+        self.batched_cities = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._state_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        with self._state_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="create-coalescer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Create everything already queued and stop the thread."""
+        with self._state_lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            # Queued under the lock, so every accepted city is ahead of it.
+            self._queue.put(self._STOP)
+
+        thread.join(timeout)
+        if not thread.is_alive():
+            self._fail_queued()
+
+    def submit(self, city_data: CityCreate) -> "Future[CityInDB]":
+        """Queue a city for the next batch, refused once the coalescer is stopped."""
+        future: "Future[CityInDB]" = Future()
+        with self._state_lock:
+            if self._thread is None:
+                raise CoalescerStoppedException()
+            self._queue.put((city_data, future))
+        return future
+
+    def create(self, city_data: CityCreate) -> CityInDB:
+        """Create a city in the next batch, raising its error if it failed."""
+        return self.submit(city_data).result(timeout=self.result_timeout)
+
+    def _collect(self) -> Tuple[List[Tuple[CityCreate, Future]], bool]:
+        """Wait for a first request, then gather more until the window closes."""
+        first = self._queue.get()
+        if first is self._STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        batch: List[Tuple[CityCreate, Future]] = []
+        try:
+            while True:
+                batch, stop = self._collect()
+                if batch:
+                    self._create_batch(batch)
+                if stop:
+                    return
+        except BaseException as e:
+            # Stop accepting, so callers create their cities themselves, and
+            # answer everyone still waiting instead of leaving them hanging.
+            logger.exception("create coalescer stopped unexpectedly")
+            with self._state_lock:
+                self._thread = None
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            self._fail_queued()
+
+    def _fail_queued(self) -> None:
+        """Answer every city left in the queue with CoalescerStoppedException."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not self._STOP:
+                item[1].set_exception(CoalescerStoppedException())
+
+    def _create_batch(self, batch: List[Tuple[CityCreate, Future]]) -> None:
+        session = None
+        try:
+            session = SessionLocal(bind=get_engine())
+            results = CityService(session).create_cities(
+                [city_data for city_data, _ in batch]
+            )
+        except Exception as e:
+            logger.exception("create batch of %s cities failed", len(batch))
+            results = [e] * len(batch)
+        finally:
+            if session is not None:
+                session.close()
+
+        self.batches += 1
+        self.batched_cities += len(batch)
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+create_coalescer = CreateCoalescer(
+    max_batch_size=settings.CREATE_BATCH_MAX_SIZE,
+    max_wait_ms=settings.CREATE_BATCH_MAX_WAIT_MS,
+    result_timeout=settings.CREATE_BATCH_RESULT_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from app.cities.events import CityChange, subscribe
+from app.cities.schemas import CityInDBWithAllyForce
+from app.config import settings
+
+
+class CityCache:
+    """Thread-safe LRU cache of cities together with their allied power.
+
+    A city's allied power depends on its allies, so evicting a city also evicts
+    every cached city that lists it as an ally.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, CityInDBWithAllyForce]]" = (
+            OrderedDict()
+        )
+        self._allied_with: Dict[str, Set[str]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def generation(self) -> int:
+        """Return a token to pass to put() so fills that raced an eviction are dropped."""
+        return self._generation
+
+    def get(self, city_uuid: str) -> Optional[CityInDBWithAllyForce]:
+        """Return the cached city, if present and not expired."""
+        with self._lock:
+            entry = self._entries.get(city_uuid)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(city_uuid)
+                return None
+
+            self._entries.move_to_end(city_uuid)
+            return entry[1]
+
+    def put(self, city: CityInDBWithAllyForce, generation: int) -> None:
+        """Cache a city read while the cache was at the given generation."""
+        if not self.enabled:
+            return
+
+        city_uuid = str(city.city_uuid)
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._remove(city_uuid)
+            self._entries[city_uuid] = (time.monotonic() + self.ttl_seconds, city)
+            for ally in city.allied_cities or []:
+                self._allied_with.setdefault(str(ally), set()).add(city_uuid)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def evict(self, city_uuid: str) -> None:
+        """Evict a city and every cached city allied with it."""
+        with self._lock:
+            self._generation += 1
+            self._remove(city_uuid)
+            for dependant in self._allied_with.pop(city_uuid, set()):
+                self._remove(dependant)
+
+    def clear(self) -> None:
+        """Evict everything."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._allied_with.clear()
+
+    def _remove(self, city_uuid: str) -> None:
+        entry = self._entries.pop(city_uuid, None)
+        if entry is None:
+            return
+
+        for ally in entry[1].allied_cities or []:
+            dependants = self._allied_with.get(str(ally))
+            if dependants is not None:
+                dependants.discard(city_uuid)
+                if not dependants:
+                    del self._allied_with[str(ally)]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+city_cache = CityCache(settings.CITY_CACHE_SIZE, settings.CITY_CACHE_TTL_SECONDS)
+
+
+def _evict_changed_city(change: CityChange) -> None:
+    city_cache.evict(change.city_uuid)
+
+
+subscribe(_evict_changed_city, city_cache.clear)
@@ -0,0 +1,382 @@
+import json
+import os
+import select
+import socket
+import threading
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.cities.exceptions import ChangeLogTruncatedException
+from app.config import settings
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+CITY_CHANGES_CHANNEL = "city_changes"
+
+# A change log entry can commit after a higher sequence number was read, so a
+# catch up also re-reads changes this close to the position's timestamp.
+CHANGE_LOG_OVERLAP_SECONDS = 300
+
+# Entries deleted per transaction when pruning the change log.
+CHANGE_LOG_PRUNE_BATCH = 10000
+
+# Identifies this process so its own notifications are not applied twice.
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CityChangeKind(str, Enum):
+    """Enum for the kinds of city change events."""
+
+    created = "created"
+    updated = "updated"
+    deleted = "deleted"
+    alliances_changed = "alliances_changed"
+
+
+class CityChange(NamedTuple):
+    """A change to a single city."""
+
+    city_uuid: str
+    kind: CityChangeKind
+
+
+_change_handlers: List[Callable[[CityChange], None]] = []
+_reset_handlers: List[Callable[[], None]] = []
+
+
+def subscribe(
+    on_change: Callable[[CityChange], None], on_reset: Callable[[], None]
+) -> None:
+    """Register callbacks for city changes and for when changes may have been missed."""
+    _change_handlers.append(on_change)
+    _reset_handlers.append(on_reset)
+
+
+def dispatch(changes: Iterable[CityChange]) -> None:
+    """Deliver changes to the local subscribers."""
+    for change in changes:
+        for handler in _change_handlers:
+            try:
+                handler(change)
+            except Exception:
+                logger.exception("city change handler failed for %s", change)
+
+
+def dispatch_reset() -> None:
+    """Tell the local subscribers that changes may have been missed."""
+    for handler in _reset_handlers:
+        try:
+            handler()
+        except Exception:
+            logger.exception("city change reset handler failed")
+
+
+def publish_city_changes(db: Session, changes: Iterable[CityChange]) -> None:
+    """Record changes in the change log and send them over NOTIFY.
+
+    Both happen in the caller's transaction, so Postgres only keeps and delivers
+    them if it commits.
+    """
+    changes = list(changes)
+    if changes:
+        db.execute(
+            text(
+                "INSERT INTO city_change_log (city_uuid, kind) VALUES (:city_uuid, :kind)"
+            ),
+            [
+                {"city_uuid": change.city_uuid, "kind": change.kind.value}
+                for change in changes
+            ],
+        )
+
+    values = [
+        {
+            "channel": CITY_CHANGES_CHANNEL,
+            "payload": json.dumps(
+                {"city_uuid": change.city_uuid, "kind": change.kind, "origin": ORIGIN}
+            ),
+        }
+        for change in changes
+    ]
+    if values:
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), values)
+
+
+class ChangeLogPosition(NamedTuple):
+    """Where a copy of the city tables stands in the change log."""
+
+    change_seq: int
+    taken_at: float
+
+
+def read_change_log_position(connection: Connection) -> ChangeLogPosition:
+    """Return the current change log position.
+
+    Read it first in a REPEATABLE READ transaction so it matches the tables read
+    after it.
+    """
+    row = connection.execute(
+        text(
+            """
+            SELECT COALESCE(max(seq), 0) AS change_seq,
+                   extract(epoch FROM now()) AS taken_at
+            FROM city_change_log
+            """
+        )
+    ).one()
+    return ChangeLogPosition(row.change_seq, float(row.taken_at))
+
+
+def fetch_changed_city_uuids(
+    connection: Connection, position: ChangeLogPosition
+) -> List[str]:
+    """Return the cities changed after a change log position.
+
+    Raises ChangeLogTruncatedException when changes after the position may have
+    been pruned from the log.
+    """
+    retention = settings.CHANGE_LOG_RETENTION_HOURS * 3600
+    if retention > 0:
+        now = connection.execute(text("SELECT extract(epoch FROM now())")).scalar()
+        if position.taken_at - CHANGE_LOG_OVERLAP_SECONDS < float(now) - retention:
+            raise ChangeLogTruncatedException(position.change_seq)
+
+    result = connection.execute(
+        text(
+            """
+            SELECT DISTINCT city_uuid
+            FROM city_change_log
+            WHERE seq > :change_seq
+               OR changed_at > to_timestamp(:taken_at) - make_interval(secs => :overlap)
+            """
+        ),
+        {
+            "change_seq": position.change_seq,
+            "taken_at": position.taken_at,
+            "overlap": CHANGE_LOG_OVERLAP_SECONDS,
+        },
+    )
+    return [str(row.city_uuid) for row in result]
+
+
+class ChangeLogEntry(NamedTuple):
+    """A change log row."""
+
+    seq: int
+    city_uuid: str
+    kind: CityChangeKind
+    changed_at: datetime
+
+
+# Change log rows whose writing transaction is older than every transaction
+# still running: no row can commit before them any more.
+SETTLED_CHANGES = "xid < pg_snapshot_xmin(pg_current_snapshot())"
+
+
+def read_change_feed_head(connection: Connection) -> int:
+    """Return the sequence number of the last settled change, 0 when there is none."""
+    return connection.execute(
+        text(
+            f"""
+            SELECT COALESCE(
+                (SELECT seq FROM city_change_log
+                 WHERE {SETTLED_CHANGES}
+                 ORDER BY xid DESC, seq DESC
+                 LIMIT 1),
+                0
+            )
+            """
+        )
+    ).scalar()
+
+
+def check_change_log_retained(connection: Connection, since: int) -> None:
+    """Raise ChangeLogTruncatedException when entries after ``since`` were pruned."""
+    oldest = connection.execute(
+        text(
+            """
+            SELECT min(seq) FROM city_change_log
+            WHERE NOT EXISTS (SELECT 1 FROM city_change_log WHERE seq = :since)
+            """
+        ),
+        {"since": since},
+    ).scalar()
+    if since > 0 and oldest is not None and since < oldest:
+        raise ChangeLogTruncatedException(since)
+
+
+def prune_change_log(engine: Engine, retention_hours: float) -> int:
+    """Delete the change log entries older than the retention, in batches.
+
+    Returns the number of entries deleted.
+    """
+    deleted = 0
+    while True:
+        with engine.begin() as connection:
+            batch = connection.execute(
+                text(
+                    """
+                    DELETE FROM city_change_log
+                    WHERE seq IN (
+                        SELECT seq FROM city_change_log
+                        WHERE changed_at < now() - make_interval(secs => :retention)
+                        ORDER BY changed_at
+                        LIMIT :batch_size
+                    )
+                    """
+                ),
+                {
+                    "retention": retention_hours * 3600,
+                    "batch_size": CHANGE_LOG_PRUNE_BATCH,
+                },
+            ).rowcount
+        deleted += batch
+        if batch < CHANGE_LOG_PRUNE_BATCH:
+            return deleted
+
+
+def fetch_change_log(
+    connection: Connection, since: int, limit: int
+) -> List[ChangeLogEntry]:
+    """Return up to ``limit`` settled change log entries after sequence number ``since``.
+
+    Entries come in commit order, by writing transaction, rather than by sequence
+    number: a transaction can commit after one that took a higher number. They
+    are only returned once every transaction that could precede them has ended,
+    so a reader resuming after ``since`` never skips a late commit. ``since`` 0
+    starts at the oldest entry kept.
+    """
+    anchor_xid = connection.execute(
+        text("SELECT xid FROM city_change_log WHERE seq = :since"), {"since": since}
+    ).scalar()
+    params = {"since": since, "limit": limit}
+    if anchor_xid is None:
+        if since > 0:
+            check_change_log_retained(connection, since)
+        after = "seq > :since"
+    else:
+        after = "(xid, seq) > (CAST(:anchor_xid AS xid8), :since)"
+        params["anchor_xid"] = str(anchor_xid)
+
+    result = connection.execute(
+        text(
+            f"""
+            SELECT seq, city_uuid, kind, changed_at
+            FROM city_change_log
+            WHERE {after} AND {SETTLED_CHANGES}
+            ORDER BY xid, seq
+            LIMIT :limit
+            """
+        ),
+        params,
+    )
+    return [
+        ChangeLogEntry(
+            row.seq, str(row.city_uuid), CityChangeKind(row.kind), row.changed_at
+        )
+        for row in result
+    ]
+
+
+def parse_notification(payload: str) -> Optional[Tuple[str, CityChange]]:
+    """Parse a notification payload into its origin and change."""
+    try:
+        data = json.loads(payload)
+        return data["origin"], CityChange(
+            str(data["city_uuid"]), CityChangeKind(data["kind"])
+        )
+    except (ValueError, KeyError, TypeError):
+        logger.warning("ignoring malformed city change payload: %s", payload)
+        return None
+
+
+class CityChangeListener(threading.Thread):
+    """Background thread that LISTENs for city changes made by other processes."""
+
+    def __init__(self, engine: Engine, poll_seconds: float = 1.0):
+        super().__init__(name="city-change-listener", daemon=True)
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self._stop_event = threading.Event()
+        self._has_listened = False
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop listening and wait for the thread to finish."""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def run(self) -> None:
+        backoff = self.poll_seconds
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("city change listener disconnected")
+                dispatch_reset()
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _listen(self) -> None:
+        """Hold a dedicated connection in LISTEN mode and dispatch what arrives."""
+        connection = self.engine.raw_connection()
+        # Taken before detaching, which drops the pool's record of it.
+        dbapi_connection = connection.driver_connection
+        connection.detach()
+        dbapi_connection.autocommit = True
+
+        try:
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CITY_CHANGES_CHANNEL};")
+
+            # Changes made while reconnecting were never delivered.
+            if self._has_listened:
+                dispatch_reset()
+            self._has_listened = True
+
+            while not self._stop_event.is_set():
+                if not select.select([dbapi_connection], [], [], self.poll_seconds)[0]:
+                    continue
+
+                dbapi_connection.poll()
+                changes = []
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    parsed = parse_notification(notification.payload)
+                    if parsed and parsed[0] != ORIGIN:
+                        changes.append(parsed[1])
+
+                dispatch(changes)
+        finally:
+            dbapi_connection.close()
+
+
+class ChangeLogPruner(threading.Thread):
+    """Background thread that deletes change log entries past their retention."""
+
+    def __init__(self, engine: Engine, retention_hours: float, interval_seconds: float):
+        super().__init__(name="change-log-pruner", daemon=True)
+        self.engine = engine
+        self.retention_hours = retention_hours
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop pruning and wait for the thread to finish."""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                deleted = prune_change_log(self.engine, self.retention_hours)
+                if deleted:
+                    logger.info("pruned %s change log entries", deleted)
+            except Exception:
+                logger.exception("change log pruning failed")
+            self._stop_event.wait(self.interval_seconds)
@@ -25,3 +25,33 @@ class CityNotFoundException(Exception):
     def __init__(self, city_uuid: UUID):
         self.city_uuid = city_uuid
         super().__init__(f"City with UUID {str(city_uuid)} not found.")
+
+
+class InvalidSnapshotFileException(Exception):
+    """Custom exception raised when a city snapshot file cannot be used."""
+
+    def __init__(self, path: str, reason: str):
+        self.path = path
+        super().__init__(f"Invalid city snapshot file {path}: {reason}")
+
+
+class InvalidFieldsException(Exception):
+    """Custom exception raised when a sparse fieldset names unknown fields."""
+
+
+class TooManyCitiesException(Exception):
+    """Custom exception raised when a bulk filter selects more cities than allowed."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(
+            f"City filter selects more than {limit} cities; narrow it down."
+        )
+
+
+class ChangeLogTruncatedException(Exception):
+    """Custom exception raised when changes after a position are no longer in the log."""
+
+    def __init__(self, since: int):
+        self.since = since
+        super().__init__(f"Changes after {since} are no longer in the change log")
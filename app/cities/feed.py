@@ -0,0 +1,152 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, Optional, Set, Tuple
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.cities.events import (
+    ChangeLogEntry,
+    check_change_log_retained,
+    fetch_change_log,
+    read_change_feed_head,
+    subscribe,
+)
+from app.cities.schemas import CityChangeEvent, CityChangeFeed
+from app.config import settings
+from app.database import connect_for_read
+
+
+class ChangeFeedSignal:
+    """Wakes the change feed requests waiting for new changes.
+
+    Changes are seen on request threads and on the listener thread, so each
+    waiting request is woken through its own event loop.
+    """
+
+    def __init__(self):
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._lock = threading.Lock()
+
+    def notify(self) -> None:
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The loop has been closed.
+                pass
+
+    @contextmanager
+    def waiter(self) -> Iterator[asyncio.Event]:
+        """Register an event set by the next change.
+
+        Register before reading the log, so a change committed in between still
+        wakes the request.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+change_feed_signal = ChangeFeedSignal()
+
+subscribe(lambda change: change_feed_signal.notify(), change_feed_signal.notify)
+
+
+async def _wait(event: asyncio.Event, timeout: float) -> None:
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+def read_changes(
+    request: Request, since: Optional[int], limit: int
+) -> Tuple[int, List[ChangeLogEntry]]:
+    """Read the changes after ``since``, None meaning the current end of the log.
+
+    Returns the resolved ``since`` along with the changes.
+    """
+    connection = connect_for_read(request)
+    try:
+        if since is None:
+            since = read_change_feed_head(connection)
+        return since, fetch_change_log(connection, since, limit)
+    finally:
+        connection.close()
+
+
+def check_since(request: Request, since: int) -> None:
+    """Raise ChangeLogTruncatedException when the changes after ``since`` were pruned."""
+    connection = connect_for_read(request)
+    try:
+        check_change_log_retained(connection, since)
+    finally:
+        connection.close()
+
+
+def _event(entry: ChangeLogEntry) -> CityChangeEvent:
+    return CityChangeEvent(**entry._asdict())
+
+
+async def poll_changes(
+    request: Request, since: Optional[int], limit: int, wait: float
+) -> CityChangeFeed:
+    """Return the changes after ``since`` as soon as there are any, waiting up to ``wait`` seconds."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        with change_feed_signal.waiter() as changed:
+            since, entries = await run_in_threadpool(
+                read_changes, request, since, limit
+            )
+            remaining = deadline - loop.time()
+            if entries or remaining <= 0 or await request.is_disconnected():
+                return CityChangeFeed(
+                    changes=[_event(entry) for entry in entries],
+                    last_seq=entries[-1].seq if entries else since,
+                )
+            await _wait(changed, min(remaining, settings.CHANGE_FEED_POLL_SECONDS))
+
+
+def format_event(event: CityChangeEvent) -> str:
+    """Format a change as a server-sent event whose id is its sequence number."""
+    return f"id: {event.seq}\nevent: {event.kind.value}\ndata: {event.model_dump_json()}\n\n"
+
+
+async def stream_changes(
+    request: Request, since: Optional[int], limit: int
+) -> AsyncIterator[str]:
+    """Server-sent events for every change after ``since``, until the client goes away.
+
+    A reconnecting client sends the last id it got as ``Last-Event-ID`` and
+    resumes right after it. The response stops the generator when the client
+    disconnects.
+    """
+    loop = asyncio.get_running_loop()
+    last_sent = loop.time()
+    yield f"retry: {int(settings.CHANGE_FEED_POLL_SECONDS * 1000)}\n\n"
+
+    while True:
+        with change_feed_signal.waiter() as changed:
+            since, entries = await run_in_threadpool(
+                read_changes, request, since, limit
+            )
+            if entries:
+                since = entries[-1].seq
+                last_sent = loop.time()
+                yield "".join(format_event(_event(entry)) for entry in entries)
+                continue
+
+            if loop.time() - last_sent >= settings.CHANGE_FEED_HEARTBEAT_SECONDS:
+                last_sent = loop.time()
+                yield ": keepalive\n\n"
+            await _wait(changed, settings.CHANGE_FEED_POLL_SECONDS)
@@ -0,0 +1,266 @@
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from app.cities.schemas import EXPORT_FIELDS
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+EVENT_STREAM = "text/event-stream"
+
+# Media types some clients send for the same format.
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK}
+
+LIST_MEDIA_TYPES = (JSON, MSGPACK, ARROW)
+EXPORT_MEDIA_TYPES = (NDJSON, MSGPACK, ARROW)
+CHANGE_FEED_MEDIA_TYPES = (JSON, EVENT_STREAM)
+
+# Preferred first when the client accepts both equally.
+ENCODINGS = ("zstd", "gzip")
+
+ARROW_END_OF_STREAM = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def _parse_header(header: Optional[str]) -> List[Tuple[str, float]]:
+    """Parse an Accept style header into (value, quality) pairs, best first."""
+    values = []
+    for position, item in enumerate((header or "").split(",")):
+        value, *params = [part.strip() for part in item.split(";")]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        values.append((value.lower(), quality, position))
+    values.sort(key=lambda value: (-value[1], value[2]))
+    return [(value, quality) for value, quality, _ in values]
+
+
+def negotiate_media_type(
+    accept: Optional[str], offered: Sequence[str]
+) -> Optional[str]:
+    """Pick the offered media type the client prefers; the first one for */*."""
+    if not accept:
+        return offered[0]
+
+    for media_type, quality in _parse_header(accept):
+        if quality <= 0:
+            continue
+        media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        if media_type in offered:
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return offered[0]
+    return None
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick zstd or gzip when the client accepts them, else no compression."""
+    accepted = {
+        encoding: quality
+        for encoding, quality in _parse_header(accept_encoding)
+        if quality > 0
+    }
+    # A wildcard only stands for gzip, which every client can decode.
+    candidates = [
+        encoding
+        for encoding in ENCODINGS
+        if encoding in accepted or (encoding == "gzip" and "*" in accepted)
+    ]
+    if not candidates:
+        return None
+    return max(
+        candidates, key=lambda encoding: accepted.get(encoding, accepted.get("*", 0))
+    )
+
+
+class Compressor:
+    """Streaming zstd or gzip compressor."""
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            import zstandard
+
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    compressor = Compressor(encoding)
+    return compressor.compress(body) + compressor.flush()
+
+
+def _uuid_bytes(value: Any) -> bytes:
+    return value.bytes if isinstance(value, UUID) else UUID(str(value)).bytes
+
+
+def _beauty(value: Any) -> Optional[str]:
+    return getattr(value, "value", value)
+
+
+# Fields encoded when the caller does not pick any.
+DEFAULT_FIELDS = EXPORT_FIELDS
+
+
+def _get(row: Any, field: str) -> Any:
+    """Field of a city row, model or (for sparse fieldsets) dict."""
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def _uuid_list(value: Any, convert) -> List[Any]:
+    return [convert(ally) for ally in value or []]
+
+
+# Plain values for MessagePack: 16 byte UUIDs and float coordinates.
+_PLAIN_VALUES = {
+    "city_uuid": _uuid_bytes,
+    "name": lambda value: value,
+    "beauty": _beauty,
+    "population": lambda value: value,
+    "geo_location_latitude": float,
+    "geo_location_longitude": float,
+    "allied_cities": lambda value: _uuid_list(value, _uuid_bytes),
+    "allied_power": lambda value: value,
+}
+
+# JSON values, in the same shape as the JSON API.
+_JSON_VALUES = {
+    **_PLAIN_VALUES,
+    "city_uuid": str,
+    "geo_location_latitude": str,
+    "geo_location_longitude": str,
+    "allied_cities": lambda value: _uuid_list(value, str),
+}
+
+
+def _arrow_fields():
+    import pyarrow as pa
+
+    return {
+        "city_uuid": pa.field("city_uuid", pa.binary(16), nullable=False),
+        "name": pa.field("name", pa.string(), nullable=False),
+        "beauty": pa.field("beauty", pa.string()),
+        "population": pa.field("population", pa.int32(), nullable=False),
+        "geo_location_latitude": pa.field(
+            "geo_location_latitude", pa.decimal128(9, 6), nullable=False
+        ),
+        "geo_location_longitude": pa.field(
+            "geo_location_longitude", pa.decimal128(9, 6), nullable=False
+        ),
+        "allied_cities": pa.field(
+            "allied_cities", pa.list_(pa.binary(16)), nullable=False
+        ),
+        "allied_power": pa.field("allied_power", pa.int64(), nullable=False),
+    }
+
+
+def arrow_schema(fields: Sequence[str] = DEFAULT_FIELDS):
+    import pyarrow as pa
+
+    arrow_fields = _arrow_fields()
+    return pa.schema([arrow_fields[field] for field in fields])
+
+
+def arrow_record_batch(rows: Sequence[Any], schema=None):
+    """Build a record batch column by column straight from city rows."""
+    import pyarrow as pa
+
+    schema = schema or arrow_schema()
+    columns = []
+    for field in schema:
+        values = [_get(row, field.name) for row in rows]
+        if field.name in ("city_uuid", "allied_cities", "beauty"):
+            values = [_PLAIN_VALUES[field.name](value) for value in values]
+        columns.append(pa.array(values, field.type))
+    return pa.record_batch(columns, schema=schema)
+
+
+def _plain_city(row: Any, fields: Sequence[str] = DEFAULT_FIELDS) -> Dict[str, Any]:
+    """City as plain values: 16 byte UUIDs and float coordinates."""
+    return {field: _PLAIN_VALUES[field](_get(row, field)) for field in fields}
+
+
+def _json_city(row: Any, fields: Sequence[str] = DEFAULT_FIELDS) -> str:
+    """City as a JSON line, in the same shape as the JSON API."""
+    return json.dumps(
+        {field: _JSON_VALUES[field](_get(row, field)) for field in fields},
+        ensure_ascii=False,
+    )
+
+
+def encode_cities(
+    rows: Sequence[Any], media_type: str, fields: Sequence[str] = DEFAULT_FIELDS
+) -> bytes:
+    """Encode one page of city rows as a single MessagePack array or Arrow stream."""
+    if media_type == MSGPACK:
+        import msgpack
+
+        return msgpack.packb(
+            [_plain_city(row, fields) for row in rows], use_bin_type=True
+        )
+
+    schema = arrow_schema(fields)
+    return (
+        schema.serialize().to_pybytes()
+        + arrow_record_batch(rows, schema).serialize().to_pybytes()
+        + ARROW_END_OF_STREAM
+    )
+
+
+def stream_cities(
+    chunks: Iterable[Sequence[Any]],
+    media_type: str,
+    encoding: Optional[str],
+    fields: Sequence[str] = DEFAULT_FIELDS,
+) -> Iterator[bytes]:
+    """Encode chunks of city rows as NDJSON, a MessagePack sequence or an Arrow stream.
+
+    MessagePack is streamed as one map per city, read back with msgpack.Unpacker;
+    Arrow gets one record batch per chunk.
+    """
+    compressor = Compressor(encoding) if encoding else None
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    if media_type == ARROW:
+        schema = arrow_schema(fields)
+        header = emit(schema.serialize().to_pybytes())
+        if header:
+            yield header
+    elif media_type == MSGPACK:
+        import msgpack
+
+        packer = msgpack.Packer(use_bin_type=True)
+
+    for rows in chunks:
+        if not rows:
+            continue
+        if media_type == ARROW:
+            data = arrow_record_batch(rows, schema).serialize().to_pybytes()
+        elif media_type == MSGPACK:
+            data = b"".join(packer.pack(_plain_city(row, fields)) for row in rows)
+        else:
+            data = "".join(_json_city(row, fields) + "\n" for row in rows).encode()
+        chunk = emit(data)
+        if chunk:
+            yield chunk
+
+    if media_type == ARROW:
+        yield emit(ARROW_END_OF_STREAM)
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,393 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.cities.events import CityChange, CityChangeKind, subscribe
+from app.config import settings
+from app.database import get_engine
+from app.utils.common import calculate_allied_power
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+ALLIED_POWER = "allied_power"
+
+# Changes after which the allied power of the city's allies is stale as well.
+ALLY_AFFECTING_CHANGES = (CityChangeKind.created, CityChangeKind.updated)
+
+MAX_RETRY_DELAY_SECONDS = 300
+
+
+def enqueue_jobs(db: Session, kind: str, city_uuids: Iterable[str]) -> None:
+    """Queue a job per city in the caller's transaction, merging with queued ones."""
+    # Sorted so concurrent writers take the job row locks in the same order.
+    params = [{"kind": kind, "city_uuid": uuid} for uuid in sorted(set(city_uuids))]
+    if not params:
+        return
+
+    db.execute(
+        text(
+            """
+            INSERT INTO city_job (kind, city_uuid) VALUES (:kind, :city_uuid)
+            ON CONFLICT (kind, city_uuid) DO UPDATE SET
+                version = city_job.version + 1,
+                status = 'pending',
+                attempts = 0,
+                run_at = now(),
+                last_error = NULL
+            """
+        ),
+        params,
+    )
+
+
+def enqueue_city_jobs(db: Session, changes: Sequence[CityChange]) -> None:
+    """Queue an allied power recompute for every city a write affected.
+
+    Moving a city or changing its population changes the allied power of
+    each of its allies too.
+    """
+    city_uuids = {change.city_uuid for change in changes}
+    moved_uuids = tuple(
+        change.city_uuid for change in changes if change.kind in ALLY_AFFECTING_CHANGES
+    )
+    if moved_uuids:
+        city_uuids.update(
+            str(row.ally_uuid)
+            for row in db.execute(
+                text(
+                    "SELECT ally_uuid FROM allied_city WHERE city_uuid IN :city_uuids"
+                ),
+                {"city_uuids": moved_uuids},
+            )
+        )
+    enqueue_jobs(db, ALLIED_POWER, city_uuids)
+
+
+def recompute_allied_power(connection: Connection, city_uuids: List[str]) -> None:
+    """Store the allied power of the given cities, dropping it for deleted ones."""
+    city_uuids = tuple(city_uuids)
+    cities = connection.execute(
+        text(
+            """
+            SELECT city_uuid, population, geo_location_latitude, geo_location_longitude
+            FROM city
+            WHERE city_uuid IN :city_uuids
+            """
+        ),
+        {"city_uuids": city_uuids},
+    ).fetchall()
+
+    allies = defaultdict(list)
+    for row in connection.execute(
+        text(
+            """
+            SELECT ac.city_uuid, c.geo_location_latitude, c.geo_location_longitude,
+                   c.population
+            FROM allied_city ac
+            JOIN city c ON c.city_uuid = ac.ally_uuid
+            WHERE ac.city_uuid IN :city_uuids
+            """
+        ),
+        {"city_uuids": city_uuids},
+    ):
+        allies[row.city_uuid].append(
+            (row.geo_location_latitude, row.geo_location_longitude, row.population)
+        )
+
+    powers = [
+        {
+            "city_uuid": city.city_uuid,
+            "allied_power": city.population
+            + calculate_allied_power(
+                (city.geo_location_latitude, city.geo_location_longitude),
+                allies[city.city_uuid],
+            ),
+        }
+        for city in sorted(cities, key=lambda city: str(city.city_uuid))
+    ]
+    if powers:
+        connection.execute(
+            text(
+                """
+                INSERT INTO city_allied_power (city_uuid, allied_power)
+                VALUES (:city_uuid, :allied_power)
+                ON CONFLICT (city_uuid) DO UPDATE SET
+                    allied_power = EXCLUDED.allied_power,
+                    computed_at = now()
+                """
+            ),
+            powers,
+        )
+
+    connection.execute(
+        text(
+            """
+            DELETE FROM city_allied_power
+            WHERE city_uuid IN :city_uuids
+              AND city_uuid NOT IN (SELECT city_uuid FROM city WHERE city_uuid IN :city_uuids)
+            """
+        ),
+        {"city_uuids": city_uuids},
+    )
+
+
+JOB_HANDLERS: Dict[str, Callable[[Connection, List[str]], None]] = {
+    ALLIED_POWER: recompute_allied_power,
+}
+
+
+def read_queue_stats(connection: Connection) -> dict:
+    """Return the number of pending and failed jobs and the age of the oldest one."""
+    row = connection.execute(
+        text(
+            """
+            SELECT
+                count(*) FILTER (WHERE status = 'pending') AS pending,
+                count(*) FILTER (WHERE status = 'failed') AS failed,
+                COALESCE(
+                    extract(epoch FROM now() - min(enqueued_at) FILTER (WHERE status = 'pending')),
+                    0
+                ) AS lag_seconds
+            FROM city_job
+            """
+        )
+    ).one()
+    return {
+        "pending": row.pending,
+        "failed": row.failed,
+        "lag_seconds": float(row.lag_seconds),
+    }
+
+
+def _lock_jobs(connection: Connection, jobs: list) -> None:
+    """Lock claimed jobs in city_uuid order, the order writers enqueue them in.
+
+    Done before changing them so a worker and a writer re-queuing two of the
+    same cities wait for each other instead of deadlocking.
+    """
+    connection.execute(
+        text(
+            """
+            SELECT job_id FROM city_job
+            WHERE job_id IN :job_ids
+            ORDER BY city_uuid
+            FOR UPDATE
+            """
+        ),
+        {"job_ids": tuple(job.job_id for job in jobs)},
+    ).fetchall()
+
+
+class JobWorkerPool:
+    """Threads that claim queued jobs in batches and run their handlers.
+
+    A claim leases the jobs for ``lease_seconds`` in a short transaction, so no
+    lock is held while the handler runs and a crashed worker's jobs are picked
+    up again once the lease runs out. Failed jobs are retried with exponential
+    backoff and kept as failed after ``max_attempts``.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        batch_size: int,
+        poll_seconds: float,
+        lease_seconds: float,
+        max_attempts: int,
+        engine: Optional[Engine] = None,
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.engine = engine
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._state_lock = threading.Lock()
+        self._subscribed = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self) -> None:
+        with self._state_lock:
+            if self._threads:
+                return
+            if not self._subscribed:
+                subscribe(lambda change: self.wake(), self.wake)
+                self._subscribed = True
+            self._stop_event.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Let the workers finish their current batch and stop them."""
+        with self._state_lock:
+            threads, self._threads = self._threads, []
+        self._stop_event.set()
+        self._wake_event.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def wake(self) -> None:
+        """Have an idle worker look for jobs now instead of at its next poll."""
+        self._wake_event.set()
+
+    def stats(self) -> dict:
+        # The counters are updated by every worker thread.
+        with self._state_lock:
+            return {
+                "processed": self.processed,
+                "retried": self.retried,
+                "failed_jobs": self.failed,
+            }
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception:
+                logger.exception("job worker failed to claim jobs")
+                claimed = 0
+            if not claimed:
+                self._wake_event.wait(self.poll_seconds)
+                self._wake_event.clear()
+
+    def run_once(self) -> int:
+        """Claim and run one batch of due jobs, returning how many were claimed."""
+        engine = self.engine or get_engine()
+        with engine.begin() as connection:
+            jobs = connection.execute(
+                text(
+                    """
+                    UPDATE city_job
+                    SET locked_until = now() + make_interval(secs => :lease_seconds),
+                        attempts = attempts + 1
+                    WHERE job_id IN (
+                        SELECT job_id FROM city_job
+                        WHERE status = 'pending'
+                          AND run_at <= now()
+                          AND (locked_until IS NULL OR locked_until < now())
+                        ORDER BY run_at
+                        LIMIT :limit
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING job_id, kind, city_uuid, version, attempts
+                    """
+                ),
+                {"lease_seconds": self.lease_seconds, "limit": self.batch_size},
+            ).fetchall()
+
+        by_kind = defaultdict(list)
+        for job in jobs:
+            by_kind[job.kind].append(job)
+        for kind, kind_jobs in by_kind.items():
+            self._run_jobs(engine, kind, kind_jobs)
+
+        return len(jobs)
+
+    def _run_jobs(self, engine: Engine, kind: str, jobs: list) -> None:
+        try:
+            with engine.begin() as connection:
+                JOB_HANDLERS[kind](connection, [str(job.city_uuid) for job in jobs])
+                _lock_jobs(connection, jobs)
+                # A job enqueued again meanwhile has a newer version and stays
+                # queued, its lease released so it runs again right away.
+                done = connection.execute(
+                    text(
+                        """
+                        DELETE FROM city_job j
+                        USING (SELECT unnest(CAST(:job_ids AS bigint[])) AS job_id,
+                                      unnest(CAST(:versions AS bigint[])) AS version) c
+                        WHERE j.job_id = c.job_id AND j.version = c.version
+                        RETURNING j.job_id
+                        """
+                    ),
+                    {
+                        "job_ids": [job.job_id for job in jobs],
+                        "versions": [job.version for job in jobs],
+                    },
+                ).fetchall()
+                connection.execute(
+                    text(
+                        """
+                        UPDATE city_job SET locked_until = NULL
+                        WHERE job_id IN :job_ids
+                        """
+                    ),
+                    {"job_ids": tuple(job.job_id for job in jobs)},
+                )
+            with self._state_lock:
+                self.processed += len(done)
+        except Exception as e:
+            logger.exception("%s jobs failed for %s cities", kind, len(jobs))
+            self._retry_later(engine, jobs, str(e))
+
+    def _retry_later(self, engine: Engine, jobs: list, error: str) -> None:
+        params = [
+            {
+                "job_id": job.job_id,
+                "status": "failed" if job.attempts >= self.max_attempts else "pending",
+                "delay": min(2**job.attempts, MAX_RETRY_DELAY_SECONDS),
+                "error": error,
+            }
+            for job in jobs
+        ]
+        with engine.begin() as connection:
+            _lock_jobs(connection, jobs)
+            connection.execute(
+                text(
+                    """
+                    UPDATE city_job
+                    SET status = :status,
+                        run_at = now() + make_interval(secs => :delay),
+                        locked_until = NULL,
+                        last_error = :error
+                    WHERE job_id = :job_id
+                    """
+                ),
+                params,
+            )
+        failed = sum(1 for param in params if param["status"] == "failed")
+        with self._state_lock:
+            self.failed += failed
+            self.retried += len(params) - failed
+
+
+job_pool = JobWorkerPool(
+    workers=settings.JOB_WORKERS,
+    batch_size=settings.JOB_BATCH_SIZE,
+    poll_seconds=settings.JOB_POLL_SECONDS,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+)
+
+
+if __name__ == "__main__":
+    # Run workers on their own, next to API processes started with JOB_WORKERS=0.
+    from app.cities.events import CityChangeListener
+
+    listener = CityChangeListener(get_engine())
+    listener.start()
+    job_pool.workers = max(job_pool.workers, 1)
+    job_pool.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        job_pool.stop()
+        listener.stop(timeout=5)
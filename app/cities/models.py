@@ -1,13 +1,61 @@
 import uuid
 from enum import Enum as PyEnum
 
-from sqlalchemy import Column, Enum, ForeignKey, Index, Integer, Numeric, String
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    CheckConstraint,
+    Column,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    UniqueConstraint,
+    event,
+    func,
+    text,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import UserDefinedType
 
+from app.config import settings
 from app.database import Base
 
 
+def _partitioned_by_city_uuid() -> tuple:
+    """Table arguments that hash partition a table by city_uuid, when configured."""
+    if settings.CITY_TABLE_PARTITIONS > 0:
+        return ({"postgresql_partition_by": "HASH (city_uuid)"},)
+    return ()
+
+
+def _create_hash_partitions(table, connection, **kw) -> None:
+    """Create the CITY_TABLE_PARTITIONS partitions of a table partitioned by hash."""
+    partitions = settings.CITY_TABLE_PARTITIONS
+    for remainder in range(partitions):
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {table.name}_p{remainder} "
+                f"PARTITION OF {table.name} "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+            )
+        )
+
+
+class XID8(UserDefinedType):
+    """Postgres full transaction id (xid8)."""
+
+    cache_ok = True
+
+    def get_col_spec(self, **kw) -> str:
+        return "xid8"
+
+
 class BeautyChoice(str, PyEnum):
     """Enum for city beauty choices."""
 
@@ -30,6 +78,26 @@ class City(Base):
 
     allied_cities = relationship("AlliedCity", back_populates="city")
 
+    # Trigram index serves fuzzy matching and long prefixes, the pattern index
+    # serves short prefixes that are below the trigram length.
+    __table_args__ = (
+        Index(
+            "idx_city_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index("idx_city_name_prefix", text("lower(name) text_pattern_ops")),
+        *_partitioned_by_city_uuid(),
+    )
+
+
+# Lets a fresh city table be created with its trigram index; existing databases
+# get the extension and the name indexes from migration 4.
+event.listen(
+    City.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+
 
 class AlliedCity(Base):
     """Allied city model."""
@@ -43,8 +111,145 @@ class AlliedCity(Base):
 
     city = relationship("City", back_populates="allied_cities")
 
-    # Explicit Index on city_uuid to improve join performance
+    # Explicit Index on city_uuid to improve join performance. Partitioned tables
+    # go without it: each partition's primary key already leads with city_uuid.
     __table_args__ = (
-        Index("idx_alliedcity_city_uuid", "city_uuid"),
+        *(
+            ()
+            if settings.CITY_TABLE_PARTITIONS > 0
+            else (Index("idx_alliedcity_city_uuid", "city_uuid"),)
+        ),
         Index("idx_alliedcity_ally_uuid", "ally_uuid"),
+        *_partitioned_by_city_uuid(),
+    )
+
+
+class Alliance(Base):
+    """Alliance stored once, as an ordered pair with the lower city UUID first.
+
+    Used with ALLIANCE_STORAGE=canonical, where allied_city is a view listing
+    every alliance in both directions.
+    """
+
+    __tablename__ = "alliance"
+
+    city_uuid = Column(
+        UUID(as_uuid=True), ForeignKey("city.city_uuid"), primary_key=True
+    )
+    ally_uuid = Column(
+        UUID(as_uuid=True), ForeignKey("city.city_uuid"), primary_key=True
+    )
+
+    # The ally index includes city_uuid so the view's reverse direction is read
+    # from the index alone, in (ally_uuid, city_uuid) order.
+    __table_args__ = (
+        CheckConstraint("city_uuid <= ally_uuid", name="ck_alliance_ordered"),
+        Index("idx_alliance_ally_uuid", "ally_uuid", "city_uuid"),
+        *_partitioned_by_city_uuid(),
+    )
+
+
+ALLIED_CITY_VIEW = DDL(
+    """
+    CREATE OR REPLACE VIEW allied_city AS
+    SELECT city_uuid, ally_uuid FROM alliance
+    UNION ALL
+    SELECT ally_uuid, city_uuid FROM alliance WHERE ally_uuid <> city_uuid
+    """
+)
+
+# The table alliances are written to; reads always go through allied_city.
+if settings.ALLIANCE_STORAGE == "canonical":
+    Base.metadata.remove(AlliedCity.__table__)
+    event.listen(Alliance.__table__, "after_create", ALLIED_CITY_VIEW)
+    event.listen(
+        Alliance.__table__, "before_drop", DDL("DROP VIEW IF EXISTS allied_city")
+    )
+    ALLIANCE_TABLE = Alliance.__table__
+else:
+    Base.metadata.remove(Alliance.__table__)
+    ALLIANCE_TABLE = AlliedCity.__table__
+
+if settings.CITY_TABLE_PARTITIONS > 0:
+    event.listen(City.__table__, "after_create", _create_hash_partitions)
+    event.listen(ALLIANCE_TABLE, "after_create", _create_hash_partitions)
+
+
+class CityBeautyStats(Base):
+    """Running city count and population total per beauty choice."""
+
+    __tablename__ = "city_beauty_stats"
+
+    beauty = Column(Enum(BeautyChoice, name="beautychoice"), primary_key=True)
+    city_count = Column(BigInteger, nullable=False, default=0)
+    population_total = Column(BigInteger, nullable=False, default=0)
+
+
+class AllianceDegreeStats(Base):
+    """Running number of cities per alliance degree."""
+
+    __tablename__ = "alliance_degree_stats"
+
+    degree = Column(Integer, primary_key=True, autoincrement=False)
+    city_count = Column(BigInteger, nullable=False, default=0)
+
+
+class CityChangeLog(Base):
+    """Ordered log of city changes, used to catch up from an older snapshot."""
+
+    __tablename__ = "city_change_log"
+
+    seq = Column(BigInteger, primary_key=True)
+    city_uuid = Column(UUID(as_uuid=True), nullable=False)
+    kind = Column(String(32), nullable=False)
+    changed_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    # Writing transaction, so readers can tell which rows can no longer be
+    # preceded by a commit still in flight.
+    xid = Column(XID8(), nullable=False, server_default=text("pg_current_xact_id()"))
+
+    __table_args__ = (
+        Index("idx_city_change_log_changed_at", "changed_at"),
+        Index("idx_city_change_log_xid_seq", "xid", "seq"),
+    )
+
+
+class CityJob(Base):
+    """Queued recomputation of data derived from a city.
+
+    There is one row per kind and city; enqueueing it again bumps the version, so
+    a worker that computed from older data leaves the job queued.
+    """
+
+    __tablename__ = "city_job"
+
+    job_id = Column(BigInteger, primary_key=True)
+    kind = Column(String(32), nullable=False)
+    city_uuid = Column(UUID(as_uuid=True), nullable=False)
+    status = Column(String(16), nullable=False, server_default="pending")
+    version = Column(BigInteger, nullable=False, server_default="0")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    enqueued_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    run_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "city_uuid", name="uq_city_job_kind_city_uuid"),
+        Index("idx_city_job_status_run_at", "status", "run_at"),
+    )
+
+
+class CityAlliedPower(Base):
+    """Allied power of a city, kept up to date by the job workers."""
+
+    __tablename__ = "city_allied_power"
+
+    city_uuid = Column(UUID(as_uuid=True), primary_key=True)
+    allied_power = Column(BigInteger, nullable=False)
+    computed_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
     )
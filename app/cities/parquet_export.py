@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.cities.events import (
+    ChangeLogPosition,
+    fetch_changed_city_uuids,
+    read_change_log_position,
+)
+from app.cities.exceptions import ChangeLogTruncatedException
+from app.config import settings
+from app.database import get_engine
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+MANIFEST_FILE = "_exports.json"
+PARTITION_KEY = "export_seq"
+
+CITY_SCHEMA = pa.schema(
+    [
+        pa.field("city_uuid", pa.string(), nullable=False),
+        pa.field("name", pa.string()),
+        pa.field("beauty", pa.string()),
+        pa.field("population", pa.int32()),
+        pa.field("geo_location_latitude", pa.decimal128(9, 6)),
+        pa.field("geo_location_longitude", pa.decimal128(9, 6)),
+        pa.field("deleted", pa.bool_(), nullable=False),
+    ]
+)
+
+ALLIANCE_SCHEMA = pa.schema(
+    [
+        pa.field("city_uuid", pa.string(), nullable=False),
+        pa.field("ally_uuid", pa.string(), nullable=False),
+    ]
+)
+
+# Incremental runs select the changed cities in batches of this many UUIDs.
+CHANGED_UUID_BATCH = 10000
+
+
+class PartWriter:
+    """Writes record batches into numbered Parquet files of bounded size.
+
+    Every chunk becomes a row group, so readers get min/max statistics per
+    chunk and can skip row groups by UUID range.
+    """
+
+    def __init__(self, directory: str, schema: pa.Schema, rows_per_file: int):
+        self.directory = directory
+        self.schema = schema
+        self.rows_per_file = rows_per_file
+        self.files: List[str] = []
+        self.rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._file_rows = 0
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        if batch.num_rows == 0:
+            return
+        if self._writer is None or self._file_rows >= self.rows_per_file:
+            self._open_next_file()
+        self._writer.write_batch(batch)
+        self._file_rows += batch.num_rows
+        self.rows += batch.num_rows
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _open_next_file(self) -> None:
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"part-{len(self.files):05d}.parquet")
+        self._writer = pq.ParquetWriter(
+            path, self.schema, compression="zstd", write_statistics=True
+        )
+        self.files.append(path)
+        self._file_rows = 0
+
+
+def _city_batch(rows: Sequence[Any]) -> pa.RecordBatch:
+    return pa.record_batch(
+        [
+            pa.array([str(row.city_uuid) for row in rows], pa.string()),
+            pa.array([row.name for row in rows], pa.string()),
+            pa.array([row.beauty for row in rows], pa.string()),
+            pa.array([row.population for row in rows], pa.int32()),
+            pa.array([row.geo_location_latitude for row in rows], pa.decimal128(9, 6)),
+            pa.array([row.geo_location_longitude for row in rows], pa.decimal128(9, 6)),
+            pa.array([False] * len(rows), pa.bool_()),
+        ],
+        schema=CITY_SCHEMA,
+    )
+
+
+def _deleted_city_batch(city_uuids: Sequence[str]) -> pa.RecordBatch:
+    columns = [pa.array(city_uuids, pa.string())]
+    columns += [
+        pa.nulls(len(city_uuids), field.type) for field in list(CITY_SCHEMA)[1:-1]
+    ]
+    columns.append(pa.array([True] * len(city_uuids), pa.bool_()))
+    return pa.record_batch(columns, schema=CITY_SCHEMA)
+
+
+def _alliance_batch(rows: Sequence[Any]) -> pa.RecordBatch:
+    return pa.record_batch(
+        [
+            pa.array([str(row.city_uuid) for row in rows], pa.string()),
+            pa.array([str(row.ally_uuid) for row in rows], pa.string()),
+        ],
+        schema=ALLIANCE_SCHEMA,
+    )
+
+
+def _stream(
+    connection: Connection, sql: str, chunk_size: int, params: Optional[dict] = None
+) -> Iterator[Sequence[Any]]:
+    """Yield the rows of a query in chunks from a server side cursor."""
+    result = connection.execution_options(
+        stream_results=True, yield_per=chunk_size
+    ).execute(text(sql), params or {})
+    for rows in result.partitions():
+        yield rows
+
+
+CITY_COLUMNS = """
+    city_uuid, name, beauty, population, geo_location_latitude, geo_location_longitude
+"""
+
+
+def _export_all(
+    connection: Connection, cities: PartWriter, alliances: PartWriter, chunk_size: int
+) -> None:
+    for rows in _stream(
+        connection,
+        f"SELECT {CITY_COLUMNS} FROM city ORDER BY city_uuid",
+        chunk_size,
+    ):
+        cities.write(_city_batch(rows))
+
+    for rows in _stream(
+        connection,
+        "SELECT city_uuid, ally_uuid FROM allied_city ORDER BY city_uuid, ally_uuid",
+        chunk_size,
+    ):
+        alliances.write(_alliance_batch(rows))
+
+
+def _export_changed(
+    connection: Connection,
+    changed_uuids: List[str],
+    cities: PartWriter,
+    alliances: PartWriter,
+    chunk_size: int,
+) -> None:
+    """Export the current rows of changed cities, and tombstones for deleted ones.
+
+    A changed city's alliances are exported in full, so consumers replace the
+    alliances of every city listed in the run.
+    """
+    changed_uuids = sorted(changed_uuids)
+    for start in range(0, len(changed_uuids), CHANGED_UUID_BATCH):
+        batch_uuids = tuple(changed_uuids[start : start + CHANGED_UUID_BATCH])
+        params = {"city_uuids": batch_uuids}
+
+        found = set()
+        for rows in _stream(
+            connection,
+            f"""
+            SELECT {CITY_COLUMNS} FROM city
+            WHERE city_uuid IN :city_uuids
+            ORDER BY city_uuid
+            """,
+            chunk_size,
+            params,
+        ):
+            found.update(str(row.city_uuid) for row in rows)
+            cities.write(_city_batch(rows))
+        cities.write(
+            _deleted_city_batch(
+                [city_uuid for city_uuid in batch_uuids if city_uuid not in found]
+            )
+        )
+
+        for rows in _stream(
+            connection,
+            """
+            SELECT city_uuid, ally_uuid FROM allied_city
+            WHERE city_uuid IN :city_uuids
+            ORDER BY city_uuid, ally_uuid
+            """,
+            chunk_size,
+            params,
+        ):
+            alliances.write(_alliance_batch(rows))
+
+
+def read_manifest(output_dir: str) -> List[Dict[str, Any]]:
+    """Return the runs recorded in an export directory, oldest first."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as manifest_file:
+        return json.load(manifest_file)["exports"]
+
+
+def _write_manifest(output_dir: str, exports: List[Dict[str, Any]]) -> None:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w") as manifest_file:
+        json.dump({"exports": exports}, manifest_file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _remove_unlisted_partitions(output_dir: str, exports: List[Dict[str, Any]]) -> None:
+    """Delete the partitions of runs no longer in the manifest."""
+    listed = {f"{PARTITION_KEY}={entry['export_seq']:012d}" for entry in exports}
+    for dataset in ("city", "allied_city"):
+        dataset_dir = os.path.join(output_dir, dataset)
+        if not os.path.isdir(dataset_dir):
+            continue
+        for name in os.listdir(dataset_dir):
+            if name.startswith(f"{PARTITION_KEY}=") and name not in listed:
+                shutil.rmtree(os.path.join(dataset_dir, name), ignore_errors=True)
+
+
+def export_parquet(
+    output_dir: str,
+    full: bool = False,
+    chunk_size: int = settings.EXPORT_CHUNK_SIZE,
+    rows_per_file: int = settings.PARQUET_ROWS_PER_FILE,
+) -> Optional[Dict[str, Any]]:
+    """Export the city tables to Parquet and return the run's manifest entry.
+
+    The first run, or one with ``full``, exports everything. Later runs export
+    only the cities changed since the previous run, or everything again when
+    the change log no longer reaches back to it. Each run is a Hive style
+    ``export_seq=<change_seq>`` partition of the ``city`` and ``allied_city``
+    datasets (one past the previous run's when the position has not moved);
+    a full run removes the partitions of the runs before it. Returns None when
+    nothing changed.
+    """
+    exports = read_manifest(output_dir)
+    previous = exports[-1] if exports and not full else None
+
+    with get_engine().connect() as connection:
+        connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        with connection.begin():
+            position = read_change_log_position(connection)
+            changed_uuids = None
+            export_seq = position.change_seq
+            if previous is not None:
+                # Even with no newer sequence number, a change that took its number
+                # before the previous run may have committed after it.
+                try:
+                    changed_uuids = fetch_changed_city_uuids(
+                        connection,
+                        ChangeLogPosition(previous["change_seq"], previous["taken_at"]),
+                    )
+                except ChangeLogTruncatedException as e:
+                    logger.warning("parquet export: %s, exporting everything", e)
+                if changed_uuids == []:
+                    logger.info("parquet export: no changes since %s", position)
+                    return None
+                # Runs re-exporting changes at the same position still get
+                # their own, later partition.
+                export_seq = max(export_seq, previous["export_seq"] + 1)
+
+            partition = f"{PARTITION_KEY}={export_seq:012d}"
+            staging = os.path.join(output_dir, f".staging-{partition}")
+            shutil.rmtree(staging, ignore_errors=True)
+            cities = PartWriter(
+                os.path.join(staging, "city"), CITY_SCHEMA, rows_per_file
+            )
+            alliances = PartWriter(
+                os.path.join(staging, "allied_city"), ALLIANCE_SCHEMA, rows_per_file
+            )
+            try:
+                if changed_uuids is None:
+                    _export_all(connection, cities, alliances, chunk_size)
+                else:
+                    _export_changed(
+                        connection, changed_uuids, cities, alliances, chunk_size
+                    )
+            finally:
+                cities.close()
+                alliances.close()
+
+    for dataset in ("city", "allied_city"):
+        source = os.path.join(staging, dataset)
+        if os.path.isdir(source):
+            target = os.path.join(output_dir, dataset, partition)
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+    shutil.rmtree(staging, ignore_errors=True)
+
+    entry = {
+        "export_seq": export_seq,
+        "kind": "full" if changed_uuids is None else "incremental",
+        "change_seq": position.change_seq,
+        "taken_at": position.taken_at,
+        "cities": cities.rows,
+        "alliances": alliances.rows,
+    }
+    if changed_uuids is None:
+        exports = []
+    exports.append(entry)
+    _write_manifest(output_dir, exports)
+    # A full run replaces the earlier ones, which would otherwise be read along
+    # with it as part of the same datasets.
+    _remove_unlisted_partitions(output_dir, exports)
+    return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the city tables to partitioned Parquet files."
+    )
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "--full", action="store_true", help="export everything, not just changes"
+    )
+    arguments = parser.parse_args()
+
+    exported = export_parquet(arguments.output_dir, full=arguments.full)
+    if exported is not None:
+        logger.info("parquet export written to %s: %s", arguments.output_dir, exported)
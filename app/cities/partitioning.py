@@ -0,0 +1,132 @@
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.cities.models import ALLIANCE_TABLE, City
+from app.config import settings
+from app.database import get_engine
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+# Parents first, so the city table is copied before the alliances referencing it.
+PARTITIONED_TABLES = (City.__table__, ALLIANCE_TABLE)
+
+# Suffix of the old layout's relations while the tables are copied.
+OLD_SUFFIX = "_unpartitioned"
+
+
+def read_city_partitions(connection: Connection) -> int:
+    """Return the number of partitions of the city table, 0 when it is a plain table."""
+    return connection.execute(
+        text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'city'::regclass")
+    ).scalar()
+
+
+def _set_aside(
+    connection: Connection, table_name: str, suffix: str = OLD_SUFFIX
+) -> None:
+    """Rename a table, its partitions and all their indexes out of the way."""
+    relations = connection.execute(
+        text(
+            """
+            SELECT tc.relname AS table_name, ic.relname AS index_name
+            FROM (
+                -- pg_partition_tree has no rows for a plain table.
+                SELECT CAST(:table_name AS regclass) AS relid
+                UNION
+                SELECT relid FROM pg_partition_tree(CAST(:table_name AS regclass))
+            ) t
+            JOIN pg_class tc ON tc.oid = t.relid
+            LEFT JOIN pg_index i ON i.indrelid = t.relid
+            LEFT JOIN pg_class ic ON ic.oid = i.indexrelid
+            """
+        ),
+        {"table_name": table_name},
+    ).fetchall()
+
+    for index_name in {row.index_name for row in relations if row.index_name}:
+        connection.execute(
+            text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}{suffix}"')
+        )
+    for name in {row.table_name for row in relations}:
+        connection.execute(text(f'ALTER TABLE "{name}" RENAME TO "{name}{suffix}"'))
+
+
+def partition_city_tables(engine: Engine) -> int:
+    """Rebuild city and the alliance table in the CITY_TABLE_PARTITIONS layout.
+
+    Runs in one transaction holding an exclusive lock on both tables: requests
+    wait for the copy, and a failed copy leaves the old layout as it was.
+    With ALLIANCE_STORAGE=canonical the allied_city view follows the alliance
+    table. Returns the number of partitions the tables ended up with.
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"LOCK TABLE city, {ALLIANCE_TABLE.name} IN ACCESS EXCLUSIVE MODE")
+        )
+        if read_city_partitions(connection) == settings.CITY_TABLE_PARTITIONS:
+            logger.info("city tables already have the configured layout")
+            return settings.CITY_TABLE_PARTITIONS
+
+        # The old alliance table's foreign keys would pin the old city table.
+        for (constraint,) in connection.execute(
+            text(
+                """
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = CAST(:table_name AS regclass) AND contype = 'f'
+                """
+            ),
+            {"table_name": ALLIANCE_TABLE.name},
+        ).fetchall():
+            connection.execute(
+                text(
+                    f'ALTER TABLE {ALLIANCE_TABLE.name} DROP CONSTRAINT "{constraint}"'
+                )
+            )
+        if ALLIANCE_TABLE.name != "allied_city":
+            # Recreated over the new table with it.
+            connection.execute(text("DROP VIEW allied_city"))
+        for table in PARTITIONED_TABLES:
+            _set_aside(connection, table.name)
+
+        for table in PARTITIONED_TABLES:
+            started = time.perf_counter()
+            table.create(bind=connection, checkfirst=True)
+            columns = ", ".join(column.name for column in table.columns)
+            rows = connection.execute(
+                text(
+                    f"INSERT INTO {table.name} ({columns}) "
+                    f"SELECT {columns} FROM {table.name}{OLD_SUFFIX}"
+                )
+            ).rowcount
+            logger.info(
+                "copied %s rows into %s in %.1fs",
+                rows,
+                table.name,
+                time.perf_counter() - started,
+            )
+
+        for table in reversed(PARTITIONED_TABLES):
+            connection.execute(text(f"DROP TABLE {table.name}{OLD_SUFFIX}"))
+        partitions = read_city_partitions(connection)
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for table in PARTITIONED_TABLES:
+            connection.execute(text(f"ANALYZE {table.name}"))
+
+    return partitions
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(
+        description="Convert the city and alliance tables to the layout set by "
+        "CITY_TABLE_PARTITIONS (hash partitions by city_uuid, 0 for plain tables)."
+    ).parse_args()
+
+    logger.info(
+        "city tables now have %s partitions", partition_city_tables(get_engine())
+    )
@@ -0,0 +1,260 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.database import get_engine
+from app.utils.common import calculate_allied_power
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+# (latitude, longitude, population)
+Ally = Tuple[float, float, int]
+# (city_uuid, latitude, longitude, population, allies)
+PartitionCity = Tuple[str, float, float, int, List[Ally]]
+
+
+class RecomputeProgress(NamedTuple):
+    """How far a full recompute has come."""
+
+    cities_done: int
+    cities_total: int
+    elapsed_seconds: float
+
+    @property
+    def cities_per_second(self) -> float:
+        return self.cities_done / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def compute_partition(cities: Sequence[PartitionCity]) -> List[Tuple[str, int]]:
+    """Return (city_uuid, allied power) for each city of a partition.
+
+    Runs in the worker processes, so it only takes and returns plain values.
+    """
+    return [
+        (
+            city_uuid,
+            population + calculate_allied_power((latitude, longitude), allies),
+        )
+        for city_uuid, latitude, longitude, population, allies in cities
+    ]
+
+
+def map_partitions(
+    partitions: Iterable[Sequence[PartitionCity]], workers: int
+) -> Iterator[List[Tuple[str, int]]]:
+    """Compute partitions across worker processes, yielding results in order.
+
+    At most two partitions per worker are in flight, so memory stays bounded
+    however many partitions are read.
+    """
+    if workers <= 1:
+        for partition in partitions:
+            yield compute_partition(partition)
+        return
+
+    # Spawned rather than forked: the parent runs the log writer thread.
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        in_flight: Deque[Future] = deque()
+        for partition in partitions:
+            in_flight.append(executor.submit(compute_partition, partition))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+class ReadPartition(NamedTuple):
+    """A partition of cities and the time it was read at."""
+
+    taken_at: float
+    cities: List[PartitionCity]
+
+
+def _read_partitions(engine: Engine, partition_size: int) -> Iterator[ReadPartition]:
+    """Read the cities by UUID, a partition per short transaction.
+
+    Each partition is read after the last UUID of the one before, with its
+    allies from one range query in the same snapshot. No transaction stays open
+    while the partitions are computed, so the run does not hold back vacuum.
+    """
+    condition, params = "", {"partition_size": partition_size}
+    while True:
+        with engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="REPEATABLE READ")
+            with connection.begin():
+                taken_at = connection.execute(
+                    text("SELECT extract(epoch FROM now())")
+                ).scalar()
+                rows = connection.execute(
+                    text(
+                        f"""
+                        SELECT city_uuid, geo_location_latitude,
+                               geo_location_longitude, population
+                        FROM city
+                        {condition}
+                        ORDER BY city_uuid
+                        LIMIT :partition_size
+                        """
+                    ),
+                    params,
+                ).fetchall()
+                if not rows:
+                    return
+
+                allies = {}
+                for ally in connection.execute(
+                    text(
+                        """
+                        SELECT ac.city_uuid, c.geo_location_latitude,
+                               c.geo_location_longitude, c.population
+                        FROM allied_city ac
+                        JOIN city c ON c.city_uuid = ac.ally_uuid
+                        WHERE ac.city_uuid BETWEEN :first AND :last
+                        """
+                    ),
+                    {"first": rows[0].city_uuid, "last": rows[-1].city_uuid},
+                ):
+                    allies.setdefault(ally.city_uuid, []).append(
+                        (
+                            float(ally.geo_location_latitude),
+                            float(ally.geo_location_longitude),
+                            ally.population,
+                        )
+                    )
+
+        condition = "WHERE city_uuid > :after"
+        params["after"] = rows[-1].city_uuid
+        yield ReadPartition(
+            float(taken_at),
+            [
+                (
+                    str(row.city_uuid),
+                    float(row.geo_location_latitude),
+                    float(row.geo_location_longitude),
+                    row.population,
+                    allies.get(row.city_uuid, []),
+                )
+                for row in rows
+            ],
+        )
+
+
+def _store_powers(
+    engine: Engine, powers: List[Tuple[str, int]], taken_at: float
+) -> None:
+    """Upsert a partition's results, keeping values computed after it was read."""
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                """
+                INSERT INTO city_allied_power (city_uuid, allied_power, computed_at)
+                VALUES (:city_uuid, :allied_power, to_timestamp(:taken_at))
+                ON CONFLICT (city_uuid) DO UPDATE SET
+                    allied_power = EXCLUDED.allied_power,
+                    computed_at = EXCLUDED.computed_at
+                WHERE city_allied_power.computed_at < EXCLUDED.computed_at
+                """
+            ),
+            [
+                {"city_uuid": city_uuid, "allied_power": power, "taken_at": taken_at}
+                for city_uuid, power in powers
+            ],
+        )
+
+
+def _log_progress(progress: RecomputeProgress) -> None:
+    logger.info(
+        "allied power recompute: %s/%s cities, %.0f cities/s",
+        progress.cities_done,
+        progress.cities_total,
+        progress.cities_per_second,
+    )
+
+
+def recompute_all_allied_power(
+    workers: Optional[int] = None,
+    partition_size: int = 5000,
+    progress: Callable[[RecomputeProgress], None] = _log_progress,
+    engine: Optional[Engine] = None,
+) -> RecomputeProgress:
+    """Recompute and store the allied power of every city.
+
+    Each partition's results are stored as of the time it was read: values the
+    job workers stored after that are left alone, and cities changed after it
+    are left to the jobs their change queued.
+    """
+    engine = engine or get_engine()
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    done = 0
+
+    with engine.connect() as connection:
+        total, taken_at = connection.execute(
+            text("SELECT count(*), extract(epoch FROM now()) FROM city")
+        ).one()
+
+    # Results come back in partition order, so the read times are matched up
+    # first in, first out.
+    read_times: Deque[float] = deque()
+
+    def read_cities() -> Iterator[List[PartitionCity]]:
+        for partition in _read_partitions(engine, partition_size):
+            read_times.append(partition.taken_at)
+            yield partition.cities
+
+    for powers in map_partitions(read_cities(), workers):
+        taken_at = read_times.popleft()
+        _store_powers(engine, powers, taken_at)
+        done += len(powers)
+        progress(RecomputeProgress(done, total, time.perf_counter() - started))
+
+    # Powers stored for cities deleted before the last partition was read.
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                """
+                DELETE FROM city_allied_power p
+                WHERE computed_at <= to_timestamp(:taken_at)
+                  AND NOT EXISTS (SELECT 1 FROM city c WHERE c.city_uuid = p.city_uuid)
+                """
+            ),
+            {"taken_at": float(taken_at)},
+        )
+
+    return RecomputeProgress(done, total, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the allied power of every city."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="processes, default one per core"
+    )
+    parser.add_argument("--partition-size", type=int, default=5000)
+    arguments = parser.parse_args()
+
+    finished = recompute_all_allied_power(
+        workers=arguments.workers, partition_size=arguments.partition_size
+    )
+    _log_progress(finished)
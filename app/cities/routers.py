@@ -1,20 +1,75 @@
+from typing import Literal, Optional, Union
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
-from app.cities.exceptions import CityNotFoundException, InvalidAllyException
-from app.cities.schemas import CityCreate, CityInDB, CityInDBWithAllyForce, CityUpdate
+from app.admin.dependencies import require_admin
+from app.cities import feed, formats
+from app.cities.batching import CoalescerStoppedException, create_coalescer
+from app.cities.exceptions import (
+    ChangeLogTruncatedException,
+    CityNotFoundException,
+    InvalidAllyException,
+    InvalidFieldsException,
+    TooManyCitiesException,
+)
+from app.cities.schemas import (
+    CITY_FIELDS,
+    EXPORT_FIELDS,
+    CityBulkDelete,
+    CityBulkResult,
+    CityBulkUpdate,
+    CityChangeFeed,
+    CityCreate,
+    CityInDB,
+    CityInDBWithAllyForce,
+    CitySearchResult,
+    CityStatistics,
+    CityStatsReconciliation,
+    CityUpdate,
+    city_fields_list_adapter,
+    city_fields_model,
+    parse_fields,
+)
 from app.cities.services import CityService
-from app.database import get_session
+from app.config import settings
+from app.database import connect_for_read, get_read_session, get_session
+from app.utils.profiling import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
+
+CITY_LIST_ADAPTER = TypeAdapter(list[CityInDB])
+CITY_WITH_POWER_LIST_ADAPTER = TypeAdapter(list[CityInDBWithAllyForce])
+
+
+def _not_acceptable(offered) -> HTTPException:
+    return HTTPException(
+        status_code=406, detail=f"Supported media types: {', '.join(offered)}"
+    )
+
+
+def _parse_fields(fields: Optional[str], allowed=CITY_FIELDS):
+    try:
+        return parse_fields(fields, allowed)
+    except InvalidFieldsException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
 
 @router.post("/cities/", response_model=CityInDB, status_code=201)
 def create_new_city(city: CityCreate, db: Session = Depends(get_session)):
     """Create a new city."""
     try:
+        if create_coalescer.running:
+            try:
+                return create_coalescer.create(city)
+            except CoalescerStoppedException:
+                # Stopped before creating it; create it here instead.
+                pass
+
         city_service = CityService(db)
         db_city = city_service.create_city(city)
         return db_city
@@ -24,33 +79,257 @@ def create_new_city(city: CityCreate, db: Session = Depends(get_session)):
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@router.get("/cities/", response_model=list[CityInDB], status_code=200)
-def list_cities(skip: int = 0, limit: int = 100, db: Session = Depends(get_session)):
-    """Get all cities."""
+@router.get(
+    "/cities/",
+    response_model=list[Union[CityInDBWithAllyForce, CityInDB]],
+    status_code=200,
+    responses={
+        200: {
+            "content": {
+                formats.MSGPACK: {},
+                formats.ARROW: {},
+            }
+        }
+    },
+)
+def list_cities(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    include: Optional[Literal["allied_power"]] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_session),
+):
+    """Get all cities as JSON, MessagePack or an Arrow IPC stream, per Accept.
+
+    With ``include=allied_power`` each city carries its allied power, computed
+    for the whole page at once. ``fields`` picks a comma separated subset of
+    the city fields, and only the columns behind them are read.
+    """
+    selected = _parse_fields(fields)
+    if selected is not None and include == "allied_power":
+        selected = parse_fields(",".join((*selected, "allied_power")))
+    media_type = formats.negotiate_media_type(
+        request.headers.get("accept"), formats.LIST_MEDIA_TYPES
+    )
+    if media_type is None:
+        raise _not_acceptable(formats.LIST_MEDIA_TYPES)
+    encoding = formats.negotiate_encoding(request.headers.get("accept-encoding"))
+
     try:
         city_service = CityService(db)
-        return city_service.get_cities(skip=skip, limit=limit)
+        if selected is not None:
+            cities = city_service.get_city_fields_page(selected, skip=skip, limit=limit)
+            adapter = city_fields_list_adapter(selected)
+            if media_type == formats.JSON:
+                cities = adapter.validate_python(cities)
+        elif include == "allied_power":
+            cities = city_service.get_cities_with_allied_power(skip=skip, limit=limit)
+            selected, adapter = CITY_FIELDS, CITY_WITH_POWER_LIST_ADAPTER
+        else:
+            if media_type == formats.JSON:
+                cities = city_service.get_cities(skip=skip, limit=limit)
+            else:
+                cities = city_service.get_city_rows(skip=skip, limit=limit)
+            selected, adapter = EXPORT_FIELDS, CITY_LIST_ADAPTER
+
+        if media_type == formats.JSON:
+            body = adapter.dump_json(cities)
+        else:
+            body = formats.encode_cities(cities, media_type, selected)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding and len(body) >= settings.RESPONSE_COMPRESSION_MIN_BYTES:
+        body = formats.compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@router.get(
+    "/cities/export",
+    status_code=200,
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                formats.NDJSON: {},
+                formats.MSGPACK: {},
+                formats.ARROW: {},
+            }
+        }
+    },
+)
+def export_cities(request: Request, fields: Optional[str] = None):
+    """Stream every city as NDJSON, MessagePack or an Arrow IPC stream, per Accept.
+
+    ``fields`` picks a comma separated subset of the city fields to export.
+    """
+    selected = _parse_fields(fields, EXPORT_FIELDS) or EXPORT_FIELDS
+    media_type = formats.negotiate_media_type(
+        request.headers.get("accept"), formats.EXPORT_MEDIA_TYPES
+    )
+    if media_type is None:
+        raise _not_acceptable(formats.EXPORT_MEDIA_TYPES)
+    encoding = formats.negotiate_encoding(request.headers.get("accept-encoding"))
+
+    def city_chunks():
+        # The response outlives the request's dependencies, so the export opens
+        # its own connection while the body is being sent.
+        connection = connect_for_read(request)
+        db = Session(bind=connection, autoflush=False)
+        try:
+            yield from CityService(db).iter_city_chunks(
+                settings.EXPORT_CHUNK_SIZE, selected
+            )
+        finally:
+            db.close()
+            connection.close()
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        formats.stream_cities(city_chunks(), media_type, encoding, selected),
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+@router.get(
+    "/cities/changes",
+    response_model=CityChangeFeed,
+    status_code=200,
+    responses={200: {"content": {formats.EVENT_STREAM: {}}}},
+)
+async def city_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(settings.CHANGE_FEED_BATCH_SIZE, ge=1, le=10000),
+    wait: float = Query(0, ge=0, le=settings.CHANGE_FEED_MAX_WAIT_SECONDS),
+):
+    """Follow city changes from the change log, after sequence number ``since``.
+
+    Without ``since`` the feed starts at the current end of the log. A ``since``
+    whose entries have been pruned answers 410: resync from the export. With
+    ``Accept: text/event-stream`` changes are pushed as server-sent events and
+    a reconnect resumes from ``Last-Event-ID``; otherwise the response is one
+    JSON page, long-polled for up to ``wait`` seconds when there is nothing new.
+    """
+    media_type = formats.negotiate_media_type(
+        request.headers.get("accept"), formats.CHANGE_FEED_MEDIA_TYPES
+    )
+    if media_type is None:
+        raise _not_acceptable(formats.CHANGE_FEED_MEDIA_TYPES)
 
-@router.get("/cities/{city_id}", response_model=CityInDBWithAllyForce, status_code=200)
-def read_city(city_id: UUID, db: Session = Depends(get_session)):
-    """Read a city."""
+    try:
+        if media_type == formats.JSON:
+            return await feed.poll_changes(request, since, limit, wait)
+
+        last_event_id = request.headers.get("last-event-id", "")
+        if last_event_id.isdigit():
+            since = int(last_event_id)
+        if since is not None:
+            await run_in_threadpool(feed.check_since, request, since)
+    except ChangeLogTruncatedException as e:
+        raise HTTPException(status_code=410, detail=f"{e}; resync required") from e
+
+    return StreamingResponse(
+        feed.stream_changes(request, since, limit),
+        media_type=formats.EVENT_STREAM,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/cities/search", response_model=list[CitySearchResult], status_code=200)
+def search_cities(
+    q: str = Query(..., min_length=1, max_length=64),
+    limit: int = Query(10, ge=1, le=100),
+    rank_by: Literal["relevance", "population"] = "relevance",
+    db: Session = Depends(get_read_session),
+):
+    """Search cities by name prefix or fuzzy match."""
     try:
         city_service = CityService(db)
-        city = city_service.get_city(city_uuid=city_id)
-        calculate_allied_force = (
-            city_service.calculate_allied_force(
-                geo_location_latitude=city.geo_location_latitude,
-                geo_location_longitude=city.geo_location_longitude,
-                allied_cities=city.allied_cities,
-            )
-            + city.population
+        return city_service.search_cities(query=q, limit=limit, rank_by=rank_by)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.get("/cities/stats", response_model=CityStatistics, status_code=200)
+def read_city_stats(db: Session = Depends(get_read_session)):
+    """Get aggregate city statistics."""
+    try:
+        city_service = CityService(db)
+        return city_service.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post(
+    "/cities/stats/reconcile",
+    response_model=CityStatsReconciliation,
+    status_code=200,
+    dependencies=[Depends(require_admin)],
+)
+def reconcile_city_stats(repair: bool = False, db: Session = Depends(get_session)):
+    """Check the statistics counters against the city tables (admin token required).
+
+    The check scans the city tables, and a repair holds the counters locked
+    while it does, stalling every write.
+    """
+    try:
+        city_service = CityService(db)
+        return city_service.reconcile_stats(repair=repair)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post("/cities/bulk-delete", response_model=CityBulkResult, status_code=200)
+def bulk_delete_cities(request: CityBulkDelete, db: Session = Depends(get_session)):
+    """Delete many cities selected by UUID or by filter."""
+    try:
+        city_service = CityService(db)
+        return city_service.delete_cities(
+            city_uuids=request.city_uuids, city_filter=request.filter
         )
-        return CityInDBWithAllyForce(
-            **city.model_dump(), allied_power=calculate_allied_force
+    except TooManyCitiesException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.patch("/cities/bulk", response_model=CityBulkResult, status_code=200)
+def bulk_update_cities(request: CityBulkUpdate, db: Session = Depends(get_session)):
+    """Update many cities selected by UUID or by filter."""
+    try:
+        city_service = CityService(db)
+        return city_service.update_cities(
+            request.changes, city_uuids=request.city_uuids, city_filter=request.filter
         )
+    except TooManyCitiesException as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.get("/cities/{city_id}", response_model=CityInDBWithAllyForce, status_code=200)
+def read_city(
+    city_id: UUID,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_session),
+):
+    """Read a city, or with ``fields`` just a comma separated subset of its fields."""
+    selected = _parse_fields(fields)
+    try:
+        city_service = CityService(db)
+        if selected is None:
+            return city_service.get_city_with_allied_power(city_uuid=city_id)
+
+        model = city_fields_model(selected)
+        city = model.model_validate(city_service.get_city_fields(city_id, selected))
+        return Response(content=city.model_dump_json(), media_type=formats.JSON)
 
     except CityNotFoundException as e:
         raise HTTPException(status_code=404, detail=str(e)) from e
@@ -1,9 +1,21 @@
+import functools
+from datetime import datetime
 from decimal import Decimal
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Type
 from uuid import UUID
 
-from pydantic import BaseModel, field_validator
+from pydantic import (
+    BaseModel,
+    Field,
+    TypeAdapter,
+    create_model,
+    field_validator,
+    model_validator,
+)
+
+from app.cities.events import CityChangeKind
+from app.cities.exceptions import InvalidFieldsException
 
 
 class BeautyChoice(str, Enum):
@@ -80,3 +92,169 @@ class CityInDBWithAllyForce(CityInDB):
     """Model for returning city data with allied power."""
 
     allied_power: int
+
+
+# Fields a client can pick with ``fields=``, in response order.
+CITY_FIELDS: Tuple[str, ...] = ("city_uuid", *CityBase.model_fields, "allied_power")
+EXPORT_FIELDS: Tuple[str, ...] = CITY_FIELDS[:-1]
+
+
+def parse_fields(
+    fields: Optional[str], allowed: Tuple[str, ...] = CITY_FIELDS
+) -> Optional[Tuple[str, ...]]:
+    """Parse a comma separated ``fields=`` value, None meaning every field.
+
+    The result follows the order of ``allowed``, so equal field sets share one
+    response model.
+    """
+    if fields is None:
+        return None
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if not requested or unknown:
+        raise InvalidFieldsException(
+            f"Unknown fields: {', '.join(sorted(unknown))}. "
+            f"Choose from: {', '.join(allowed)}."
+            if unknown
+            else f"No fields given. Choose from: {', '.join(allowed)}."
+        )
+    return tuple(field for field in allowed if field in requested)
+
+
+@functools.lru_cache(maxsize=256)
+def city_fields_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Return the response model with just these fields, built once per field set."""
+    model_fields = CityInDBWithAllyForce.model_fields
+    return create_model(
+        "City_" + "_".join(fields),
+        **{
+            field: (model_fields[field].annotation, model_fields[field])
+            for field in fields
+        },
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def city_fields_list_adapter(fields: Tuple[str, ...]) -> TypeAdapter:
+    """Return a cached adapter for a list of city_fields_model(fields)."""
+    return TypeAdapter(List[city_fields_model(fields)])
+
+
+class CityChangeEvent(BaseModel):
+    """Model for returning a city change log entry."""
+
+    seq: int
+    city_uuid: UUID
+    kind: CityChangeKind
+    changed_at: datetime
+
+
+class CityChangeFeed(BaseModel):
+    """Model for returning city changes after a sequence number."""
+
+    changes: List[CityChangeEvent]
+    last_seq: int
+
+
+class CitySearchResult(BaseModel):
+    """Model for returning a city matched by a name search."""
+
+    city_uuid: UUID
+    name: str
+    beauty: Optional[BeautyChoice] = None
+    population: int
+    score: float
+
+
+class CityStatistics(BaseModel):
+    """Model for returning aggregate city statistics."""
+
+    total_cities: int
+    total_population: int
+    average_population: Optional[float] = None
+    cities_by_beauty: Dict[BeautyChoice, int]
+    alliance_degree_distribution: Dict[int, int]
+
+
+class CityStatsReconciliation(BaseModel):
+    """Model for returning the result of checking counters against the city tables."""
+
+    consistent: bool
+    repaired: bool
+    counters: CityStatistics
+    ground_truth: CityStatistics
+
+
+# Upper bound on the UUIDs accepted by one bulk request.
+BULK_MAX_CITIES = 10000
+
+
+class CityFilter(BaseModel):
+    """Model for selecting cities by their attributes."""
+
+    beauty: Optional[BeautyChoice] = None
+    min_population: Optional[int] = None
+    max_population: Optional[int] = None
+    name_prefix: Optional[str] = Field(None, min_length=1, max_length=64)
+
+    @model_validator(mode="after")
+    def has_condition(self) -> "CityFilter":
+        """Ensure a filter cannot select every city by accident."""
+        if all(value is None for value in self.model_dump().values()):
+            raise ValueError("City filter needs at least one condition.")
+        return self
+
+
+class CityBulkSelection(BaseModel):
+    """Base model for bulk requests, which select cities by UUID or by filter."""
+
+    city_uuids: Optional[List[UUID]] = Field(None, max_length=BULK_MAX_CITIES)
+    filter: Optional[CityFilter] = None
+
+    @model_validator(mode="after")
+    def has_one_selection(self) -> "CityBulkSelection":
+        """Ensure exactly one of city_uuids and filter is given."""
+        if (self.city_uuids is None) == (self.filter is None):
+            raise ValueError("Provide either city_uuids or filter.")
+        return self
+
+
+class CityBulkDelete(CityBulkSelection):
+    """Model for deleting many cities."""
+
+    pass
+
+
+class CityBulkChanges(BaseModel):
+    """Model for the fields set on every city of a bulk update."""
+
+    beauty: Optional[BeautyChoice] = None
+    population: Optional[int] = None
+
+    @field_validator("population")
+    def population_non_negative(cls, value: int) -> int:
+        """Ensure population is a non-negative integer."""
+        if value is not None and value < 0:
+            raise ValueError("Population cannot be a negative value.")
+        return value
+
+    @model_validator(mode="after")
+    def has_change(self) -> "CityBulkChanges":
+        """Ensure the update sets at least one field."""
+        if self.beauty is None and self.population is None:
+            raise ValueError("Bulk update needs at least one field to set.")
+        return self
+
+
+class CityBulkUpdate(CityBulkSelection):
+    """Model for updating many cities."""
+
+    changes: CityBulkChanges
+
+
+class CityBulkResult(BaseModel):
+    """Model for returning the outcome of a bulk request."""
+
+    affected: int
+    not_found: List[UUID] = []
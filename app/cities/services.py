@@ -1,18 +1,171 @@
-from typing import List, Optional, Sequence
-from uuid import UUID
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from uuid import UUID, uuid4
 
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 from sqlalchemy.engine.row import Row
 from sqlalchemy.orm import Session
 
+from app.cities.cache import city_cache
+from app.cities.events import (
+    CityChange,
+    CityChangeKind,
+    dispatch,
+    publish_city_changes,
+)
 from app.cities.exceptions import (
     CityNotFoundException,
     DatabaseOperationException,
     InvalidAllyException,
+    TooManyCitiesException,
+)
+from app.cities.jobs import enqueue_city_jobs
+from app.cities.models import ALLIANCE_TABLE, City
+from app.cities.schemas import (
+    BULK_MAX_CITIES,
+    EXPORT_FIELDS,
+    BeautyChoice,
+    CityBulkChanges,
+    CityBulkResult,
+    CityCreate,
+    CityFilter,
+    CityInDB,
+    CityInDBWithAllyForce,
+    CitySearchResult,
+    CityStatistics,
+    CityStatsReconciliation,
+    CityUpdate,
+)
+from app.cities.statements import (
+    CITY_BY_UUID,
+    DELETE_CITY_ALLIANCES,
+    INSERT_ALLIANCE,
+    INSERT_CITY,
+    LIST_CITIES,
+    SEARCH_CITIES,
+    SELECT_BEAUTY_STATS,
+    SELECT_DEGREE_STATS,
+    SELECT_STORED_ALLIED_POWER,
+    UPDATE_CITY,
+    UPSERT_BEAUTY_STATS,
+    UPSERT_DEGREE_STATS,
 )
-from app.cities.models import City
-from app.cities.schemas import CityCreate, CityInDB, CityUpdate
-from app.utils.common import calculate_distance
+from app.config import settings
+from app.database import reads_primary
+from app.utils.common import calculate_allied_power, calculate_allied_powers
+from app.utils.logger import logger_config
+from app.utils.statements import statement_registry
+
+logger = logger_config(__name__)
+
+# Columns allied power is computed from.
+ALLIED_POWER_COLUMNS = (
+    "population",
+    "geo_location_latitude",
+    "geo_location_longitude",
+    "allied_cities",
+)
+
+# Set at startup when city reads are served from the in-memory snapshot.
+snapshot_store = None
+
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so user input is matched literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _alliance_rows(city_uuid: Any, ally_uuids: Iterable[Any]) -> List[Dict[str, str]]:
+    """Rows storing a city's alliances: one per direction, or with
+    ALLIANCE_STORAGE=canonical one ordered pair each, lower UUID first."""
+    if settings.ALLIANCE_STORAGE == "canonical":
+        pairs = {
+            tuple(sorted((UUID(str(city_uuid)), UUID(str(ally)))))
+            for ally in ally_uuids
+        }
+        return [{"city_uuid": str(low), "ally_uuid": str(high)} for low, high in pairs]
+
+    rows = [
+        {"city_uuid": str(city_uuid), "ally_uuid": str(ally)} for ally in ally_uuids
+    ]
+    rows += [
+        {"city_uuid": str(ally), "ally_uuid": str(city_uuid)} for ally in ally_uuids
+    ]
+    return rows
+
+
+def _multi_row_values(rows: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """Render rows as one multi-row VALUES list with numbered parameters."""
+    groups, params = [], {}
+    for index, row in enumerate(rows):
+        groups.append("(" + ", ".join(f":{column}_{index}" for column in row) + ")")
+        params.update({f"{column}_{index}": value for column, value in row.items()})
+    return ", ".join(groups), params
+
+
+def fetch_ground_truth_stats(
+    db: Union[Session, Connection]
+) -> Tuple[Sequence[Row], Sequence[Row]]:
+    """Compute the statistics with full scans of the city tables."""
+    beauty_rows = db.execute(
+        text(
+            """
+            SELECT
+                beauty,
+                count(*) AS city_count,
+                COALESCE(sum(population), 0)::bigint AS population_total
+            FROM city
+            WHERE beauty IS NOT NULL
+            GROUP BY beauty
+            """
+        )
+    ).fetchall()
+    degree_rows = db.execute(
+        text(
+            """
+            SELECT degree, count(*) AS city_count
+            FROM (
+                SELECT count(ac.ally_uuid) AS degree
+                FROM city c
+                LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid
+                GROUP BY c.city_uuid
+            ) degrees
+            GROUP BY degree
+            """
+        )
+    ).fetchall()
+    return beauty_rows, degree_rows
+
+
+def rewrite_stats(
+    db: Union[Session, Connection],
+    beauty_rows: Sequence[Row],
+    degree_rows: Sequence[Row],
+) -> None:
+    """Replace the counters with the given ground truth rows."""
+    db.execute(text("DELETE FROM city_beauty_stats;"))
+    db.execute(text("DELETE FROM alliance_degree_stats;"))
+
+    if beauty_rows:
+        db.execute(
+            text(
+                """
+                INSERT INTO city_beauty_stats (beauty, city_count, population_total)
+                VALUES (:beauty, :city_count, :population_total);
+                """
+            ),
+            [row._asdict() for row in beauty_rows],
+        )
+    if degree_rows:
+        db.execute(
+            text(
+                """
+                INSERT INTO alliance_degree_stats (degree, city_count)
+                VALUES (:degree, :city_count);
+                """
+            ),
+            [row._asdict() for row in degree_rows],
+        )
 
 
 class CityService:
@@ -21,20 +174,47 @@ class CityService:
     def __init__(self, db: Session):
         self.db = db
 
+    def _publish_changes(self, changes: List[CityChange]) -> None:
+        """Record changes and queue the recomputations they call for."""
+        publish_city_changes(self.db, changes)
+        if settings.JOB_QUEUE_ENABLED:
+            enqueue_city_jobs(self.db, changes)
+
     def create_city(self, city_data: CityCreate) -> CityInDB:
         """Create a new city with optional allied cities, ensuring atomicity."""
         try:
             with self.db.begin():
                 city_uuid = self._insert_city(city_data)
+                ally_uuids = [str(uuid) for uuid in city_data.allied_cities or []]
+                degrees_before: Dict[str, int] = {}
+                degrees_after = {str(city_uuid): 0}
 
-                if city_data.allied_cities:
-                    ally_uuids = [str(uuid) for uuid in city_data.allied_cities]
+                if ally_uuids:
+                    # Locked so concurrent writes to their alliances cannot move
+                    # their degrees between the reads below.
+                    self._lock_selected_cities(ally_uuids, None)
                     self._validate_allied_cities(ally_uuids)
 
+                    degrees_before = self._fetch_alliance_degrees(ally_uuids)
                     self._insert_allied_cities(city_uuid, ally_uuids)
+                    degrees_after = self._fetch_alliance_degrees(
+                        [str(city_uuid), *ally_uuids]
+                    )
+
+                self._update_beauty_stats([(city_data.beauty, 1, city_data.population)])
+                self._update_degree_stats(degrees_before, degrees_after)
+
+                changes = [CityChange(str(city_uuid), CityChangeKind.created)]
+                changes += [
+                    CityChange(ally, CityChangeKind.alliances_changed)
+                    for ally in ally_uuids
+                ]
+                self._publish_changes(changes)
 
                 self.db.commit()
 
+            dispatch(changes)
+
             return CityInDB(
                 city_uuid=city_uuid,
                 name=city_data.name,
@@ -52,20 +232,160 @@ class CityService:
             self.db.rollback()
             raise DatabaseOperationException(f"Unexpected Error: {e}") from e
 
-    def _insert_city(self, city_data: CityCreate) -> str:
-        """Insert the city into the database and return the generated UUID."""
+    def create_cities(
+        self, cities: List[CityCreate]
+    ) -> List[Union[CityInDB, Exception]]:
+        """Create many cities in one transaction, returning a result or error per city.
+
+        Allies are validated for all cities with one query; a city with unknown
+        allies gets an InvalidAllyException and the others are still created.
+        If the shared transaction fails, each city is retried on its own so one
+        bad request cannot fail the rest.
+        """
+        results: List[Union[CityInDB, Exception, None]] = [None] * len(cities)
+        try:
+            with self.db.begin():
+                ally_uuids_by_city = [
+                    list(dict.fromkeys(str(ally) for ally in city.allied_cities or []))
+                    for city in cities
+                ]
+                existing_allies = self._fetch_existing_city_uuids(
+                    {ally for ally_uuids in ally_uuids_by_city for ally in ally_uuids}
+                )
+                valid = []
+                for index, (city_data, ally_uuids) in enumerate(
+                    zip(cities, ally_uuids_by_city)
+                ):
+                    missing_allies = set(ally_uuids) - existing_allies
+                    if missing_allies:
+                        results[index] = InvalidAllyException(
+                            [UUID(ally) for ally in sorted(missing_allies)]
+                        )
+                    else:
+                        valid.append((index, city_data, ally_uuids))
+
+                if valid:
+                    changes = self._insert_city_batch(valid, results)
+                    self._publish_changes(changes)
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(
+                "batched create of %s cities failed, creating them one by one: %s",
+                len(cities),
+                e,
+            )
+            for index, city_data in enumerate(cities):
+                if isinstance(results[index], InvalidAllyException):
+                    continue
+                try:
+                    results[index] = self.create_city(city_data)
+                except Exception as error:
+                    results[index] = error
+            return results
+
+        if valid:
+            dispatch(changes)
+        return results
+
+    def _fetch_existing_city_uuids(self, city_uuids: Iterable[str]) -> set:
+        """Return which of the given city UUIDs exist."""
+        city_uuids = tuple(city_uuids)
+        if not city_uuids:
+            return set()
+
         result = self.db.execute(
+            text("SELECT city_uuid FROM city WHERE city_uuid IN :city_uuids"),
+            {"city_uuids": city_uuids},
+        )
+        return {str(row.city_uuid) for row in result.fetchall()}
+
+    def _insert_city_batch(
+        self,
+        cities: List[Tuple[int, CityCreate, List[str]]],
+        results: List[Union[CityInDB, Exception]],
+    ) -> List[CityChange]:
+        """Insert validated cities and their alliances with one statement per table."""
+        city_uuids = [str(uuid4()) for _ in cities]
+        all_allies = sorted(
+            {ally for _, _, ally_uuids in cities for ally in ally_uuids}
+        )
+        self._lock_selected_cities(all_allies, None)
+        degrees_before = self._fetch_alliance_degrees(all_allies)
+
+        values, params = _multi_row_values(
+            [
+                {
+                    "city_uuid": city_uuid,
+                    "name": city_data.name,
+                    "beauty": city_data.beauty,
+                    "population": city_data.population,
+                    "geo_location_latitude": city_data.geo_location_latitude,
+                    "geo_location_longitude": city_data.geo_location_longitude,
+                }
+                for city_uuid, (_, city_data, _) in zip(city_uuids, cities)
+            ]
+        )
+        self.db.execute(
             text(
-                """
+                f"""
                 INSERT INTO city (
                     city_uuid, name, beauty, population, geo_location_latitude, geo_location_longitude
                 )
-                VALUES (
-                    gen_random_uuid(), :name, :beauty, :population, :geo_location_latitude, :geo_location_longitude
-                )
-                RETURNING city_uuid;
+                VALUES {values};
                 """
             ),
+            params,
+        )
+
+        alliances = [
+            row
+            for city_uuid, (_, _, ally_uuids) in zip(city_uuids, cities)
+            for row in _alliance_rows(city_uuid, ally_uuids)
+        ]
+        if alliances:
+            values, params = _multi_row_values(alliances)
+            self.db.execute(
+                text(
+                    f"""
+                    INSERT INTO {ALLIANCE_TABLE.name} (city_uuid, ally_uuid)
+                    VALUES {values}
+                    ON CONFLICT (city_uuid, ally_uuid) DO NOTHING;
+                    """
+                ),
+                params,
+            )
+
+        self._update_beauty_stats(
+            (city_data.beauty, 1, city_data.population) for _, city_data, _ in cities
+        )
+        self._update_degree_stats(
+            degrees_before, self._fetch_alliance_degrees([*city_uuids, *all_allies])
+        )
+
+        for city_uuid, (index, city_data, _) in zip(city_uuids, cities):
+            results[index] = CityInDB(
+                city_uuid=city_uuid,
+                name=city_data.name,
+                beauty=city_data.beauty,
+                population=city_data.population,
+                geo_location_latitude=city_data.geo_location_latitude,
+                geo_location_longitude=city_data.geo_location_longitude,
+                allied_cities=city_data.allied_cities or [],
+            )
+
+        changes = [
+            CityChange(city_uuid, CityChangeKind.created) for city_uuid in city_uuids
+        ]
+        changes += [
+            CityChange(ally, CityChangeKind.alliances_changed) for ally in all_allies
+        ]
+        return changes
+
+    def _insert_city(self, city_data: CityCreate) -> str:
+        """Insert the city into the database and return the generated UUID."""
+        result = statement_registry.execute(
+            self.db,
+            INSERT_CITY,
             {
                 "name": city_data.name,
                 "beauty": city_data.beauty,
@@ -101,22 +421,17 @@ class CityService:
 
     def _insert_allied_cities(self, city_uuid: str, ally_uuids: List[str]) -> None:
         """Bulk insert allied cities to optimize performance."""
-        values = [{"city_uuid": city_uuid, "ally_uuid": ally} for ally in ally_uuids]
-        values += [{"city_uuid": ally, "ally_uuid": city_uuid} for ally in ally_uuids]
-
-        self.db.execute(
-            text(
-                """
-                INSERT INTO allied_city (city_uuid, ally_uuid)
-                VALUES (:city_uuid, :ally_uuid)
-                ON CONFLICT (city_uuid, ally_uuid) DO NOTHING;
-                """
-            ),
-            values,
+        statement_registry.execute(
+            self.db,
+            INSERT_ALLIANCE,
+            _alliance_rows(city_uuid, ally_uuids),
         )
 
     def get_cities(self, skip: int = 0, limit: int = 100) -> List[CityInDB]:
         """Get cities with pagination."""
+        if snapshot_store is not None:
+            return snapshot_store.list_cities(skip, limit)
+
         rows = self._fetch_cities_data(skip, limit)
         return [
             CityInDB(
@@ -131,49 +446,224 @@ class CityService:
             for row in rows
         ]
 
-    def _fetch_cities_data(self, skip: int, limit: int) -> Sequence[Row]:
-        """Fetch raw city data from the database."""
-        sql = text(
-            """
-            SELECT
-                c.city_uuid,
-                c.name,
-                c.beauty,
-                c.population,
-                c.geo_location_latitude,
-                c.geo_location_longitude,
-                COALESCE(array_agg(ac.ally_uuid) FILTER (WHERE ac.ally_uuid IS NOT NULL), '{}') AS allied_cities
+    def get_cities_with_allied_power(
+        self, skip: int = 0, limit: int = 100
+    ) -> List[CityInDBWithAllyForce]:
+        """Get a page of cities with allied power, computed for the page at once."""
+        cities = self.get_cities(skip=skip, limit=limit)
+        return [
+            CityInDBWithAllyForce(**city.model_dump(), allied_power=allied_power)
+            for city, allied_power in zip(cities, self._page_allied_powers(cities))
+        ]
+
+    def get_city_fields_page(
+        self, fields: Tuple[str, ...], skip: int = 0, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Get a page of cities with just the given fields, reading only what they need."""
+        if snapshot_store is not None:
+            rows = snapshot_store.list_cities(skip, limit)
+        else:
+            rows = self.db.execute(
+                text(
+                    self._city_columns_sql(self._columns_for_fields(fields), page=True)
+                ),
+                {"skip": skip, "limit": limit},
+            ).fetchall()
+        return self._project_fields(rows, fields)
+
+    def get_city_fields(
+        self, city_uuid: UUID, fields: Tuple[str, ...]
+    ) -> Dict[str, Any]:
+        """Get one city with just the given fields."""
+        if snapshot_store is not None:
+            rows = [self.get_city(city_uuid)]
+        else:
+            rows = self.db.execute(
+                text(
+                    self._city_columns_sql(
+                        self._columns_for_fields(fields),
+                        where="WHERE c.city_uuid = :city_uuid",
+                    )
+                ),
+                {"city_uuid": city_uuid},
+            ).fetchall()
+            if not rows:
+                raise CityNotFoundException(city_uuid)
+        return self._project_fields(rows, fields)[0]
+
+    @staticmethod
+    def _columns_for_fields(fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        """City columns to read for the fields; allied power needs the allies."""
+        needed = set(fields)
+        if "allied_power" in needed:
+            needed.update(ALLIED_POWER_COLUMNS)
+        return tuple(column for column in EXPORT_FIELDS if column in needed)
+
+    @staticmethod
+    def _city_columns_sql(
+        columns: Tuple[str, ...],
+        where: str = "",
+        order_by: str = "c.name",
+        page: bool = False,
+    ) -> str:
+        """Select just these city columns, joining the alliances only when asked for."""
+        expressions = [f"c.{column}" for column in columns if column != "allied_cities"]
+        join = group_by = ""
+        if "allied_cities" in columns:
+            expressions.append(
+                "COALESCE(array_agg(ac.ally_uuid) FILTER (WHERE ac.ally_uuid IS NOT NULL), '{}') AS allied_cities"
+            )
+            join = "LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid"
+            group_by = "GROUP BY c.city_uuid"
+        return f"""
+            SELECT {", ".join(expressions)}
             FROM city c
-            LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid
-            GROUP BY c.city_uuid
-            ORDER BY c.name
-            LIMIT :limit OFFSET :skip
-            """
+            {join}
+            {where}
+            {group_by}
+            ORDER BY {order_by}
+            {"LIMIT :limit OFFSET :skip" if page else ""}
+        """
+
+    def _project_fields(
+        self, rows: Sequence[Any], fields: Tuple[str, ...]
+    ) -> List[Dict[str, Any]]:
+        """Keep the requested fields of each row, computing allied power if asked."""
+        allied_powers = (
+            self._page_allied_powers(rows) if "allied_power" in fields else None
         )
+        return [
+            {
+                field: (
+                    allied_powers[index]
+                    if field == "allied_power"
+                    else getattr(row, field)
+                )
+                for field in fields
+            }
+            for index, row in enumerate(rows)
+        ]
 
-        result = self.db.execute(sql, {"limit": limit, "skip": skip})
-        return result.fetchall()
+    def _page_allied_powers(self, cities: Sequence[Any]) -> List[int]:
+        """Allied power of each city, with one ally query and one distance batch."""
+        if snapshot_store is not None:
+            allies = [snapshot_store.get_allies(city) for city in cities]
+        else:
+            allies = self._fetch_page_allies(cities)
 
-    def _fetch_city_by_uuid(self, city_uuid: UUID) -> CityInDB:
-        """Fetch a city by its UUID from the database (raw row)."""
+        allied_forces = calculate_allied_powers(
+            [
+                ((city.geo_location_latitude, city.geo_location_longitude), city_allies)
+                for city, city_allies in zip(cities, allies)
+            ]
+        )
+        return [
+            allied_force + city.population
+            for city, allied_force in zip(cities, allied_forces)
+        ]
 
-        result = self.db.execute(
+    def _fetch_page_allies(
+        self, cities: Sequence[Any]
+    ) -> List[List[Tuple[Any, Any, int]]]:
+        """Fetch (latitude, longitude, population) of every page city's allies in one query."""
+        ally_uuids = tuple(
+            {str(ally) for city in cities for ally in city.allied_cities or []}
+        )
+        if not ally_uuids:
+            return [[] for _ in cities]
+
+        rows = self.db.execute(
             text(
                 """
-                SELECT
-                    c.city_uuid,
-                    c.name,
-                    c.beauty,
-                    c.population,
-                    c.geo_location_latitude,
-                    c.geo_location_longitude,
-                    COALESCE(array_agg(ac.ally_uuid) FILTER (WHERE ac.ally_uuid IS NOT NULL), '{}') AS allied_cities
-                FROM city c
-                LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid
-                WHERE c.city_uuid = :city_uuid
-                GROUP BY c.city_uuid
+                SELECT city_uuid, geo_location_latitude, geo_location_longitude, population
+                FROM city
+                WHERE city_uuid IN :city_uuids
                 """
             ),
+            {"city_uuids": ally_uuids},
+        )
+        coordinates = {
+            str(row.city_uuid): (
+                row.geo_location_latitude,
+                row.geo_location_longitude,
+                row.population,
+            )
+            for row in rows
+        }
+        return [
+            [
+                coordinates[str(ally)]
+                for ally in city.allied_cities or []
+                if str(ally) in coordinates
+            ]
+            for city in cities
+        ]
+
+    def get_city_rows(self, skip: int = 0, limit: int = 100) -> Sequence[Row]:
+        """Get a page of cities as rows, for encoders that do not need models."""
+        if snapshot_store is not None:
+            return snapshot_store.list_cities(skip, limit)
+
+        return self._fetch_cities_data(skip, limit)
+
+    def iter_city_chunks(
+        self, chunk_size: int, fields: Tuple[str, ...] = EXPORT_FIELDS
+    ) -> Iterator[Sequence[Row]]:
+        """Stream every city in UUID order, in chunks from a server side cursor.
+
+        Only the columns of ``fields`` are read, and the alliances only if listed.
+        """
+        result = self.db.execute(
+            text(self._city_columns_sql(fields, order_by="c.city_uuid")),
+            execution_options={"stream_results": True, "yield_per": chunk_size},
+        )
+        for rows in result.partitions():
+            yield rows
+
+    def _fetch_cities_data(self, skip: int, limit: int) -> Sequence[Row]:
+        """Fetch raw city data from the database."""
+        result = statement_registry.execute(
+            self.db, LIST_CITIES, {"limit": limit, "skip": skip}
+        )
+        return result.fetchall()
+
+    def search_cities(
+        self, query: str, limit: int = 10, rank_by: str = "relevance"
+    ) -> List[CitySearchResult]:
+        """Search cities by name prefix or trigram similarity."""
+        rows = self._fetch_search_matches(query, limit, rank_by)
+        return [
+            CitySearchResult(
+                city_uuid=row.city_uuid,
+                name=row.name,
+                beauty=row.beauty,
+                population=row.population,
+                score=row.score,
+            )
+            for row in rows
+        ]
+
+    def _fetch_search_matches(
+        self, query: str, limit: int, rank_by: str
+    ) -> Sequence[Row]:
+        """Fetch name matches using the prefix and trigram indexes on city.name."""
+        result = statement_registry.execute(
+            self.db,
+            SEARCH_CITIES[rank_by],
+            {
+                "query": query,
+                "prefix": f"{_escape_like(query.lower())}%",
+                "limit": limit,
+            },
+        )
+        return result.fetchall()
+
+    def _fetch_city_by_uuid(self, city_uuid: UUID) -> CityInDB:
+        """Fetch a city by its UUID from the database (raw row)."""
+
+        result = statement_registry.execute(
+            self.db,
+            CITY_BY_UUID,
             {"city_uuid": str(city_uuid)},
         )
         row = result.fetchone()
@@ -193,6 +683,11 @@ class CityService:
 
     def get_city(self, city_uuid: UUID) -> CityInDB:
         """Retrieve a city by its UUID, including its alliances."""
+        if snapshot_store is not None:
+            city = snapshot_store.get_city(city_uuid)
+            if city is None:
+                raise CityNotFoundException(city_uuid)
+            return city
 
         try:
             city = self._fetch_city_by_uuid(city_uuid)
@@ -202,18 +697,84 @@ class CityService:
         except Exception as e:
             raise DatabaseOperationException(f"Unexpected Error: {e}") from e
 
+    def get_city_with_allied_power(self, city_uuid: UUID) -> CityInDBWithAllyForce:
+        """Retrieve a city with its allied power, served from the city cache when possible."""
+        cached_city = city_cache.get(str(city_uuid))
+        if cached_city is not None:
+            return cached_city
+
+        generation = city_cache.generation()
+        city = self.get_city(city_uuid)
+        stored_power = None
+        if settings.JOB_QUEUE_ENABLED and snapshot_store is None:
+            stored_power = statement_registry.execute(
+                self.db, SELECT_STORED_ALLIED_POWER, {"city_uuid": city_uuid}
+            ).scalar()
+
+        if stored_power is not None:
+            allied_force = stored_power - city.population
+        elif snapshot_store is not None:
+            allied_force = calculate_allied_power(
+                (city.geo_location_latitude, city.geo_location_longitude),
+                snapshot_store.get_allies(city),
+            )
+        else:
+            allied_force = self.calculate_allied_force(
+                geo_location_latitude=city.geo_location_latitude,
+                geo_location_longitude=city.geo_location_longitude,
+                allied_cities=city.allied_cities,
+            )
+        allied_power = allied_force + city.population
+
+        city_with_power = CityInDBWithAllyForce(
+            **city.model_dump(), allied_power=allied_power
+        )
+        # A replica can still be behind a change whose eviction came before
+        # this read, and the stale row would outlive the replica's lag.
+        if reads_primary(self.db):
+            city_cache.put(city_with_power, generation)
+        return city_with_power
+
     def update_city(self, city_uuid: str, city_data: CityUpdate) -> CityInDB:
         """Update a city's details and fully replace its alliances within a transaction."""
         try:
             with self.db.begin():
-                existing_city = self._fetch_city_by_uuid(city_uuid)
+                existing_city = self._lock_city(
+                    city_uuid, city_data.allied_cities or None
+                )
 
                 updated_city = self._update_city_fields(
                     city_uuid, city_data, existing_city
                 )
+                self._update_beauty_stats(
+                    [
+                        (existing_city.beauty, -1, -existing_city.population),
+                        (updated_city.beauty, 1, updated_city.population),
+                    ]
+                )
+
+                changes = [CityChange(str(city_uuid), CityChangeKind.updated)]
 
                 if city_data.allied_cities:
+                    affected_uuids = {
+                        str(city_uuid),
+                        *(str(ally) for ally in existing_city.allied_cities or []),
+                        *(str(ally) for ally in city_data.allied_cities),
+                    }
+                    degrees_before = self._fetch_alliance_degrees(affected_uuids)
                     self._replace_city_alliances(city_uuid, city_data.allied_cities)
+                    self._update_degree_stats(
+                        degrees_before, self._fetch_alliance_degrees(affected_uuids)
+                    )
+
+                    changes += [
+                        CityChange(ally, CityChangeKind.alliances_changed)
+                        for ally in sorted(affected_uuids - {str(city_uuid)})
+                    ]
+
+                self._publish_changes(changes)
+
+            dispatch(changes)
 
             return CityInDB(
                 city_uuid=updated_city.city_uuid,
@@ -232,6 +793,29 @@ class CityService:
             self.db.rollback()
             raise DatabaseOperationException(f"Database error: {str(e)}") from e
 
+    def _lock_city(
+        self, city_uuid: str, ally_uuids: Optional[Iterable[Any]] = None
+    ) -> CityInDB:
+        """Lock a city and read it under the lock.
+
+        With ``ally_uuids`` its current allies and those given are locked too, so
+        concurrent writes cannot move their degrees. Every alliance write locks
+        both of its cities, so once the city is locked its allies cannot change;
+        allies added while waiting for the lock are locked in a further round.
+        """
+        locked: set = set()
+        while True:
+            city = self._fetch_city_by_uuid(city_uuid)
+            wanted = {str(city_uuid)}
+            if ally_uuids is not None:
+                wanted.update(str(ally) for ally in city.allied_cities or [])
+                wanted.update(str(ally) for ally in ally_uuids)
+            if wanted <= locked:
+                return city
+
+            self._lock_selected_cities(sorted(wanted - locked), None)
+            locked |= wanted
+
     def _update_city_fields(
         self, city_uuid: str, city_data: CityUpdate, existing_city: CityInDB
     ) -> Row:
@@ -263,20 +847,9 @@ class CityService:
             ),
         }
 
-        result = self.db.execute(
-            text(
-                """
-            UPDATE city
-            SET
-                name = :name,
-                beauty = :beauty,
-                population = :population,
-                geo_location_latitude = :geo_location_latitude,
-                geo_location_longitude = :geo_location_longitude
-            WHERE city_uuid = :city_uuid
-            RETURNING city_uuid, name, beauty, population, geo_location_latitude, geo_location_longitude;
-            """
-            ),
+        result = statement_registry.execute(
+            self.db,
+            UPDATE_CITY,
             {"city_uuid": city_uuid, **update_fields},
         )
 
@@ -297,41 +870,409 @@ class CityService:
 
     def _delete_alliances(self, city_uuid: str):
         """Delete alliances for a given city."""
-        self.db.execute(
-            text(
-                """
-                DELETE FROM allied_city
-                WHERE city_uuid = :city_id OR ally_uuid = :city_id;
-                """
-            ),
+        statement_registry.execute(
+            self.db,
+            DELETE_CITY_ALLIANCES,
             {"city_id": city_uuid},
         )
 
-    def delete_city(self, city_uuid: UUID) -> CityInDB:
+    def delete_city(self, city_uuid: UUID) -> None:
         """Delete a city and remove its alliances."""
+        result = self.delete_cities(city_uuids=[city_uuid])
+        if result.not_found:
+            raise CityNotFoundException(city_uuid)
 
+    def delete_cities(
+        self,
+        city_uuids: Optional[List[UUID]] = None,
+        city_filter: Optional[CityFilter] = None,
+    ) -> CityBulkResult:
+        """Delete the selected cities and every alliance they are part of."""
         try:
             with self.db.begin():
-                city = self._fetch_city_by_uuid(city_uuid)
-                self._delete_alliances(city_uuid)
-                self._delete_city_record(city_uuid)
+                cities = self._lock_selected_cities(city_uuids, city_filter)
+                target_uuids = tuple(str(city.city_uuid) for city in cities)
+                changes = []
 
-            return city
+                if target_uuids:
+                    # The targets are locked, so their allies cannot change.
+                    ally_uuids = self._fetch_ally_uuids(target_uuids) - set(
+                        target_uuids
+                    )
+                    self._lock_selected_cities(sorted(ally_uuids), None)
+                    degrees_before = self._fetch_alliance_degrees(
+                        [*target_uuids, *ally_uuids]
+                    )
 
+                    # Rows of allies naming a deleted city are found through
+                    # the allies' city_uuid, which hash partitioning can prune.
+                    # Ordered pairs have a deleted city or an ally on either side.
+                    self.db.execute(
+                        text(
+                            f"""
+                            DELETE FROM {ALLIANCE_TABLE.name}
+                            WHERE city_uuid IN :affected_uuids
+                              AND (city_uuid IN :city_uuids OR ally_uuid IN :city_uuids);
+                            """
+                        ),
+                        {
+                            "affected_uuids": (*target_uuids, *ally_uuids),
+                            "city_uuids": target_uuids,
+                        },
+                    )
+                    self.db.execute(
+                        text("DELETE FROM city WHERE city_uuid IN :city_uuids;"),
+                        {"city_uuids": target_uuids},
+                    )
+
+                    self._update_beauty_stats(
+                        (city.beauty, -1, -city.population) for city in cities
+                    )
+                    self._update_degree_stats(
+                        degrees_before, self._fetch_alliance_degrees(ally_uuids)
+                    )
+
+                    changes = [
+                        CityChange(city_uuid, CityChangeKind.deleted)
+                        for city_uuid in target_uuids
+                    ]
+                    changes += [
+                        CityChange(ally, CityChangeKind.alliances_changed)
+                        for ally in sorted(ally_uuids)
+                    ]
+                    self._publish_changes(changes)
+
+            dispatch(changes)
+
+            return CityBulkResult(
+                affected=len(target_uuids),
+                not_found=self._not_found(city_uuids, target_uuids),
+            )
+        except TooManyCitiesException:
+            self.db.rollback()
+            raise
         except Exception as e:
             self.db.rollback()
-            raise DatabaseOperationException(f"Failed to delete city: {str(e)}") from e
+            raise DatabaseOperationException(
+                f"Failed to delete cities: {str(e)}"
+            ) from e
 
-    def _delete_city_record(self, city_uuid: UUID) -> None:
-        """Execute SQL to delete a city from the database."""
-        self.db.execute(
+    def update_cities(
+        self,
+        city_changes: CityBulkChanges,
+        city_uuids: Optional[List[UUID]] = None,
+        city_filter: Optional[CityFilter] = None,
+    ) -> CityBulkResult:
+        """Set the same fields on every selected city in one statement."""
+        assignments = {
+            field: value
+            for field, value in city_changes.model_dump().items()
+            if value is not None
+        }
+
+        try:
+            with self.db.begin():
+                cities = self._lock_selected_cities(city_uuids, city_filter)
+                target_uuids = tuple(str(city.city_uuid) for city in cities)
+                changes = []
+
+                if target_uuids:
+                    set_clause = ", ".join(
+                        f"{field} = :{field}" for field in assignments
+                    )
+                    self.db.execute(
+                        text(
+                            f"""
+                            UPDATE city
+                            SET {set_clause}
+                            WHERE city_uuid IN :city_uuids;
+                            """
+                        ),
+                        {"city_uuids": target_uuids, **assignments},
+                    )
+
+                    beauty_changes = []
+                    for city in cities:
+                        beauty_changes.append((city.beauty, -1, -city.population))
+                        beauty_changes.append(
+                            (
+                                assignments.get("beauty", city.beauty),
+                                1,
+                                assignments.get("population", city.population),
+                            )
+                        )
+                    self._update_beauty_stats(beauty_changes)
+
+                    changes = [
+                        CityChange(city_uuid, CityChangeKind.updated)
+                        for city_uuid in target_uuids
+                    ]
+                    self._publish_changes(changes)
+
+            dispatch(changes)
+
+            return CityBulkResult(
+                affected=len(target_uuids),
+                not_found=self._not_found(city_uuids, target_uuids),
+            )
+        except TooManyCitiesException:
+            self.db.rollback()
+            raise
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseOperationException(
+                f"Failed to update cities: {str(e)}"
+            ) from e
+
+    def _lock_selected_cities(
+        self,
+        city_uuids: Optional[List[UUID]],
+        city_filter: Optional[CityFilter],
+    ) -> Sequence[Row]:
+        """Lock the cities selected by UUID or by filter, in a stable order.
+
+        Raises TooManyCitiesException when a filter matches more than
+        BULK_MAX_CITIES cities.
+        """
+        limit = ""
+        if city_filter is not None:
+            conditions, params = self._city_filter_conditions(city_filter)
+            # Filters are capped like city_uuids; one row past the cap tells
+            # an oversized selection apart without locking all of it.
+            limit = "LIMIT :max_cities"
+            params["max_cities"] = BULK_MAX_CITIES + 1
+        elif city_uuids:
+            conditions = ["city_uuid IN :city_uuids"]
+            params = {"city_uuids": tuple(str(city_uuid) for city_uuid in city_uuids)}
+        else:
+            return []
+
+        cities = self.db.execute(
+            text(
+                f"""
+                SELECT city_uuid, beauty, population
+                FROM city
+                WHERE {" AND ".join(conditions)}
+                ORDER BY city_uuid
+                {limit}
+                FOR UPDATE
+                """
+            ),
+            params,
+        ).fetchall()
+        # Only filters are capped here: city_uuids are capped by the request
+        # schema, and allies are locked through this method without a cap.
+        if city_filter is not None and len(cities) > BULK_MAX_CITIES:
+            raise TooManyCitiesException(BULK_MAX_CITIES)
+        return cities
+
+    @staticmethod
+    def _city_filter_conditions(
+        city_filter: CityFilter,
+    ) -> Tuple[List[str], Dict[str, object]]:
+        """Translate a city filter into SQL conditions and their parameters."""
+        conditions, params = [], {}
+        if city_filter.beauty is not None:
+            conditions.append("beauty = :beauty")
+            params["beauty"] = city_filter.beauty.value
+        if city_filter.min_population is not None:
+            conditions.append("population >= :min_population")
+            params["min_population"] = city_filter.min_population
+        if city_filter.max_population is not None:
+            conditions.append("population <= :max_population")
+            params["max_population"] = city_filter.max_population
+        if city_filter.name_prefix is not None:
+            conditions.append("lower(name) LIKE :name_prefix")
+            params["name_prefix"] = _escape_like(city_filter.name_prefix.lower()) + "%"
+        return conditions, params
+
+    def _fetch_ally_uuids(self, city_uuids: Tuple[str, ...]) -> set:
+        """Return the allies of the given cities; alliances are stored both ways."""
+        result = self.db.execute(
             text(
                 """
-                DELETE FROM city
-                WHERE city_uuid = :city_uuid;
+                SELECT DISTINCT ally_uuid
+                FROM allied_city
+                WHERE city_uuid IN :city_uuids
                 """
             ),
-            {"city_uuid": str(city_uuid)},
+            {"city_uuids": city_uuids},
+        )
+        return {str(row.ally_uuid) for row in result.fetchall()}
+
+    @staticmethod
+    def _not_found(
+        city_uuids: Optional[List[UUID]], found_uuids: Iterable[str]
+    ) -> List[UUID]:
+        """Return the requested UUIDs that matched no city, in request order."""
+        found = set(found_uuids)
+        return [
+            city_uuid
+            for city_uuid in dict.fromkeys(city_uuids or [])
+            if str(city_uuid) not in found
+        ]
+
+    def _fetch_alliance_degrees(self, city_uuids: Iterable[str]) -> Dict[str, int]:
+        """Return the alliance degree of each given city that currently exists."""
+        city_uuids = tuple(city_uuids)
+        if not city_uuids:
+            return {}
+
+        result = self.db.execute(
+            text(
+                """
+                SELECT c.city_uuid, count(ac.ally_uuid) AS degree
+                FROM city c
+                LEFT JOIN allied_city ac
+                    ON c.city_uuid = ac.city_uuid AND ac.city_uuid IN :city_uuids
+                WHERE c.city_uuid IN :city_uuids
+                GROUP BY c.city_uuid
+                """
+            ),
+            {"city_uuids": city_uuids},
+        )
+        return {str(row.city_uuid): row.degree for row in result.fetchall()}
+
+    def _update_beauty_stats(
+        self, changes: Iterable[Tuple[Optional[str], int, int]]
+    ) -> None:
+        """Apply (beauty, city count delta, population delta) changes to the counters."""
+        deltas: Dict[BeautyChoice, List[int]] = {}
+        for beauty, city_count, population in changes:
+            if beauty is None:
+                continue
+            delta = deltas.setdefault(BeautyChoice(beauty), [0, 0])
+            delta[0] += city_count
+            delta[1] += population
+
+        # Sorted keys keep the row lock order stable across concurrent writers.
+        values = [
+            {
+                "beauty": beauty.value,
+                "city_count": city_count,
+                "population_total": population,
+            }
+            for beauty, (city_count, population) in sorted(deltas.items())
+            if city_count or population
+        ]
+        if not values:
+            return
+
+        statement_registry.execute(
+            self.db,
+            UPSERT_BEAUTY_STATS,
+            values,
+        )
+
+    def _update_degree_stats(
+        self, degrees_before: Dict[str, int], degrees_after: Dict[str, int]
+    ) -> None:
+        """Move cities between degree buckets given their degrees before and after a write."""
+        deltas: Dict[int, int] = {}
+        for degree in degrees_before.values():
+            deltas[degree] = deltas.get(degree, 0) - 1
+        for degree in degrees_after.values():
+            deltas[degree] = deltas.get(degree, 0) + 1
+
+        values = [
+            {"degree": degree, "city_count": city_count}
+            for degree, city_count in sorted(deltas.items())
+            if city_count
+        ]
+        if not values:
+            return
+
+        statement_registry.execute(
+            self.db,
+            UPSERT_DEGREE_STATS,
+            values,
+        )
+
+    def get_stats(self) -> CityStatistics:
+        """Get aggregate city statistics from the maintained counters."""
+        try:
+            # Both counter tables from one snapshot, so a write committing in
+            # between is counted in both or in neither.
+            if not self.db.in_transaction():
+                self.db.connection(
+                    execution_options={"isolation_level": "REPEATABLE READ"}
+                )
+            beauty_rows = statement_registry.execute(
+                self.db, SELECT_BEAUTY_STATS
+            ).fetchall()
+            degree_rows = statement_registry.execute(
+                self.db, SELECT_DEGREE_STATS
+            ).fetchall()
+        except Exception as e:
+            raise DatabaseOperationException(f"Unexpected Error: {e}") from e
+
+        return self._build_statistics(beauty_rows, degree_rows)
+
+    def reconcile_stats(self, repair: bool = False) -> CityStatsReconciliation:
+        """Check the counters against the city tables and optionally rewrite them."""
+        try:
+            with self.db.begin():
+                # The counters and the ground truth are read from one snapshot, so
+                # a write committing during the check does not look like drift.
+                self.db.connection(
+                    execution_options={"isolation_level": "REPEATABLE READ"}
+                )
+                if repair:
+                    # Writers update counters inside their own transaction, so holding
+                    # this lock makes the scan and rewrite atomic with respect to them.
+                    # It is taken before the first read, which takes the snapshot.
+                    self.db.execute(
+                        text(
+                            """
+                            LOCK TABLE city_beauty_stats, alliance_degree_stats
+                            IN EXCLUSIVE MODE
+                            """
+                        )
+                    )
+
+                counters = self.get_stats()
+                beauty_rows, degree_rows = fetch_ground_truth_stats(self.db)
+                ground_truth = self._build_statistics(beauty_rows, degree_rows)
+                consistent = counters == ground_truth
+
+                if repair and not consistent:
+                    rewrite_stats(self.db, beauty_rows, degree_rows)
+
+            return CityStatsReconciliation(
+                consistent=consistent,
+                repaired=repair and not consistent,
+                counters=counters,
+                ground_truth=ground_truth,
+            )
+        except Exception as e:
+            self.db.rollback()
+            raise DatabaseOperationException(f"Unexpected Error: {e}") from e
+
+    @staticmethod
+    def _build_statistics(
+        beauty_rows: Sequence[Row], degree_rows: Sequence[Row]
+    ) -> CityStatistics:
+        """Build the statistics response from per-beauty and per-degree rows."""
+        cities_by_beauty = {beauty: 0 for beauty in BeautyChoice}
+        total_population = 0
+        for row in beauty_rows:
+            cities_by_beauty[BeautyChoice(row.beauty)] = row.city_count
+            total_population += row.population_total
+
+        total_cities = sum(cities_by_beauty.values())
+
+        return CityStatistics(
+            total_cities=total_cities,
+            total_population=total_population,
+            average_population=(
+                total_population / total_cities if total_cities else None
+            ),
+            cities_by_beauty=cities_by_beauty,
+            alliance_degree_distribution={
+                row.degree: row.city_count
+                for row in sorted(degree_rows, key=lambda row: row.degree)
+                if row.city_count
+            },
         )
 
     def calculate_allied_force(
@@ -356,17 +1297,14 @@ class CityService:
             .all()
         )
 
-        for ally in allies:
-            distance_in_km = calculate_distance(
-                (geo_location_latitude, geo_location_longitude),
-                (ally.geo_location_latitude, ally.geo_location_longitude),
-            )
-
-            if 1000 <= distance_in_km < 10000:
-                allied_force += int(ally.population / 2)
-            elif distance_in_km >= 10000:
-                allied_force += int(ally.population / 4)
-            else:
-                allied_force += ally.population
-
-        return allied_force
+        return calculate_allied_power(
+            (geo_location_latitude, geo_location_longitude),
+            (
+                (
+                    ally.geo_location_latitude,
+                    ally.geo_location_longitude,
+                    ally.population,
+                )
+                for ally in allies
+            ),
+        )
@@ -0,0 +1,643 @@
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.cities import services
+from app.cities.events import (
+    ChangeLogPosition,
+    CityChange,
+    fetch_changed_city_uuids,
+    read_change_log_position,
+    subscribe,
+)
+from app.cities.exceptions import (
+    ChangeLogTruncatedException,
+    InvalidSnapshotFileException,
+)
+from app.cities.schemas import BeautyChoice, CityInDB
+from app.config import settings
+from app.database import get_engine
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+BEAUTY_CODES = {beauty.value: code for code, beauty in enumerate(BeautyChoice)}
+BEAUTY_BY_CODE = list(BeautyChoice)
+NO_BEAUTY = -1
+COORDINATE_SCALE = 6
+LOAD_CHUNK_SIZE = 50000
+
+# Snapshot file layout: a header, one entry per column, then the column data,
+# each column aligned so it can be mapped as a NumPy array in place.
+SNAPSHOT_FILE_MAGIC = b"CITYSNAP"
+SNAPSHOT_FILE_VERSION = 1
+SNAPSHOT_FILE_HEADER = struct.Struct("<8sIIqd")
+SNAPSHOT_FILE_COLUMN = struct.Struct("<16s8sQQ")
+SNAPSHOT_FILE_ALIGNMENT = 64
+
+SNAPSHOT_COLUMNS = (
+    "uuids",
+    "name_order",
+    "name_offsets",
+    "name_bytes",
+    "population",
+    "latitude",
+    "longitude",
+    "beauty",
+    "ally_offsets",
+    "ally_rows",
+)
+
+
+def uuid_key(city_uuid) -> bytes:
+    """Return the 16 byte key of a UUID given as UUID or string."""
+    if not isinstance(city_uuid, UUID):
+        city_uuid = UUID(str(city_uuid))
+    return city_uuid.bytes
+
+
+def to_micro_degrees(value: Decimal) -> int:
+    """Store a NUMERIC(9, 6) coordinate exactly as an integer."""
+    return int(Decimal(value).scaleb(COORDINATE_SCALE))
+
+
+def from_micro_degrees(value: int) -> Decimal:
+    return Decimal(int(value)).scaleb(-COORDINATE_SCALE)
+
+
+class CityRow(NamedTuple):
+    """A city changed since the snapshot was built."""
+
+    city_uuid: UUID
+    name: str
+    beauty: Optional[str]
+    population: int
+    geo_location_latitude: Decimal
+    geo_location_longitude: Decimal
+    allied_cities: List[UUID]
+
+
+class CitySnapshot:
+    """Immutable columnar copy of the city and allied_city tables.
+
+    Rows are stored in UUID byte order so a UUID is found with a binary search;
+    ``name_order`` holds the row ids sorted by name (code point order). Names
+    live in one UTF-8 buffer addressed by offsets, coordinates as integer
+    micro-degrees, beauty as an enum code and alliances as CSR arrays of row ids.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        change_seq: int = 0,
+        taken_at: float = 0.0,
+    ):
+        for column in SNAPSHOT_COLUMNS:
+            setattr(self, column, columns[column])
+        self.change_seq = change_seq
+        self.taken_at = taken_at
+
+    def __len__(self) -> int:
+        return len(self.population)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in SNAPSHOT_COLUMNS)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {column: getattr(self, column) for column in SNAPSHOT_COLUMNS}
+
+    def find_row(self, city_uuid) -> Optional[int]:
+        """Return the row of a city, or None when it is not in the snapshot."""
+        key = np.array(uuid_key(city_uuid), dtype="S16")
+        row = int(np.searchsorted(self.uuids, key))
+        if row < len(self) and self.uuids[row] == key:
+            return row
+        return None
+
+    def uuid_at(self, row: int) -> UUID:
+        # Fixed width bytes drop trailing NULs on access.
+        return UUID(bytes=self.uuids[row].ljust(16, b"\0"))
+
+    def name_at(self, row: int) -> str:
+        start, end = self.name_offsets[row], self.name_offsets[row + 1]
+        return self.name_bytes[start:end].tobytes().decode()
+
+    def ally_rows_of(self, row: int) -> np.ndarray:
+        return self.ally_rows[self.ally_offsets[row] : self.ally_offsets[row + 1]]
+
+    def city_at(self, row: int) -> CityInDB:
+        beauty = int(self.beauty[row])
+        return CityInDB(
+            city_uuid=self.uuid_at(row),
+            name=self.name_at(row),
+            beauty=BEAUTY_BY_CODE[beauty] if beauty != NO_BEAUTY else None,
+            population=int(self.population[row]),
+            geo_location_latitude=from_micro_degrees(self.latitude[row]),
+            geo_location_longitude=from_micro_degrees(self.longitude[row]),
+            allied_cities=[self.uuid_at(ally) for ally in self.ally_rows_of(row)],
+        )
+
+    @classmethod
+    def load(cls, connection: Connection) -> "CitySnapshot":
+        """Build a snapshot by streaming the tables in bounded chunks.
+
+        The connection should be in a REPEATABLE READ transaction so the tables
+        and the change log position are read from the same database snapshot.
+        """
+        position = read_change_log_position(connection)
+
+        uuids, names, population, latitude, longitude, beauty = [], [], [], [], [], []
+        for rows in _stream(
+            connection,
+            """
+            SELECT city_uuid, name, beauty, population,
+                   geo_location_latitude, geo_location_longitude
+            FROM city
+            ORDER BY city_uuid
+            """,
+        ):
+            uuids.append(np.array([uuid_key(r.city_uuid) for r in rows], "S16"))
+            names.extend(r.name.encode() for r in rows)
+            population.append(np.array([r.population for r in rows], np.int32))
+            latitude.append(
+                np.array(
+                    [to_micro_degrees(r.geo_location_latitude) for r in rows], np.int32
+                )
+            )
+            longitude.append(
+                np.array(
+                    [to_micro_degrees(r.geo_location_longitude) for r in rows], np.int32
+                )
+            )
+            beauty.append(
+                np.array([BEAUTY_CODES.get(r.beauty, NO_BEAUTY) for r in rows], np.int8)
+            )
+
+        uuid_column = _concatenate(uuids, "S16")
+        name_lengths = np.fromiter((len(name) for name in names), np.int64, len(names))
+        name_offsets = np.zeros(len(names) + 1, np.int64)
+        np.cumsum(name_lengths, out=name_offsets[1:])
+
+        def rows_of(values: Iterable) -> np.ndarray:
+            keys = np.array([uuid_key(value) for value in values], "S16")
+            return np.searchsorted(uuid_column, keys).astype(np.int32)
+
+        name_order = [
+            rows_of(r.city_uuid for r in rows)
+            for rows in _stream(
+                connection,
+                'SELECT city_uuid FROM city ORDER BY name COLLATE "C", city_uuid',
+            )
+        ]
+
+        city_rows, ally_rows = [], []
+        for rows in _stream(
+            connection,
+            "SELECT city_uuid, ally_uuid FROM allied_city ORDER BY city_uuid, ally_uuid",
+        ):
+            city_rows.append(rows_of(r.city_uuid for r in rows))
+            ally_rows.append(rows_of(r.ally_uuid for r in rows))
+
+        degrees = np.bincount(
+            _concatenate(city_rows, np.int32), minlength=len(uuid_column)
+        )
+        ally_offsets = np.zeros(len(uuid_column) + 1, np.int64)
+        np.cumsum(degrees, out=ally_offsets[1:])
+
+        return cls(
+            {
+                "uuids": uuid_column,
+                "name_order": _concatenate(name_order, np.int32),
+                "name_offsets": name_offsets,
+                "name_bytes": np.frombuffer(b"".join(names), np.uint8),
+                "population": _concatenate(population, np.int32),
+                "latitude": _concatenate(latitude, np.int32),
+                "longitude": _concatenate(longitude, np.int32),
+                "beauty": _concatenate(beauty, np.int8),
+                "ally_offsets": ally_offsets,
+                "ally_rows": _concatenate(ally_rows, np.int32),
+            },
+            change_seq=position.change_seq,
+            taken_at=position.taken_at,
+        )
+
+
+def _stream(connection: Connection, sql: str):
+    """Yield the rows of a query in chunks from a server side cursor."""
+    result = connection.execution_options(
+        stream_results=True, yield_per=LOAD_CHUNK_SIZE
+    ).execute(text(sql))
+    for rows in result.partitions():
+        yield rows
+
+
+def _concatenate(chunks: List[np.ndarray], dtype) -> np.ndarray:
+    return np.concatenate(chunks) if chunks else np.array([], dtype)
+
+
+def write_snapshot_file(snapshot: CitySnapshot, path: str) -> None:
+    """Write a snapshot file, replacing any existing file atomically.
+
+    Processes that mapped the previous file keep reading it until they reload.
+    """
+    columns = snapshot.columns()
+    offset = SNAPSHOT_FILE_HEADER.size + SNAPSHOT_FILE_COLUMN.size * len(columns)
+    entries, layout = [], []
+    for name, array in columns.items():
+        offset = -(-offset // SNAPSHOT_FILE_ALIGNMENT) * SNAPSHOT_FILE_ALIGNMENT
+        entries.append(
+            SNAPSHOT_FILE_COLUMN.pack(
+                name.encode(), array.dtype.str.encode(), offset, array.nbytes
+            )
+        )
+        layout.append((offset, array))
+        offset += array.nbytes
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(
+            SNAPSHOT_FILE_HEADER.pack(
+                SNAPSHOT_FILE_MAGIC,
+                SNAPSHOT_FILE_VERSION,
+                len(columns),
+                snapshot.change_seq,
+                snapshot.taken_at,
+            )
+        )
+        snapshot_file.write(b"".join(entries))
+        for offset, array in layout:
+            snapshot_file.write(b"\0" * (offset - snapshot_file.tell()))
+            snapshot_file.write(np.ascontiguousarray(array).tobytes())
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def open_snapshot_file(path: str) -> CitySnapshot:
+    """Map a snapshot file read-only; the columns are views of the page cache."""
+    with open(path, "rb") as snapshot_file:
+        try:
+            buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise InvalidSnapshotFileException(path, str(e)) from e
+
+    if len(buffer) < SNAPSHOT_FILE_HEADER.size:
+        raise InvalidSnapshotFileException(path, "truncated header")
+    (
+        magic,
+        version,
+        column_count,
+        change_seq,
+        taken_at,
+    ) = SNAPSHOT_FILE_HEADER.unpack_from(buffer)
+    if magic != SNAPSHOT_FILE_MAGIC:
+        raise InvalidSnapshotFileException(path, "not a city snapshot file")
+    if version != SNAPSHOT_FILE_VERSION:
+        raise InvalidSnapshotFileException(path, f"unsupported version {version}")
+
+    columns = {}
+    for index in range(column_count):
+        name, dtype, offset, nbytes = SNAPSHOT_FILE_COLUMN.unpack_from(
+            buffer, SNAPSHOT_FILE_HEADER.size + index * SNAPSHOT_FILE_COLUMN.size
+        )
+        if offset + nbytes > len(buffer):
+            raise InvalidSnapshotFileException(path, "truncated column data")
+        dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        columns[name.rstrip(b"\0").decode()] = np.frombuffer(
+            buffer, dtype, count=nbytes // dtype.itemsize, offset=offset
+        )
+
+    missing = set(SNAPSHOT_COLUMNS) - set(columns)
+    if missing:
+        raise InvalidSnapshotFileException(
+            path, f"missing columns {', '.join(sorted(missing))}"
+        )
+    return CitySnapshot(columns, change_seq=change_seq, taken_at=taken_at)
+
+
+def dump_snapshot_file(path: str) -> CitySnapshot:
+    """Build a snapshot from the database and write it to a file."""
+    with get_engine().connect() as connection:
+        connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        with connection.begin():
+            snapshot = CitySnapshot.load(connection)
+
+    write_snapshot_file(snapshot, path)
+    return snapshot
+
+
+class CitySnapshotStore:
+    """Serves city reads from a snapshot kept current by city change events.
+
+    Changes only mark cities as pending, which keeps writes cheap; the next read
+    re-fetches the pending cities from the primary into a small overlay. When the
+    overlay outgrows ``overlay_limit`` the snapshot is rebuilt in the background.
+    The list order is code point order of the names, which can differ from the
+    database collation used by the SQL list query.
+    """
+
+    def __init__(self, overlay_limit: int):
+        self.overlay_limit = overlay_limit
+        self.snapshot: Optional[CitySnapshot] = None
+        self._overlay: Dict[bytes, Optional[CityRow]] = {}
+        self._pending: Set[bytes] = set()
+        self._changed_while_loading: Optional[Set[bytes]] = None
+        self._visible_order: Optional[np.ndarray] = None
+        self._overlay_by_name: List[CityRow] = []
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def load(self) -> None:
+        """Build a new snapshot from the database and swap it in."""
+        with self._lock:
+            if self._changed_while_loading is None:
+                self._changed_while_loading = set()
+
+        with get_engine().connect() as connection:
+            connection = connection.execution_options(isolation_level="REPEATABLE READ")
+            with connection.begin():
+                snapshot = CitySnapshot.load(connection)
+
+        self.install(snapshot)
+        logger.info(
+            "city snapshot loaded: %s cities, %.1f MB",
+            len(snapshot),
+            snapshot.nbytes / 2**20,
+        )
+
+    def load_file(self, path: str) -> None:
+        """Map a snapshot file and catch up on the changes written after it."""
+        with self._lock:
+            if self._changed_while_loading is None:
+                self._changed_while_loading = set()
+
+        try:
+            snapshot = open_snapshot_file(path)
+            changed = _fetch_changed_since(snapshot.change_seq, snapshot.taken_at)
+        except Exception:
+            with self._lock:
+                self._changed_while_loading = None
+            raise
+
+        self.install(snapshot, pending=changed)
+        logger.info(
+            "city snapshot mapped from %s: %s cities, %s changed since",
+            path,
+            len(snapshot),
+            len(changed),
+        )
+
+    def install(self, snapshot: CitySnapshot, pending: Iterable = ()) -> None:
+        """Serve from a snapshot; cities changed after it was taken are re-fetched."""
+        with self._lock:
+            changed = self._changed_while_loading or set()
+            self._changed_while_loading = None
+            self.snapshot = snapshot
+            self._overlay = {}
+            self._pending = changed | {uuid_key(city_uuid) for city_uuid in pending}
+            self._invalidate_order()
+
+    def on_change(self, change: CityChange) -> None:
+        key = uuid_key(change.city_uuid)
+        with self._lock:
+            self._pending.add(key)
+            if self._changed_while_loading is not None:
+                self._changed_while_loading.add(key)
+
+    def on_reset(self) -> None:
+        """Rebuild the snapshot after change events may have been missed."""
+        self.reload_in_background()
+
+    def reload_in_background(self) -> None:
+        with self._lock:
+            if self._changed_while_loading is not None:
+                return
+            self._changed_while_loading = set()
+
+        threading.Thread(
+            target=self._reload, name="city-snapshot-load", daemon=True
+        ).start()
+
+    def _reload(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            logger.exception("city snapshot reload failed")
+            with self._lock:
+                self._changed_while_loading = None
+
+    def get_city(self, city_uuid) -> Optional[CityInDB]:
+        """Return a city, or None when it does not exist."""
+        self._apply_pending()
+        key = uuid_key(city_uuid)
+        with self._lock:
+            snapshot = self.snapshot
+            if key in self._overlay:
+                row = self._overlay[key]
+                return CityInDB(**row._asdict()) if row is not None else None
+
+        row = snapshot.find_row(city_uuid)
+        return snapshot.city_at(row) if row is not None else None
+
+    def get_allies(self, city: CityInDB) -> List[Tuple[Decimal, Decimal, int]]:
+        """Return (latitude, longitude, population) of the allies of a city."""
+        allies = []
+        for ally_uuid in city.allied_cities or []:
+            ally = self.get_city(ally_uuid)
+            if ally is not None:
+                allies.append(
+                    (
+                        ally.geo_location_latitude,
+                        ally.geo_location_longitude,
+                        ally.population,
+                    )
+                )
+        return allies
+
+    def list_cities(self, skip: int, limit: int) -> List[CityInDB]:
+        """Return a page of cities in name order."""
+        self._apply_pending()
+        with self._lock:
+            snapshot = self.snapshot
+            visible, overlay, positions = self._page_order()
+
+        # Overlay city j lands at merged position positions[j] + j.
+        merged = [position + index for index, position in enumerate(positions)]
+        overlay_index = bisect.bisect_left(merged, skip)
+        page = []
+        for position in range(skip, skip + limit):
+            if overlay_index < len(overlay) and merged[overlay_index] == position:
+                page.append(CityInDB(**overlay[overlay_index]._asdict()))
+                overlay_index += 1
+            elif position - overlay_index < len(visible):
+                page.append(snapshot.city_at(int(visible[position - overlay_index])))
+            else:
+                break
+        return page
+
+    def _page_order(self) -> Tuple[np.ndarray, List[CityRow], List[int]]:
+        """Return the visible snapshot rows in name order and where overlay cities go."""
+        if self._visible_order is None:
+            snapshot = self.snapshot
+            replaced = np.zeros(len(snapshot), bool)
+            for key in self._overlay:
+                row = snapshot.find_row(UUID(bytes=key))
+                if row is not None:
+                    replaced[row] = True
+            self._visible_order = snapshot.name_order[~replaced[snapshot.name_order]]
+            self._overlay_by_name = sorted(
+                (row for row in self._overlay.values() if row is not None),
+                key=lambda row: (row.name, row.city_uuid.bytes),
+            )
+
+        visible = self._visible_order
+        names = _RowNames(self.snapshot, visible)
+        positions = [
+            bisect.bisect_left(names, (row.name, row.city_uuid.bytes))
+            for row in self._overlay_by_name
+        ]
+        return visible, self._overlay_by_name, positions
+
+    def _invalidate_order(self) -> None:
+        self._visible_order = None
+        self._overlay_by_name = []
+
+    def _apply_pending(self) -> None:
+        """Re-fetch the cities changed since the last read from the primary."""
+        if not self._pending:
+            return
+
+        with self._refresh_lock:
+            with self._lock:
+                pending, self._pending = self._pending, set()
+            if not pending:
+                return
+
+            try:
+                rows = _fetch_city_rows([UUID(bytes=key) for key in pending])
+            except Exception:
+                with self._lock:
+                    self._pending |= pending
+                raise
+
+            with self._lock:
+                for key in pending:
+                    self._overlay[key] = rows.get(key)
+                self._invalidate_order()
+                overlay_size = len(self._overlay)
+
+        if overlay_size > self.overlay_limit:
+            self.reload_in_background()
+
+
+class _RowNames:
+    """Sequence view of (name, uuid bytes) for rows, for binary searches by name."""
+
+    def __init__(self, snapshot: CitySnapshot, rows: np.ndarray):
+        self.snapshot = snapshot
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> Tuple[str, bytes]:
+        row = int(self.rows[index])
+        return self.snapshot.name_at(row), self.snapshot.uuids[row].ljust(16, b"\0")
+
+
+def _fetch_city_rows(city_uuids: List[UUID]) -> Dict[bytes, CityRow]:
+    """Fetch the current state of the given cities from the primary."""
+    with get_engine().connect() as connection:
+        result = connection.execute(
+            text(
+                """
+                SELECT
+                    c.city_uuid,
+                    c.name,
+                    c.beauty,
+                    c.population,
+                    c.geo_location_latitude,
+                    c.geo_location_longitude,
+                    COALESCE(array_agg(ac.ally_uuid) FILTER (WHERE ac.ally_uuid IS NOT NULL), '{}') AS allied_cities
+                FROM city c
+                LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid
+                WHERE c.city_uuid IN :city_uuids
+                GROUP BY c.city_uuid
+                """
+            ),
+            {"city_uuids": tuple(str(city_uuid) for city_uuid in city_uuids)},
+        )
+        return {
+            uuid_key(row.city_uuid): CityRow(
+                city_uuid=UUID(str(row.city_uuid)),
+                name=row.name,
+                beauty=row.beauty,
+                population=row.population,
+                geo_location_latitude=row.geo_location_latitude,
+                geo_location_longitude=row.geo_location_longitude,
+                allied_cities=[UUID(str(ally)) for ally in row.allied_cities],
+            )
+            for row in result.fetchall()
+        }
+
+
+def _fetch_changed_since(change_seq: int, taken_at: float) -> List[UUID]:
+    """Return the cities changed after a snapshot's change log position."""
+    with get_engine().connect() as connection:
+        changed = fetch_changed_city_uuids(
+            connection, ChangeLogPosition(change_seq, taken_at)
+        )
+    return [UUID(city_uuid) for city_uuid in changed]
+
+
+def install_snapshot_store() -> CitySnapshotStore:
+    """Load the snapshot and route city list and read requests to it.
+
+    The snapshot is mapped from CITY_SNAPSHOT_PATH when that file exists, so
+    workers on a host share one copy; otherwise it is built from the database.
+    """
+    store = CitySnapshotStore(overlay_limit=settings.CITY_SNAPSHOT_OVERLAY_LIMIT)
+    subscribe(store.on_change, store.on_reset)
+
+    path = settings.CITY_SNAPSHOT_PATH
+    if path and os.path.exists(path):
+        try:
+            store.load_file(path)
+        except (InvalidSnapshotFileException, ChangeLogTruncatedException) as e:
+            logger.warning("%s, loading from the database instead", e)
+    if not store.ready:
+        store.load()
+
+    services.snapshot_store = store
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dump the cities to a snapshot file.")
+    parser.add_argument("path", nargs="?", default=settings.CITY_SNAPSHOT_PATH)
+    arguments = parser.parse_args()
+    if not arguments.path:
+        parser.error("a path is required when CITY_SNAPSHOT_PATH is not set")
+
+    dumped = dump_snapshot_file(arguments.path)
+    logger.info(
+        "city snapshot written to %s: %s cities at change %s",
+        arguments.path,
+        len(dumped),
+        dumped.change_seq,
+    )
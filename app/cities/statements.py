@@ -0,0 +1,194 @@
+from app.cities.models import ALLIANCE_TABLE
+from app.config import settings
+from app.utils.statements import statement_registry
+
+# Statements with a fixed set of scalar parameters that CityService runs on
+# every request. Statements taking tuples (IN :uuids) or built per call stay
+# inline in the service, since they cannot be prepared once.
+
+SEARCH_ORDERINGS = {
+    "relevance": "is_prefix DESC, score DESC, c.population DESC",
+    "population": "is_prefix DESC, c.population DESC, score DESC",
+}
+
+INSERT_CITY = statement_registry.register(
+    "city_insert",
+    """
+    INSERT INTO city (
+        city_uuid, name, beauty, population, geo_location_latitude, geo_location_longitude
+    )
+    VALUES (
+        gen_random_uuid(), :name, :beauty, :population, :geo_location_latitude, :geo_location_longitude
+    )
+    RETURNING city_uuid;
+    """,
+)
+
+INSERT_ALLIANCE = statement_registry.register(
+    "city_insert_alliance",
+    f"""
+    INSERT INTO {ALLIANCE_TABLE.name} (city_uuid, ally_uuid)
+    VALUES (:city_uuid, :ally_uuid)
+    ON CONFLICT (city_uuid, ally_uuid) DO NOTHING;
+    """,
+)
+
+LIST_CITIES = statement_registry.register(
+    "city_list",
+    """
+    SELECT
+        c.city_uuid,
+        c.name,
+        c.beauty,
+        c.population,
+        c.geo_location_latitude,
+        c.geo_location_longitude,
+        COALESCE(array_agg(ac.ally_uuid) FILTER (WHERE ac.ally_uuid IS NOT NULL), '{}') AS allied_cities
+    FROM city c
+    LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid
+    GROUP BY c.city_uuid
+    ORDER BY c.name
+    LIMIT :limit OFFSET :skip
+    """,
+)
+
+# Not prepared: a generic plan cannot use the name prefix index for LIKE :prefix.
+SEARCH_CITIES = {
+    rank_by: statement_registry.register(
+        f"city_search_by_{rank_by}",
+        f"""
+        SELECT
+            c.city_uuid,
+            c.name,
+            c.beauty,
+            c.population,
+            similarity(c.name, :query) AS score,
+            lower(c.name) LIKE :prefix AS is_prefix
+        FROM city c
+        WHERE lower(c.name) LIKE :prefix OR c.name % :query
+        ORDER BY {ordering}
+        LIMIT :limit
+        """,
+        prepare=False,
+    )
+    for rank_by, ordering in SEARCH_ORDERINGS.items()
+}
+
+CITY_BY_UUID = statement_registry.register(
+    "city_by_uuid",
+    """
+    SELECT
+        c.city_uuid,
+        c.name,
+        c.beauty,
+        c.population,
+        c.geo_location_latitude,
+        c.geo_location_longitude,
+        COALESCE(array_agg(ac.ally_uuid) FILTER (WHERE ac.ally_uuid IS NOT NULL), '{}') AS allied_cities
+    FROM city c
+    LEFT JOIN allied_city ac ON c.city_uuid = ac.city_uuid
+    WHERE c.city_uuid = :city_uuid
+    GROUP BY c.city_uuid
+    """,
+)
+
+# Stored allied power, unless a recompute of it is still queued.
+SELECT_STORED_ALLIED_POWER = statement_registry.register(
+    "city_select_stored_allied_power",
+    """
+    SELECT p.allied_power
+    FROM city_allied_power p
+    WHERE p.city_uuid = :city_uuid
+      AND NOT EXISTS (
+          SELECT 1 FROM city_job j
+          WHERE j.kind = 'allied_power' AND j.city_uuid = :city_uuid
+      )
+    """,
+)
+
+UPDATE_CITY = statement_registry.register(
+    "city_update",
+    """
+    UPDATE city
+    SET
+        name = :name,
+        beauty = :beauty,
+        population = :population,
+        geo_location_latitude = :geo_location_latitude,
+        geo_location_longitude = :geo_location_longitude
+    WHERE city_uuid = :city_uuid
+    RETURNING city_uuid, name, beauty, population, geo_location_latitude, geo_location_longitude;
+    """,
+)
+
+if settings.ALLIANCE_STORAGE == "canonical":
+    # The city is on either side of its ordered pairs, both sides are indexed.
+    DELETE_CITY_ALLIANCES = statement_registry.register(
+        "city_delete_alliances",
+        """
+        DELETE FROM alliance
+        WHERE city_uuid = :city_id OR ally_uuid = :city_id;
+        """,
+    )
+elif settings.CITY_TABLE_PARTITIONS > 0:
+    # Alliances are stored both ways, so the city's rows name every row to delete.
+    # Both lookups are by city_uuid and so prune to a partition, where a filter on
+    # ally_uuid would probe every partition's index.
+    DELETE_CITY_ALLIANCES = statement_registry.register(
+        "city_delete_alliances",
+        """
+        DELETE FROM allied_city
+        WHERE (city_uuid, ally_uuid) IN (
+            SELECT city_uuid, ally_uuid FROM allied_city WHERE city_uuid = :city_id
+            UNION ALL
+            SELECT ally_uuid, city_uuid FROM allied_city WHERE city_uuid = :city_id
+        );
+        """,
+    )
+else:
+    # On plain tables both sides are indexed, and this runs in half the time.
+    DELETE_CITY_ALLIANCES = statement_registry.register(
+        "city_delete_alliances",
+        """
+        DELETE FROM allied_city
+        WHERE city_uuid = :city_id OR ally_uuid = :city_id;
+        """,
+    )
+
+UPSERT_BEAUTY_STATS = statement_registry.register(
+    "city_upsert_beauty_stats",
+    """
+    INSERT INTO city_beauty_stats (beauty, city_count, population_total)
+    VALUES (:beauty, :city_count, :population_total)
+    ON CONFLICT (beauty) DO UPDATE SET
+        city_count = city_beauty_stats.city_count + EXCLUDED.city_count,
+        population_total = city_beauty_stats.population_total + EXCLUDED.population_total;
+    """,
+)
+
+UPSERT_DEGREE_STATS = statement_registry.register(
+    "city_upsert_degree_stats",
+    """
+    INSERT INTO alliance_degree_stats (degree, city_count)
+    VALUES (:degree, :city_count)
+    ON CONFLICT (degree) DO UPDATE SET
+        city_count = alliance_degree_stats.city_count + EXCLUDED.city_count;
+    """,
+)
+
+SELECT_BEAUTY_STATS = statement_registry.register(
+    "city_select_beauty_stats",
+    """
+    SELECT beauty, city_count, population_total
+    FROM city_beauty_stats
+    """,
+)
+
+SELECT_DEGREE_STATS = statement_registry.register(
+    "city_select_degree_stats",
+    """
+    SELECT degree, city_count
+    FROM alliance_degree_stats
+    WHERE city_count <> 0
+    """,
+)
@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -11,6 +12,124 @@ class Settings(BaseSettings):
     DATABASE_URI: str = os.getenv("DATABASE_URI", "")
     TEST_DATABASE_URI: str = os.getenv("DATABASE_URI_TEST", "")
 
+    # Connections each engine keeps open, and how many more it may open under load.
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+
+    # Hash partitions of the city and allied_city tables by city_uuid; 0 keeps plain
+    # tables. New databases are created with this layout, existing ones are
+    # converted with python -m app.cities.partitioning.
+    CITY_TABLE_PARTITIONS: int = 0
+
+    # "mirrored" stores each alliance twice in allied_city, once per direction;
+    # "canonical" stores it once in alliance, lower city UUID first, and reads both
+    # directions through an allied_city view. Convert with app.cities.alliance_storage.
+    ALLIANCE_STORAGE: Literal["mirrored", "canonical"] = "mirrored"
+
+    # Comma separated read replica URIs; reads use the primary when empty.
+    READ_REPLICA_URIS: str = os.getenv("READ_REPLICA_URIS", "")
+    TEST_READ_REPLICA_URIS: str = os.getenv("READ_REPLICA_URIS_TEST", "")
+    REPLICA_EJECT_SECONDS: float = 30.0
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # In-process cache of cities with allied power; disabled when the size is 0.
+    CITY_CACHE_SIZE: int = 0
+    CITY_CACHE_TTL_SECONDS: float = 60.0
+    CITY_CHANGE_LISTENER_ENABLED: bool = False
+
+    # Serve city list and read requests from an in-memory columnar snapshot
+    CITY_SNAPSHOT_ENABLED: bool = False
+    CITY_SNAPSHOT_OVERLAY_LIMIT: int = 10000
+    CITY_SNAPSHOT_PATH: str = ""
+
+    # Compress binary and large list responses, stream exports in chunks
+    RESPONSE_COMPRESSION_MIN_BYTES: int = 16384
+    EXPORT_CHUNK_SIZE: int = 10000
+
+    # GET /cities/changes: entries per read, the longest long-poll wait, how often
+    # a waiting request re-reads the log without a wakeup (other processes' changes
+    # wake it only with the change listener on) and the SSE keepalive interval.
+    CHANGE_FEED_BATCH_SIZE: int = 500
+    CHANGE_FEED_MAX_WAIT_SECONDS: float = 30.0
+    CHANGE_FEED_POLL_SECONDS: float = 1.0
+    CHANGE_FEED_HEARTBEAT_SECONDS: float = 15.0
+
+    # Change log entries older than this are pruned every CHANGE_LOG_PRUNE_SECONDS;
+    # 0 keeps them forever. Snapshot files, Parquet exports and change feed positions
+    # older than the retention can no longer catch up from the log.
+    CHANGE_LOG_RETENTION_HOURS: float = 168.0
+    CHANGE_LOG_PRUNE_SECONDS: float = 3600.0
+
+    # Rows per Parquet file written by app.cities.parquet_export
+    PARQUET_ROWS_PER_FILE: int = 1000000
+
+    # Run the city service statements as server-side prepared statements
+    PREPARED_STATEMENTS_ENABLED: bool = False
+
+    # Group concurrent city creations into one transaction and commit
+    CREATE_BATCH_ENABLED: bool = False
+    CREATE_BATCH_MAX_SIZE: int = 100
+    CREATE_BATCH_MAX_WAIT_MS: float = 5.0
+    # How long a request waits for its batch before answering 500.
+    CREATE_BATCH_RESULT_TIMEOUT_SECONDS: float = 30.0
+
+    # Distance model for allied power: "geodesic", "haversine" or "equirectangular".
+    # The approximations fall back to the geodesic near the 1000/10000 km boundaries,
+    # so allied power is the same with each of them.
+    DISTANCE_MODEL: Literal["geodesic", "haversine", "equirectangular"] = "geodesic"
+
+    # Queue allied power recomputation after writes for background workers; with
+    # JOB_WORKERS=0 the jobs are left to `python -m app.cities.jobs`.
+    JOB_QUEUE_ENABLED: bool = False
+    JOB_WORKERS: int = 2
+    JOB_BATCH_SIZE: int = 100
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_MAX_ATTEMPTS: int = 5
+
+    # Admission control for the cities routes: concurrent requests per budget, queued
+    # requests per budget and how long a request may wait before it gets a 503.
+    ADMISSION_CONTROL_ENABLED: bool = False
+    ADMISSION_READ_CONCURRENCY: int = 10
+    ADMISSION_WRITE_CONCURRENCY: int = 4
+    ADMISSION_BULK_CONCURRENCY: int = 1
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_MAX_WAIT_MS: float = 1000.0
+
+    # Logging: root level, comma separated "logger=LEVEL" overrides, DEBUG sampling
+    # and "text" or "json" output. SQL statements are logged by sqlalchemy.engine=INFO.
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = "sqlalchemy.engine=WARNING"
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0
+    LOG_FORMAT: str = "text"
+    LOG_QUEUE_SIZE: int = 10000
+
+    # Admin endpoints are disabled unless a token is configured.
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+
+    # Statements slower than the threshold are kept, with their plan, for the admin API.
+    # Plain reads are re-run under EXPLAIN ANALYZE; writes and locking reads are only
+    # planned with EXPLAIN, so capturing a plan never repeats their work or locks.
+    SLOW_QUERY_THRESHOLD_MS: float = 500.0
+    SLOW_QUERY_LOG_SIZE: int = 100
+    SLOW_QUERY_EXPLAIN: bool = True
+
+    # Request profiling; when disabled the middleware and hooks are not installed.
+    PROFILING_ENABLED: bool = False
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_STORE_SIZE: int = 50
+
+    # Time from import to serving after which startup is logged as too slow.
+    STARTUP_BUDGET_SECONDS: float = 1.0
+
+    # Warm up in the background after startup and report /ready only once done:
+    # open pooled connections on the primary and each replica, prepare or plan the
+    # hot statements on them, load the distance libraries and, when the extension
+    # is installed, pg_prewarm the city tables and their indexes.
+    WARMUP_ENABLED: bool = True
+    WARMUP_CONNECTIONS: int = 5
+    WARMUP_PREWARM: bool = False
+
     class Config:
         case_sensitive = True
 
@@ -1,33 +1,204 @@
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import Request, Response
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.config import settings
 from app.utils.common import is_testing
+from app.utils.profiling import attach_sql_timing
+from app.utils.slow_queries import slow_query_log
 
-engine = create_engine(
-    settings.DATABASE_URI if not is_testing() else settings.TEST_DATABASE_URI, echo=True
-)
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
 
+def _engine_options() -> Dict[str, Any]:
+    """Options shared by the primary and replica engines."""
+    options: Dict[str, Any] = {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+    }
+    if settings.CITY_TABLE_PARTITIONS > 0:
+        # Joins and aggregates of city with allied_city run partition by partition.
+        options["connect_args"] = {
+            "options": "-c enable_partitionwise_join=on"
+            " -c enable_partitionwise_aggregate=on"
+        }
+    return options
+
+
+def get_engine() -> Engine:
+    """Return the primary engine, creating it (and loading the driver) on first use."""
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    settings.DATABASE_URI
+                    if not is_testing()
+                    else settings.TEST_DATABASE_URI,
+                    **_engine_options(),
+                )
+                slow_query_log.attach(_engine)
+                if settings.PROFILING_ENABLED:
+                    attach_sql_timing(_engine)
+
+    return _engine
+
+
+class ReplicaPool:
+    """Round-robin selection over read replicas with temporary ejection of failed ones.
+
+    Given ``uris`` instead of engines, the engines (and the driver) are created on
+    first use, like the primary engine.
+    """
+
+    def __init__(
+        self,
+        engines: Optional[List[Engine]] = None,
+        eject_seconds: float = 30.0,
+        uris: Sequence[str] = (),
+    ):
+        self.uris = list(uris)
+        self.eject_seconds = eject_seconds
+        self._engines = engines
+        self._ejected_until: Dict[int, float] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        """Whether there are any replicas, without creating their engines."""
+        return bool(self._engines if self._engines is not None else self.uris)
+
+    @property
+    def engines(self) -> List[Engine]:
+        if self._engines is None:
+            with self._lock:
+                if self._engines is None:
+                    self._engines = [_create_replica_engine(uri) for uri in self.uris]
+        return self._engines
+
+    def candidates(self) -> List[Engine]:
+        """Return the healthy replicas, starting from the next one in the rotation."""
+        if not self.engines:
+            return []
+
+        now = time.monotonic()
+        start = next(self._counter) % len(self.engines)
+        rotation = self.engines[start:] + self.engines[:start]
+        with self._lock:
+            return [
+                replica
+                for replica in rotation
+                if self._ejected_until.get(id(replica), 0) <= now
+            ]
+
+    def eject(self, replica: Engine) -> None:
+        """Stop routing reads to a replica until the ejection period has passed."""
+        with self._lock:
+            self._ejected_until[id(replica)] = time.monotonic() + self.eject_seconds
+
+
+def _replica_uris() -> List[str]:
+    """Return the configured read replica URIs."""
+    uris = (
+        settings.READ_REPLICA_URIS
+        if not is_testing()
+        else settings.TEST_READ_REPLICA_URIS
+    )
+    return [uri.strip() for uri in uris.split(",") if uri.strip()]
+
+
+def _create_replica_engine(uri: str) -> Engine:
+    """Create the engine of a read replica."""
+    replica = create_engine(uri, pool_pre_ping=True, **_engine_options())
+    slow_query_log.attach(replica)
+    if settings.PROFILING_ENABLED:
+        attach_sql_timing(replica)
+    return replica
+
+
+replica_pool = ReplicaPool(
+    eject_seconds=settings.REPLICA_EJECT_SECONDS, uris=_replica_uris()
+)
+
+
 def create_db_and_tables() -> None:
     """Creates the tables in the database from the models."""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
 
 
 def drop_db_and_tables() -> None:
     """Drops the tables in the database, clearing all data."""
-    Base.metadata.drop_all(bind=engine)
+    Base.metadata.drop_all(bind=get_engine())
 
 
 def get_session():
     """Generates a database session."""
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def wrote_recently(request: Request) -> bool:
+    """Check if the client made a write recent enough to require reading from the primary."""
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def mark_recent_write(response: Response) -> None:
+    """Pin the client's reads to the primary for the read-your-writes window."""
+    response.set_cookie(
+        READ_YOUR_WRITES_COOKIE,
+        str(time.time() + settings.READ_YOUR_WRITES_SECONDS),
+        max_age=int(settings.READ_YOUR_WRITES_SECONDS) + 1,
+        httponly=True,
+    )
+
+
+def connect_for_read(request: Request):
+    """Open a read-only connection on a healthy replica, falling back to the primary."""
+    replicas = [] if wrote_recently(request) else replica_pool.candidates()
+
+    for replica in replicas:
+        try:
+            return replica.connect().execution_options(postgresql_readonly=True)
+        except OperationalError:
+            replica_pool.eject(replica)
+
+    return get_engine().connect().execution_options(postgresql_readonly=True)
+
+
+def reads_primary(db: Session) -> bool:
+    """Check if a session reads from the primary rather than from a replica."""
+    return db.get_bind().engine is get_engine()
+
+
+def get_read_session(request: Request):
+    """Generates a read-only database session for routes that do not write."""
+    connection = connect_for_read(request)
+    db = Session(bind=connection, autoflush=False)
     try:
         yield db
     finally:
         db.close()
+        connection.close()
@@ -1,10 +1,22 @@
+import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
+from app import STARTED_AT
+from app.admin import routers as admin_routers
 from app.cities import routers
-from app.database import create_db_and_tables
-from app.utils.logger import logger_config
+from app.cities.batching import create_coalescer
+from app.cities.events import ChangeLogPruner, CityChangeListener
+from app.cities.jobs import job_pool
+from app.config import settings
+from app.database import get_engine, mark_recent_write, replica_pool
+from app.migrations import migrate_schema
+from app.utils.admission import AdmissionMiddleware
+from app.utils.logger import logger_config, shutdown_logging, start_logging
+from app.utils.profiling import ProfilingMiddleware
+from app.warmup import warmup
 
 logger = logger_config(__name__)
 
@@ -13,13 +25,85 @@ logger = logger_config(__name__)
 async def lifespan(app: FastAPI):
     """Triggers event before Fast API is started."""
 
-    create_db_and_tables()
+    start_logging()
+    migrate_schema(get_engine())
 
-    logger.info("startup: triggered")
+    listener = None
+    if settings.CITY_CHANGE_LISTENER_ENABLED:
+        listener = CityChangeListener(get_engine())
+        listener.start()
+
+    pruner = None
+    if settings.CHANGE_LOG_RETENTION_HOURS > 0:
+        pruner = ChangeLogPruner(
+            get_engine(),
+            settings.CHANGE_LOG_RETENTION_HOURS,
+            settings.CHANGE_LOG_PRUNE_SECONDS,
+        )
+        pruner.start()
+
+    if settings.CITY_SNAPSHOT_ENABLED:
+        from app.cities.snapshot import install_snapshot_store
+
+        install_snapshot_store()
+
+    if settings.CREATE_BATCH_ENABLED:
+        create_coalescer.start()
+
+    if settings.JOB_QUEUE_ENABLED and settings.JOB_WORKERS > 0:
+        job_pool.start()
+
+    if settings.WARMUP_ENABLED:
+        warmup.start()
+    else:
+        warmup.ready = True
+
+    startup_seconds = time.perf_counter() - STARTED_AT
+    logger.info("startup: triggered in %.3fs", startup_seconds)
+    if startup_seconds > settings.STARTUP_BUDGET_SECONDS:
+        logger.warning(
+            "startup: exceeded budget of %.3fs", settings.STARTUP_BUDGET_SECONDS
+        )
 
     yield
 
+    warmup.stop(timeout=5)
+    create_coalescer.stop(timeout=5)
+    job_pool.stop(timeout=5)
+
+    if listener is not None:
+        listener.stop(timeout=5)
+    if pruner is not None:
+        pruner.stop(timeout=5)
+
     logger.info("shutdown: triggered")
+    shutdown_logging()
+
+
+async def read_your_writes(request: Request, call_next):
+    """Pins a client's reads to the primary right after a successful write."""
+    response = await call_next(request)
+
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_recent_write(response)
+
+    return response
+
+
+async def health():
+    """Liveness: the worker is serving requests."""
+    return {"status": "ok"}
+
+
+async def ready():
+    """Readiness: the worker has warmed up and is not shutting down."""
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return {
+        "status": "ready",
+        "warmup_seconds": warmup.seconds,
+        "warmup_errors": warmup.errors,
+    }
 
 
 def create_application() -> FastAPI:
@@ -30,7 +114,23 @@ def create_application() -> FastAPI:
         lifespan=lifespan,
     )
 
+    if replica_pool.configured:
+        application.middleware("http")(read_your_writes)
+
+    if settings.ADMISSION_CONTROL_ENABLED:
+        application.add_middleware(AdmissionMiddleware)
+
+    if settings.PROFILING_ENABLED:
+        application.add_middleware(
+            ProfilingMiddleware, sample_rate=settings.PROFILE_SAMPLE_RATE
+        )
+
+    application.add_api_route("/health", health, methods=["GET"], tags=["Health"])
+    application.add_api_route("/ready", ready, methods=["GET"], tags=["Health"])
     application.include_router(routers.router, prefix="/api/v1", tags=["Items"])
+    application.include_router(
+        admin_routers.router, prefix="/api/v1/admin", tags=["Admin"]
+    )
 
     return application
 
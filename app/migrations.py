@@ -0,0 +1,167 @@
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import Column, Integer, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.cities.models import CityAlliedPower, CityChangeLog, CityJob
+from app.cities.services import fetch_ground_truth_stats, rewrite_stats
+from app.database import Base, get_engine
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+# Advisory lock key shared by every worker so only one of them migrates at a time.
+MIGRATION_LOCK_KEY = 7461203
+
+
+class SchemaVersion(Base):
+    """Schema version applied to the database."""
+
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+
+
+class Migration(NamedTuple):
+    """A numbered schema change."""
+
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _create_baseline(connection: Connection) -> None:
+    """Create the missing tables defined by the models, with their types and indexes."""
+    Base.metadata.create_all(bind=connection)
+
+
+def _create_city_change_log(connection: Connection) -> None:
+    """Create the change log that snapshot files catch up from."""
+    CityChangeLog.__table__.create(bind=connection, checkfirst=True)
+
+
+def _create_city_jobs(connection: Connection) -> None:
+    """Create the job queue and the allied power table its workers fill."""
+    CityJob.__table__.create(bind=connection, checkfirst=True)
+    CityAlliedPower.__table__.create(bind=connection, checkfirst=True)
+
+
+def _create_city_name_search(connection: Connection) -> None:
+    """Create pg_trgm and the city name search indexes on an existing city table."""
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    connection.execute(
+        text(
+            """
+            CREATE INDEX IF NOT EXISTS idx_city_name_trgm
+            ON city USING gin (name gin_trgm_ops)
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            CREATE INDEX IF NOT EXISTS idx_city_name_prefix
+            ON city (lower(name) text_pattern_ops)
+            """
+        )
+    )
+
+
+def _add_change_log_xid(connection: Connection) -> None:
+    """Record the writing transaction of each change log row."""
+    connection.execute(
+        text(
+            """
+            ALTER TABLE city_change_log
+            ADD COLUMN IF NOT EXISTS xid xid8 NOT NULL DEFAULT pg_current_xact_id()
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            CREATE INDEX IF NOT EXISTS idx_city_change_log_xid_seq
+            ON city_change_log (xid, seq)
+            """
+        )
+    )
+
+
+def _seed_city_stats(connection: Connection) -> None:
+    """Fill the statistics counters from the cities created before they existed."""
+    connection.execute(
+        text("LOCK TABLE city_beauty_stats, alliance_degree_stats IN EXCLUSIVE MODE")
+    )
+    rewrite_stats(connection, *fetch_ground_truth_stats(connection))
+
+
+# A fresh database gets every current table from the baseline, so later
+# migrations must be written to be no-ops when their change already exists.
+# The baseline only adds missing tables: an index, extension or column added to
+# an existing table's model needs its own migration (with IF NOT EXISTS) too.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline tables", _create_baseline),
+    Migration(2, "city change log", _create_city_change_log),
+    Migration(3, "city jobs and allied power", _create_city_jobs),
+    Migration(4, "city name search indexes", _create_city_name_search),
+    Migration(5, "city change log transaction ids", _add_change_log_xid),
+    Migration(6, "city statistics counters", _seed_city_stats),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def read_schema_version(connection: Connection) -> int:
+    """Return the schema version recorded in the database, 0 when never migrated."""
+    if (
+        connection.execute(text("SELECT to_regclass('schema_version')")).scalar()
+        is None
+    ):
+        return 0
+
+    return connection.execute(
+        text("SELECT COALESCE(max(version), 0) FROM schema_version")
+    ).scalar()
+
+
+def migrate_schema(engine: Engine) -> int:
+    """Bring the database to SCHEMA_VERSION and return the version it is at.
+
+    The common case of an up to date database costs one round trip of reads and
+    no locks, so many workers can start at once.
+    """
+    with engine.connect() as connection:
+        version = read_schema_version(connection)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+
+        # Another worker may have migrated while we waited for the lock.
+        version = read_schema_version(connection)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+
+            logger.info(
+                "migrating schema to version %s: %s",
+                migration.version,
+                migration.description,
+            )
+            migration.apply(connection)
+            version = migration.version
+
+        connection.execute(text("DELETE FROM schema_version"))
+        connection.execute(
+            text("INSERT INTO schema_version (version) VALUES (:version)"),
+            {"version": version},
+        )
+
+    return version
+
+
+if __name__ == "__main__":
+    migrate_schema(get_engine())
@@ -1,9 +1,66 @@
+import os
+import subprocess
+import sys
+
 import pytest
 from fastapi.testclient import TestClient
 
-from app.database import create_db_and_tables, drop_db_and_tables, get_session
+from app.config import settings
+from app.database import (
+    create_db_and_tables,
+    drop_db_and_tables,
+    get_read_session,
+    get_session,
+)
 from app.main import create_application
 
+CONVERSION = """
+from app.database import get_engine
+from {module} import {function}
+
+print({function}(get_engine()))
+"""
+
+
+def city_payload(name: str, beauty="Average", population=1000, allies=()) -> dict:
+    """Build a city creation payload."""
+    return {
+        "name": name,
+        "beauty": beauty,
+        "population": population,
+        "geo_location_latitude": 12.432,
+        "geo_location_longitude": 54.234,
+        "allied_cities": list(allies),
+    }
+
+
+def create_city(
+    client, name: str, beauty="Average", population=1000, allies=()
+) -> dict:
+    """Create a city through the API and return the loaded response."""
+    response = client.post(
+        "api/v1/cities", json=city_payload(name, beauty, population, allies)
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+def run_conversion(module: str, function: str, **env: str) -> str:
+    """Run a table conversion in its own process and return what it printed last.
+
+    The conversions read their layout from the settings, so ``env`` sets it for
+    the new process, against the test database.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", CONVERSION.format(module=module, function=function)],
+        capture_output=True,
+        check=True,
+        text=True,
+        timeout=120,
+        env={**os.environ, "DATABASE_URI": settings.TEST_DATABASE_URI, **env},
+    )
+    return result.stdout.split()[-1]
+
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -27,8 +84,20 @@ def client(db_session):
 
     def override_get_db():
         yield db_session
+        # Like the per-request sessions it stands in for, a request leaves no
+        # transaction open behind it, e.g. one begun by a read.
+        if db_session.in_transaction():
+            db_session.rollback()
 
     app.dependency_overrides[get_session] = override_get_db
+    app.dependency_overrides[get_read_session] = override_get_db
 
     with TestClient(app) as client:
         yield client
+
+
+@pytest.fixture(scope="function")
+def admin_headers(monkeypatch):
+    """Fixture to configure an admin token and provide the headers that send it."""
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    return {"X-Admin-Token": "secret"}
@@ -0,0 +1,102 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.admission import (
+    BULK,
+    READ,
+    WRITE,
+    AdmissionController,
+    AdmissionLimiter,
+    AdmissionMiddleware,
+    classify_request,
+)
+
+
+def test_classify_request() -> None:
+    """Test cities requests count against read, write or bulk budgets."""
+
+    assert classify_request("GET", "/api/v1/cities/") == READ
+    assert classify_request("GET", "/api/v1/cities/export") == BULK
+    assert classify_request("PATCH", "/api/v1/cities/bulk") == BULK
+    assert classify_request("PUT", "/api/v1/cities/some-uuid") == WRITE
+    assert classify_request("GET", "/api/v1/admin/admission") is None
+    assert classify_request("GET", "/api/v1/cities/changes") is None
+
+
+def test_limiter_queues_then_rejects() -> None:
+    """Test requests queue up to the limit, then are rejected at once or on deadline."""
+
+    async def scenario():
+        limiter = AdmissionLimiter("read", 1, max_queue=1, max_wait_seconds=0.05)
+
+        assert await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+
+        # The queue is full.
+        assert not await limiter.acquire()
+
+        limiter.release(0.01)
+        assert await queued
+        assert limiter.active == 1
+
+        # Nobody releases the slot, so the waiter misses its deadline.
+        assert not await limiter.acquire()
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["active"] == 0
+    assert stats["admitted"] == 2
+    assert stats["rejected_queue_full"] == 1
+    assert stats["rejected_deadline"] == 1
+
+
+def test_limiter_rejects_when_expected_wait_exceeds_deadline() -> None:
+    """Test a request is turned away without waiting when it cannot make it."""
+
+    async def scenario():
+        limiter = AdmissionLimiter("write", 1, max_queue=10, max_wait_seconds=0.5)
+        limiter.service_seconds = 1.0
+        assert await limiter.acquire()
+        return await limiter.acquire(), limiter.retry_after()
+
+    assert asyncio.run(scenario()) == (False, 1)
+
+
+def test_middleware_answers_503_with_retry_after() -> None:
+    """Test a request over budget gets 503 and other budgets are unaffected."""
+
+    controller = AdmissionController(
+        [
+            AdmissionLimiter(READ, 1, max_queue=0, max_wait_seconds=1.0),
+            AdmissionLimiter(WRITE, 1, max_queue=0, max_wait_seconds=1.0),
+        ]
+    )
+    application = FastAPI()
+
+    @application.get("/cities/")
+    def list_cities():
+        return []
+
+    @application.post("/cities/")
+    def create_city():
+        return {}
+
+    application.add_middleware(AdmissionMiddleware, controller=controller)
+
+    with TestClient(application) as client:
+        assert client.get("/cities/").status_code == 200
+
+        controller.limiters[READ].active = 1
+        response = client.get("/cities/")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        assert client.post("/cities/").status_code == 200
+
+    assert controller.limiters[READ].rejected_queue_full == 1
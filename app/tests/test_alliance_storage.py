@@ -0,0 +1,66 @@
+from uuid import uuid4
+
+from sqlalchemy import text
+
+from app.cities import services
+from app.cities.alliance_storage import read_alliance_storage
+from app.config import settings
+from app.database import get_engine
+from app.tests.conftest import create_city, run_conversion
+
+
+def convert(storage: str) -> str:
+    return run_conversion(
+        "app.cities.alliance_storage",
+        "convert_alliance_storage",
+        ALLIANCE_STORAGE=storage,
+    )
+
+
+def test_canonical_rows_are_ordered_pairs(monkeypatch) -> None:
+    """Test canonical storage writes each alliance once, lower UUID first."""
+
+    city, ally_a, ally_b = (str(uuid4()) for _ in range(3))
+    monkeypatch.setattr(settings, "ALLIANCE_STORAGE", "canonical")
+
+    rows = services._alliance_rows(city, [ally_a, ally_b, ally_a])
+
+    assert len(rows) == 2
+    assert all(row["city_uuid"] <= row["ally_uuid"] for row in rows)
+    assert {frozenset(row.values()) for row in rows} == {
+        frozenset((city, ally_a)),
+        frozenset((city, ally_b)),
+    }
+
+
+def test_convert_to_canonical_and_back(client, db_session) -> None:
+    """Test the conversion keeps the alliances the API reads, in both directions."""
+
+    city_a = create_city(client, "Testing City A")["city_uuid"]
+    city_b = create_city(client, "Testing City B", allies=[city_a])["city_uuid"]
+    city_c = create_city(client, "Testing City C", allies=[city_a, city_b])["city_uuid"]
+
+    def read_allies() -> dict:
+        allies = {
+            city: sorted(client.get(f"api/v1/cities/{city}").json()["allied_cities"])
+            for city in (city_a, city_b, city_c)
+        }
+        # The conversion waits for every transaction reading the alliances.
+        db_session.rollback()
+        return allies
+
+    allies = read_allies()
+
+    assert convert("canonical") == "canonical"
+    with get_engine().connect() as connection:
+        assert read_alliance_storage(connection) == "canonical"
+        assert connection.execute(text("SELECT count(*) FROM alliance")).scalar() == 3
+    assert read_allies() == allies
+
+    assert convert("mirrored") == "mirrored"
+    with get_engine().connect() as connection:
+        assert read_alliance_storage(connection) == "mirrored"
+        assert (
+            connection.execute(text("SELECT count(*) FROM allied_city")).scalar() == 6
+        )
+    assert read_allies() == allies
@@ -0,0 +1,178 @@
+import threading
+from uuid import uuid4
+
+import pytest
+
+from app.cities import batching
+from app.cities.batching import CoalescerStoppedException, CreateCoalescer
+from app.cities.exceptions import InvalidAllyException
+from app.cities.schemas import CityCreate, CityInDB
+from app.cities.services import CityService
+
+
+def city_data(name: str, allies=None) -> CityCreate:
+    """Build a city creation request."""
+    return CityCreate(
+        name=name,
+        beauty="Average",
+        population=100,
+        geo_location_latitude=12.432,
+        geo_location_longitude=54.234,
+        allied_cities=allies or [],
+    )
+
+
+class RecordingService:
+    """Stands in for CityService and records the batches it is given."""
+
+    batches = []
+
+    def __init__(self, db):
+        pass
+
+    def create_cities(self, cities):
+        self.batches.append([city.name for city in cities])
+        return [
+            (
+                InvalidAllyException([uuid4()])
+                if city.name == "bad"
+                else CityInDB(city_uuid=uuid4(), **city.model_dump())
+            )
+            for city in cities
+        ]
+
+
+class NoSession:
+    """Stands in for a database session the recording service never uses."""
+
+    def __init__(self, bind=None):
+        pass
+
+    def close(self):
+        pass
+
+
+def use_recording_service(monkeypatch) -> None:
+    """Make coalescers create their batches with RecordingService."""
+    RecordingService.batches = []
+    monkeypatch.setattr(batching, "CityService", RecordingService)
+    monkeypatch.setattr(batching, "SessionLocal", NoSession)
+    monkeypatch.setattr(batching, "get_engine", lambda: None)
+
+
+def test_coalescer_batches_concurrent_creates(monkeypatch) -> None:
+    """Test concurrent creates share a batch and get their own results back."""
+
+    use_recording_service(monkeypatch)
+    coalescer = CreateCoalescer(max_batch_size=10, max_wait_ms=200)
+    coalescer.start()
+
+    try:
+        futures = [coalescer.submit(city_data(name)) for name in ("a", "bad", "c")]
+        assert futures[0].result(timeout=5).name == "a"
+        with pytest.raises(InvalidAllyException):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5).name == "c"
+    finally:
+        coalescer.stop()
+
+    assert RecordingService.batches == [["a", "bad", "c"]]
+
+
+def test_coalescer_caps_batch_size(monkeypatch) -> None:
+    """Test a batch is closed once it reaches the maximum size."""
+
+    use_recording_service(monkeypatch)
+    coalescer = CreateCoalescer(max_batch_size=2, max_wait_ms=200)
+    coalescer.start()
+    futures = [coalescer.submit(city_data(name)) for name in ("a", "b", "c")]
+    coalescer.stop()
+
+    assert [future.result(timeout=5).name for future in futures] == ["a", "b", "c"]
+    assert RecordingService.batches == [["a", "b"], ["c"]]
+
+
+def test_stopped_coalescer_refuses_cities(monkeypatch) -> None:
+    """Test cities are refused once the coalescer is stopped."""
+
+    use_recording_service(monkeypatch)
+    coalescer = CreateCoalescer(max_batch_size=10, max_wait_ms=1)
+    with pytest.raises(CoalescerStoppedException):
+        coalescer.submit(city_data("a"))
+
+    coalescer.start()
+    coalescer.stop()
+    with pytest.raises(CoalescerStoppedException):
+        coalescer.create(city_data("b"))
+
+
+def test_failed_writer_answers_waiting_callers(monkeypatch) -> None:
+    """Test a writer thread that dies fails its pending cities and stops accepting."""
+
+    def fail(batch):
+        raise RuntimeError("writer failed")
+
+    coalescer = CreateCoalescer(max_batch_size=10, max_wait_ms=1)
+    monkeypatch.setattr(coalescer, "_create_batch", fail)
+    coalescer.start()
+
+    future = coalescer.submit(city_data("a"))
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+
+    # The coalescer stops accepting before it answers the waiting callers.
+    assert not coalescer.running
+    with pytest.raises(CoalescerStoppedException):
+        coalescer.submit(city_data("b"))
+
+
+def test_create_cities_rejects_only_the_bad_request(db_session) -> None:
+    """Test a city with an unknown ally fails alone and the rest are created."""
+
+    city_service = CityService(db_session)
+    ally = city_service.create_city(city_data("Testing City A"))
+
+    results = city_service.create_cities(
+        [
+            city_data("Testing City B", [ally.city_uuid]),
+            city_data("Testing City C", [uuid4()]),
+            city_data("Testing City D", [ally.city_uuid]),
+        ]
+    )
+
+    assert isinstance(results[0], CityInDB)
+    assert isinstance(results[1], InvalidAllyException)
+    assert isinstance(results[2], CityInDB)
+
+    city_a = city_service.get_city(ally.city_uuid)
+    assert set(city_a.allied_cities) == {results[0].city_uuid, results[2].city_uuid}
+    db_session.rollback()
+    assert city_service.reconcile_stats().consistent is True
+
+
+def test_create_endpoint_through_coalescer(client) -> None:
+    """Test the create endpoint answers the same when creates are batched."""
+
+    batching.create_coalescer.start()
+    try:
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda name=name: responses.append(
+                    client.post(
+                        "api/v1/cities", json=city_data(name).model_dump(mode="json")
+                    )
+                )
+            )
+            for name in ("Testing City A", "Testing City B")
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        batching.create_coalescer.stop()
+
+    assert sorted(response.status_code for response in responses) == [201, 201]
+    response = client.get("api/v1/cities/")
+    assert len(response.json()) == 2
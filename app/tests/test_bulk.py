@@ -0,0 +1,143 @@
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+
+from app.cities import services
+from app.cities.schemas import CityBulkDelete, CityBulkUpdate
+from app.tests.conftest import create_city
+
+
+def test_bulk_selection_needs_uuids_or_filter() -> None:
+    """Test a bulk request selects cities by exactly one of UUIDs and filter."""
+
+    with pytest.raises(ValidationError):
+        CityBulkDelete()
+    with pytest.raises(ValidationError):
+        CityBulkDelete(city_uuids=[uuid4()], filter={"beauty": "Ugly"})
+    with pytest.raises(ValidationError):
+        CityBulkDelete(filter={})
+    with pytest.raises(ValidationError):
+        CityBulkUpdate(city_uuids=[uuid4()], changes={})
+
+
+def test_bulk_delete_by_uuid(client, admin_headers) -> None:
+    """Test deleting cities by UUID removes their alliances on both sides."""
+
+    city_a = create_city(client, "Testing City A", "Average", 100)
+    city_b = create_city(client, "Testing City B", "Ugly", 200, [city_a["city_uuid"]])
+    city_c = create_city(
+        client, "Testing City C", "Average", 300, [city_a["city_uuid"]]
+    )
+    missing_uuid = str(uuid4())
+
+    response = client.post(
+        "api/v1/cities/bulk-delete",
+        json={"city_uuids": [city_b["city_uuid"], city_c["city_uuid"], missing_uuid]},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"affected": 2, "not_found": [missing_uuid]}
+
+    response = client.get(f"api/v1/cities/{city_a['city_uuid']}")
+    assert response.status_code == 200
+    assert response.json()["allied_cities"] == []
+
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.json()["consistent"] is True
+    assert response.json()["counters"]["total_population"] == 100
+
+
+def test_bulk_delete_by_filter(client) -> None:
+    """Test deleting cities selected by a filter."""
+
+    create_city(client, "Testing City A", "Ugly", 100)
+    create_city(client, "Testing City B", "Ugly", 5000)
+    city_c = create_city(client, "Testing City C", "Average", 100)
+
+    response = client.post(
+        "api/v1/cities/bulk-delete",
+        json={"filter": {"beauty": "Ugly", "max_population": 1000}},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"affected": 1, "not_found": []}
+
+    response = client.get("api/v1/cities/")
+    assert {city["name"] for city in response.json()} == {
+        "Testing City B",
+        city_c["name"],
+    }
+
+
+def test_bulk_update_by_filter(client, admin_headers) -> None:
+    """Test updating cities selected by a filter keeps the counters in step."""
+
+    create_city(client, "Testing City A", "Ugly", 100)
+    create_city(client, "Testing City B", "Ugly", 200)
+    create_city(client, "Other City", "Ugly", 300)
+
+    response = client.patch(
+        "api/v1/cities/bulk",
+        json={
+            "filter": {"name_prefix": "testing"},
+            "changes": {"beauty": "Gorgeous", "population": 1000},
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"affected": 2, "not_found": []}
+
+    response = client.get("api/v1/cities/stats")
+    assert response.json()["cities_by_beauty"] == {
+        "Ugly": 1,
+        "Average": 0,
+        "Gorgeous": 2,
+    }
+    assert response.json()["total_population"] == 2300
+
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.json()["consistent"] is True
+
+
+def test_bulk_filter_over_the_cap_is_rejected(client, monkeypatch) -> None:
+    """Test a filter matching more cities than the cap is rejected untouched."""
+
+    monkeypatch.setattr(services, "BULK_MAX_CITIES", 2)
+    for name in ("Testing City A", "Testing City B", "Testing City C"):
+        create_city(client, name, "Ugly", 100)
+
+    response = client.post(
+        "api/v1/cities/bulk-delete", json={"filter": {"min_population": 0}}
+    )
+    assert response.status_code == 400
+
+    response = client.patch(
+        "api/v1/cities/bulk",
+        json={"filter": {"beauty": "Ugly"}, "changes": {"population": 5}},
+    )
+    assert response.status_code == 400
+
+    response = client.get("api/v1/cities/")
+    assert [city["population"] for city in response.json()] == [100, 100, 100]
+
+
+def test_allies_are_locked_past_the_cap(client, monkeypatch) -> None:
+    """Test the bulk cap does not limit the allies locked along with a city."""
+
+    monkeypatch.setattr(services, "BULK_MAX_CITIES", 1)
+    city_a = create_city(client, "Testing City A", "Ugly", 100)
+    city_b = create_city(client, "Testing City B", "Ugly", 100)
+    city_c = create_city(
+        client,
+        "Testing City C",
+        "Average",
+        100,
+        [city_a["city_uuid"], city_b["city_uuid"]],
+    )
+
+    response = client.post(
+        "api/v1/cities/bulk-delete", json={"city_uuids": [city_c["city_uuid"]]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"affected": 1, "not_found": []}
@@ -0,0 +1,117 @@
+import random
+from decimal import Decimal
+
+import pytest
+
+from app.utils import common
+from app.utils.common import (
+    DISTANCE_MODELS,
+    ally_distance_km,
+    calculate_allied_power,
+    calculate_allied_powers,
+    calculate_ally_contribution,
+    calculate_distance,
+    equirectangular_km,
+    haversine_km,
+)
+
+
+def random_pairs(count: int) -> list:
+    """Pairs anywhere on the globe and pairs a few hundred km apart."""
+    rng = random.Random(7)
+    pairs = []
+    for index in range(count):
+        origin = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+        if index % 2:
+            destination = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+        else:
+            destination = (
+                max(-90.0, min(90.0, origin[0] + rng.uniform(-12, 12))),
+                origin[1] + rng.uniform(-15, 15),
+            )
+        pairs.append((origin, destination))
+    return pairs
+
+
+def test_approximations_are_close_to_geodesic() -> None:
+    """Test both approximations on a known pair, across the antimeridian too."""
+
+    berlin, hamburg = (52.531677, 13.381777), (53.551086, 9.993682)
+    exact = calculate_distance(berlin, hamburg)
+
+    assert haversine_km(berlin, hamburg) == pytest.approx(exact, rel=0.006)
+    assert equirectangular_km(berlin, hamburg) == pytest.approx(exact, rel=0.015)
+    assert equirectangular_km((0, 179.5), (0, -179.5)) == pytest.approx(111, rel=0.01)
+
+
+@pytest.mark.parametrize("name", ["haversine", "equirectangular"])
+def test_models_give_geodesic_contributions(name) -> None:
+    """Test an approximate model never changes an ally's contribution."""
+
+    model = DISTANCE_MODELS[name]
+    for origin, destination in random_pairs(3000):
+        assert calculate_ally_contribution(
+            ally_distance_km(origin, destination, model), 1000
+        ) == calculate_ally_contribution(calculate_distance(origin, destination), 1000)
+
+
+def test_fallback_near_boundary(monkeypatch) -> None:
+    """Test a pair just past 1000 km is measured with the geodesic."""
+
+    calls = []
+    real_distance = common.calculate_distance
+    monkeypatch.setattr(
+        common,
+        "calculate_distance",
+        lambda *pair: calls.append(pair) or real_distance(*pair),
+    )
+    origin = (0.0, 0.0)
+    near_boundary = (0.0, 9.0)  # about 1002 km along the equator
+    far_from_boundary = (0.0, 3.0)
+
+    ally_distance_km(origin, far_from_boundary, DISTANCE_MODELS["haversine"])
+    assert calls == []
+    assert ally_distance_km(origin, near_boundary, DISTANCE_MODELS["haversine"]) == (
+        real_distance(origin, near_boundary)
+    )
+    assert len(calls) == 1
+
+
+def test_allied_power_uses_configured_model(monkeypatch) -> None:
+    """Test allied power is the same whichever model is configured."""
+
+    origin = (Decimal("12.432"), Decimal("54.234"))
+    allies = [
+        (Decimal("12.5"), Decimal("54.3"), 100),
+        (Decimal("-33.9"), Decimal("151.2"), 400),
+        (Decimal("40.0"), Decimal("-74.0"), 1000),
+    ]
+    powers = set()
+    for name in DISTANCE_MODELS:
+        monkeypatch.setattr(common.settings, "DISTANCE_MODEL", name)
+        powers.add(calculate_allied_power(origin, allies))
+
+    assert len(powers) == 1
+
+
+@pytest.mark.parametrize("name", list(DISTANCE_MODELS))
+def test_batched_allied_powers_match_single_cities(name) -> None:
+    """Test a batch of cities gets the same allied power as one at a time."""
+
+    model = DISTANCE_MODELS[name]
+    pairs = random_pairs(200)
+    cities = [
+        (
+            pairs[index][0],
+            [
+                (*destination, 1000 + index)
+                for _, destination in pairs[index : index + 5]
+            ],
+        )
+        for index in range(0, 200, 5)
+    ]
+    cities.append(((0.0, 0.0), []))
+
+    assert calculate_allied_powers(cities, model) == [
+        calculate_allied_power(origin, allies, model) for origin, allies in cities
+    ]
@@ -0,0 +1,147 @@
+import threading
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+
+from app.cities.cache import CityCache
+from app.cities.events import (
+    CITY_CHANGES_CHANNEL,
+    ORIGIN,
+    ChangeLogPosition,
+    CityChange,
+    CityChangeKind,
+    CityChangeListener,
+    fetch_changed_city_uuids,
+    parse_notification,
+    read_change_log_position,
+    subscribe,
+)
+from app.cities.exceptions import ChangeLogTruncatedException
+from app.cities.schemas import CityInDBWithAllyForce
+from app.config import settings
+from app.database import get_engine
+
+
+def make_city(allied_cities=None) -> CityInDBWithAllyForce:
+    """Build a cached city value."""
+    return CityInDBWithAllyForce(
+        city_uuid=uuid4(),
+        name="Testing City",
+        beauty="Average",
+        population=100,
+        geo_location_latitude=12.432,
+        geo_location_longitude=54.234,
+        allied_cities=allied_cities or [],
+        allied_power=100,
+    )
+
+
+def test_cache_evicts_allied_cities() -> None:
+    """Test evicting a city also evicts cached cities allied with it."""
+
+    cache = CityCache(max_size=10, ttl_seconds=60)
+    city_a = make_city()
+    city_b = make_city([city_a.city_uuid])
+
+    cache.put(city_a, cache.generation())
+    cache.put(city_b, cache.generation())
+    assert len(cache) == 2
+
+    cache.evict(str(city_a.city_uuid))
+
+    assert cache.get(str(city_a.city_uuid)) is None
+    assert cache.get(str(city_b.city_uuid)) is None
+
+
+def test_cache_drops_fill_that_raced_an_eviction() -> None:
+    """Test a value read before an eviction is not cached afterwards."""
+
+    cache = CityCache(max_size=10, ttl_seconds=60)
+    city = make_city()
+
+    generation = cache.generation()
+    cache.evict(str(city.city_uuid))
+    cache.put(city, generation)
+
+    assert cache.get(str(city.city_uuid)) is None
+
+
+def test_cache_is_bounded() -> None:
+    """Test the least recently used city is evicted when the cache is full."""
+
+    cache = CityCache(max_size=2, ttl_seconds=60)
+    city_a, city_b, city_c = make_city(), make_city(), make_city()
+
+    cache.put(city_a, cache.generation())
+    cache.put(city_b, cache.generation())
+    cache.get(str(city_a.city_uuid))
+    cache.put(city_c, cache.generation())
+
+    assert cache.get(str(city_a.city_uuid)) == city_a
+    assert cache.get(str(city_b.city_uuid)) is None
+    assert cache.get(str(city_c.city_uuid)) == city_c
+
+
+def test_parse_notification() -> None:
+    """Test change payloads are parsed and malformed ones ignored."""
+
+    city_uuid = str(uuid4())
+    payload = f'{{"city_uuid": "{city_uuid}", "kind": "deleted", "origin": "worker"}}'
+
+    assert parse_notification(payload) == (
+        "worker",
+        CityChange(city_uuid, CityChangeKind.deleted),
+    )
+    assert parse_notification('{"kind": "deleted"}') is None
+
+
+def test_listener_receives_changes_from_other_processes(db_session) -> None:
+    """Test the listener dispatches changes notified by another process."""
+
+    city_uuid = str(uuid4())
+    received = threading.Event()
+
+    def on_change(change: CityChange) -> None:
+        if change.city_uuid == city_uuid:
+            received.set()
+
+    subscribe(on_change, lambda: None)
+
+    listener = CityChangeListener(get_engine(), poll_seconds=0.1)
+    listener.start()
+    try:
+        # Give the listener time to issue LISTEN before notifying
+        threading.Event().wait(0.5)
+
+        for origin in (ORIGIN, "another-worker"):
+            db_session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {
+                    "channel": CITY_CHANGES_CHANNEL,
+                    "payload": (
+                        f'{{"city_uuid": "{city_uuid}", "kind": "updated", '
+                        f'"origin": "{origin}"}}'
+                    ),
+                },
+            )
+            db_session.commit()
+
+        assert received.wait(5)
+    finally:
+        listener.stop(timeout=5)
+
+
+def test_catch_up_from_before_the_retention_is_refused(db_session) -> None:
+    """Test catching up from a position the pruned log may no longer cover fails."""
+
+    with get_engine().connect() as connection:
+        position = read_change_log_position(connection)
+        expired = ChangeLogPosition(
+            position.change_seq,
+            position.taken_at - settings.CHANGE_LOG_RETENTION_HOURS * 3600,
+        )
+
+        assert fetch_changed_city_uuids(connection, position) == []
+        with pytest.raises(ChangeLogTruncatedException):
+            fetch_changed_city_uuids(connection, expired)
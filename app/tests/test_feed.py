@@ -0,0 +1,169 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.cities import feed
+from app.cities.events import (
+    ChangeLogEntry,
+    CityChange,
+    CityChangeKind,
+    fetch_change_log,
+    prune_change_log,
+    publish_city_changes,
+)
+from app.database import get_engine
+
+
+def make_entry(seq: int) -> ChangeLogEntry:
+    """Build a change log entry."""
+    return ChangeLogEntry(
+        seq, str(uuid4()), CityChangeKind.updated, datetime.now(timezone.utc)
+    )
+
+
+def test_signal_wakes_waiter_from_another_thread() -> None:
+    """Test a change seen on another thread wakes a waiting request."""
+
+    async def wait_for_change() -> bool:
+        with feed.change_feed_signal.waiter() as changed:
+            threading.Timer(0.05, feed.change_feed_signal.notify).start()
+            await asyncio.wait_for(changed.wait(), 5)
+            return changed.is_set()
+
+    assert asyncio.run(wait_for_change())
+
+
+def test_stream_resumes_after_last_sent_seq(monkeypatch) -> None:
+    """Test the event stream reads on from the last sequence number it sent."""
+
+    reads = []
+    pages = [[make_entry(4), make_entry(7)], [make_entry(9)]]
+
+    def read_changes(request, since, limit):
+        reads.append(since)
+        return (since if since is not None else 3), pages.pop(0)
+
+    monkeypatch.setattr(feed, "read_changes", read_changes)
+
+    async def first_events() -> list:
+        stream = feed.stream_changes(None, None, 100)
+        events = [await stream.__anext__() for _ in range(3)]
+        await stream.aclose()
+        return events
+
+    retry, first, second = asyncio.run(first_events())
+
+    assert retry.startswith("retry: ")
+    assert [line for line in first.splitlines() if line.startswith("id: ")] == [
+        "id: 4",
+        "id: 7",
+    ]
+    assert second.startswith("id: 9\nevent: updated\ndata: {")
+    assert reads == [None, 7]
+
+
+def test_change_feed_long_poll(client) -> None:
+    """Test the JSON feed pages through changes by sequence number."""
+
+    response = client.get("api/v1/cities/changes")
+    assert response.json() == {"changes": [], "last_seq": 0}
+
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing City A",
+            "beauty": "Average",
+            "population": 1000,
+            "geo_location_latitude": 12.432,
+            "geo_location_longitude": 54.234,
+        },
+    )
+    city_uuid = response.json()["city_uuid"]
+    client.put(f"api/v1/cities/{city_uuid}", json={"population": 2000})
+
+    page = client.get("api/v1/cities/changes", params={"since": 0}).json()
+    assert [(change["city_uuid"], change["kind"]) for change in page["changes"]] == [
+        (city_uuid, "created"),
+        (city_uuid, "updated"),
+    ]
+    assert page["last_seq"] == page["changes"][-1]["seq"]
+
+    client.delete(f"api/v1/cities/{city_uuid}")
+    page = client.get(
+        "api/v1/cities/changes", params={"since": page["last_seq"], "wait": 1}
+    ).json()
+    assert [change["kind"] for change in page["changes"]] == ["deleted"]
+
+    response = client.get("api/v1/cities/changes", headers={"Accept": "text/csv"})
+    assert response.status_code == 406
+
+
+def test_change_log_holds_back_changes_behind_open_writers(db_session) -> None:
+    """Test a change is only read once every transaction begun before it ended."""
+
+    early = CityChange(str(uuid4()), CityChangeKind.created)
+    late = CityChange(str(uuid4()), CityChangeKind.created)
+
+    with Session(get_engine()) as early_writer, Session(get_engine()) as late_writer:
+        # The early writer takes its transaction id first and commits last.
+        early_writer.execute(text("SELECT pg_current_xact_id()"))
+        late_writer.execute(text("SELECT pg_current_xact_id()"))
+        publish_city_changes(late_writer, [late])
+        publish_city_changes(early_writer, [early])
+        late_writer.commit()
+
+        with get_engine().connect() as connection:
+            assert fetch_change_log(connection, 0, 10) == []
+
+        early_writer.commit()
+
+    with get_engine().connect() as connection:
+        entries = fetch_change_log(connection, 0, 10)
+        assert [entry.city_uuid for entry in entries] == [
+            early.city_uuid,
+            late.city_uuid,
+        ]
+        assert entries[0].seq > entries[1].seq
+        assert fetch_change_log(connection, entries[0].seq, 10) == entries[1:]
+        assert fetch_change_log(connection, entries[1].seq, 10) == []
+
+
+def test_change_feed_answers_410_after_pruning(client, db_session) -> None:
+    """Test a position whose entries were pruned asks the client to resync."""
+
+    for name in ("Testing City A", "Testing City B"):
+        client.post(
+            "api/v1/cities",
+            json={
+                "name": name,
+                "beauty": "Average",
+                "population": 1000,
+                "geo_location_latitude": 12.432,
+                "geo_location_longitude": 54.234,
+            },
+        )
+    first, second = client.get("api/v1/cities/changes", params={"since": 0}).json()[
+        "changes"
+    ]
+    db_session.execute(
+        text(
+            """
+            UPDATE city_change_log SET changed_at = now() - interval '2 hours'
+            WHERE seq = :seq
+            """
+        ),
+        {"seq": first["seq"]},
+    )
+    db_session.commit()
+
+    assert prune_change_log(get_engine(), retention_hours=1) == 1
+
+    response = client.get("api/v1/cities/changes", params={"since": first["seq"]})
+    assert response.status_code == 410
+
+    page = client.get("api/v1/cities/changes", params={"since": second["seq"]}).json()
+    assert page == {"changes": [], "last_seq": second["seq"]}
@@ -0,0 +1,223 @@
+import gzip
+import json
+from decimal import Decimal
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+
+import msgpack
+import pyarrow as pa
+import pytest
+import zstandard
+
+from app.cities import formats
+from app.cities.exceptions import InvalidFieldsException
+from app.cities.schemas import EXPORT_FIELDS, city_fields_model, parse_fields
+
+
+def make_row(allied_cities=()) -> SimpleNamespace:
+    """Build a city row as returned by the list query."""
+    return SimpleNamespace(
+        city_uuid=uuid4(),
+        name="Testing City",
+        beauty="Average",
+        population=52352,
+        geo_location_latitude=Decimal("12.432000"),
+        geo_location_longitude=Decimal("-54.234001"),
+        allied_cities=list(allied_cities),
+    )
+
+
+def test_negotiate_media_type() -> None:
+    """Test the Accept header picks a format, honoring quality values."""
+
+    offered = formats.LIST_MEDIA_TYPES
+    assert formats.negotiate_media_type(None, offered) == formats.JSON
+    assert formats.negotiate_media_type("*/*", offered) == formats.JSON
+    assert formats.negotiate_media_type("application/x-msgpack", offered) == (
+        formats.MSGPACK
+    )
+    assert (
+        formats.negotiate_media_type(
+            "application/json;q=0.5, application/vnd.apache.arrow.stream", offered
+        )
+        == formats.ARROW
+    )
+    assert formats.negotiate_media_type("text/csv", offered) is None
+
+
+def test_negotiate_encoding() -> None:
+    """Test zstd is used only when asked for and gzip otherwise."""
+
+    assert formats.negotiate_encoding(None) is None
+    assert formats.negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert formats.negotiate_encoding("gzip, zstd") == "zstd"
+    assert formats.negotiate_encoding("zstd;q=0.1, gzip") == "gzip"
+    assert formats.negotiate_encoding("*") == "gzip"
+    assert formats.negotiate_encoding("gzip;q=0") is None
+
+
+def test_arrow_page_round_trips() -> None:
+    """Test an Arrow page keeps UUIDs as bytes and coordinates as exact decimals."""
+
+    ally = make_row()
+    row = make_row([ally.city_uuid])
+
+    table = pa.ipc.open_stream(
+        formats.encode_cities([row, ally], formats.ARROW)
+    ).read_all()
+
+    assert table.num_rows == 2
+    first = table.to_pylist()[0]
+    assert UUID(bytes=first["city_uuid"]) == row.city_uuid
+    assert first["geo_location_longitude"] == Decimal("-54.234001")
+    assert [UUID(bytes=uuid) for uuid in first["allied_cities"]] == [ally.city_uuid]
+
+
+def test_msgpack_page_round_trips() -> None:
+    """Test a MessagePack page decodes to plain values."""
+
+    row = make_row()
+
+    (city,) = msgpack.unpackb(formats.encode_cities([row], formats.MSGPACK))
+
+    assert UUID(bytes=city["city_uuid"]) == row.city_uuid
+    assert city["geo_location_latitude"] == 12.432
+    assert city["beauty"] == "Average"
+
+
+def test_stream_cities_compresses_each_format() -> None:
+    """Test exports decode after compression, one chunk at a time."""
+
+    chunks = [[make_row(), make_row()], [], [make_row()]]
+
+    ndjson = gzip.decompress(
+        b"".join(formats.stream_cities(chunks, formats.NDJSON, "gzip"))
+    )
+    lines = [json.loads(line) for line in ndjson.decode().splitlines()]
+    assert [line["city_uuid"] for line in lines] == [
+        str(row.city_uuid) for chunk in chunks for row in chunk
+    ]
+    assert lines[0]["geo_location_latitude"] == "12.432000"
+
+    arrow = (
+        zstandard.ZstdDecompressor()
+        .decompressobj()
+        .decompress(b"".join(formats.stream_cities(chunks, formats.ARROW, "zstd")))
+    )
+    assert pa.ipc.open_stream(arrow).read_all().num_rows == 3
+
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(b"".join(formats.stream_cities(chunks, formats.MSGPACK, None)))
+    assert len(list(unpacker)) == 3
+
+
+def test_list_cities_as_arrow(client) -> None:
+    """Test the list and export endpoints honor the Accept header."""
+
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing City A",
+            "beauty": "Average",
+            "population": 52352,
+            "geo_location_latitude": 12.432,
+            "geo_location_longitude": 54.234,
+        },
+    )
+    city_uuid = response.json()["city_uuid"]
+
+    response = client.get("api/v1/cities/", headers={"Accept": formats.ARROW})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == formats.ARROW
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert str(UUID(bytes=table.column("city_uuid")[0].as_py())) == city_uuid
+
+    response = client.get("api/v1/cities/", headers={"Accept": "text/csv"})
+    assert response.status_code == 406
+
+    response = client.get("api/v1/cities/export", headers={"Accept": formats.NDJSON})
+    assert response.status_code == 200
+    assert [json.loads(line)["city_uuid"] for line in response.text.splitlines()] == [
+        city_uuid
+    ]
+
+
+def test_parse_fields() -> None:
+    """Test fields keep a canonical order and unknown fields are rejected."""
+
+    assert parse_fields(None) is None
+    assert parse_fields(" population,city_uuid,population ") == (
+        "city_uuid",
+        "population",
+    )
+    assert city_fields_model(parse_fields("name,city_uuid")) is city_fields_model(
+        parse_fields("city_uuid,name")
+    )
+    with pytest.raises(InvalidFieldsException):
+        parse_fields("name,secret")
+    with pytest.raises(InvalidFieldsException):
+        parse_fields("allied_power", EXPORT_FIELDS)
+    with pytest.raises(InvalidFieldsException):
+        parse_fields(",")
+
+
+def test_encode_sparse_fields() -> None:
+    """Test each format encodes just the requested fields."""
+
+    row = {"city_uuid": uuid4(), "population": 10}
+    fields = ("city_uuid", "population")
+
+    table = pa.ipc.open_stream(
+        formats.encode_cities([row], formats.ARROW, fields)
+    ).read_all()
+    assert table.column_names == list(fields)
+
+    (city,) = msgpack.unpackb(formats.encode_cities([row], formats.MSGPACK, fields))
+    assert city == {"city_uuid": row["city_uuid"].bytes, "population": 10}
+
+    ndjson = b"".join(formats.stream_cities([[row]], formats.NDJSON, None, fields))
+    assert json.loads(ndjson) == {"city_uuid": str(row["city_uuid"]), "population": 10}
+
+
+def test_list_cities_with_fields(client) -> None:
+    """Test sparse fieldsets on the list, read and export endpoints."""
+
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing City A",
+            "beauty": "Average",
+            "population": 52352,
+            "geo_location_latitude": 12.432,
+            "geo_location_longitude": 54.234,
+        },
+    )
+    city_uuid = response.json()["city_uuid"]
+
+    response = client.get("api/v1/cities/", params={"fields": "name,city_uuid"})
+    assert response.json() == [{"city_uuid": city_uuid, "name": "Testing City A"}]
+
+    response = client.get(
+        "api/v1/cities/",
+        params={"fields": "population", "include": "allied_power"},
+        headers={"Accept": formats.MSGPACK},
+    )
+    assert msgpack.unpackb(response.content) == [
+        {"population": 52352, "allied_power": 52352}
+    ]
+
+    response = client.get(
+        f"api/v1/cities/{city_uuid}", params={"fields": "allied_power"}
+    )
+    assert response.json() == {"allied_power": 52352}
+
+    response = client.get(
+        "api/v1/cities/export",
+        params={"fields": "city_uuid"},
+        headers={"Accept": formats.NDJSON},
+    )
+    assert json.loads(response.text) == {"city_uuid": city_uuid}
+
+    assert client.get("api/v1/cities/", params={"fields": "secret"}).status_code == 400
+    response = client.get("api/v1/cities/export", params={"fields": "allied_power"})
+    assert response.status_code == 400
@@ -0,0 +1,106 @@
+from sqlalchemy import text
+
+from app.cities import jobs
+from app.cities.jobs import JobWorkerPool
+from app.config import settings
+from app.database import get_engine
+
+
+def make_pool(max_attempts: int = 5) -> JobWorkerPool:
+    """Build a pool that is driven by hand with run_once."""
+    return JobWorkerPool(
+        workers=0,
+        batch_size=100,
+        poll_seconds=0.1,
+        lease_seconds=60,
+        max_attempts=max_attempts,
+    )
+
+
+def queued_jobs() -> dict:
+    with get_engine().connect() as connection:
+        rows = connection.execute(
+            text("SELECT city_uuid, status, attempts FROM city_job")
+        ).fetchall()
+    return {str(row.city_uuid): (row.status, row.attempts) for row in rows}
+
+
+def stored_power() -> dict:
+    with get_engine().connect() as connection:
+        rows = connection.execute(
+            text("SELECT city_uuid, allied_power FROM city_allied_power")
+        ).fetchall()
+    return {str(row.city_uuid): row.allied_power for row in rows}
+
+
+def create_hub_with_ally(client) -> tuple:
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing Hub",
+            "beauty": "Average",
+            "population": 1000,
+            "geo_location_latitude": 12.432,
+            "geo_location_longitude": 54.234,
+        },
+    )
+    hub_uuid = response.json()["city_uuid"]
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing Ally",
+            "beauty": "Average",
+            "population": 10,
+            "geo_location_latitude": 12.5,
+            "geo_location_longitude": 54.3,
+            "allied_cities": [hub_uuid],
+        },
+    )
+    return hub_uuid, response.json()["city_uuid"]
+
+
+def test_hub_update_recomputes_its_allies(client, monkeypatch) -> None:
+    """Test changing a hub queues its allies once and workers store their power."""
+
+    monkeypatch.setattr(settings, "JOB_QUEUE_ENABLED", True)
+    hub_uuid, ally_uuid = create_hub_with_ally(client)
+
+    assert set(queued_jobs()) == {hub_uuid, ally_uuid}
+    pool = make_pool()
+    assert pool.run_once() == 2
+    assert queued_jobs() == {}
+    assert stored_power() == {hub_uuid: 1010, ally_uuid: 1010}
+
+    response = client.put(f"api/v1/cities/{hub_uuid}/", json={"population": 2000})
+    assert response.status_code == 200
+    assert set(queued_jobs()) == {hub_uuid, ally_uuid}
+
+    # Queued recomputes are not served; the power is computed on the request.
+    assert client.get(f"api/v1/cities/{ally_uuid}").json()["allied_power"] == 2010
+
+    pool.run_once()
+    assert stored_power()[ally_uuid] == 2010
+    assert client.get(f"api/v1/cities/{ally_uuid}").json()["allied_power"] == 2010
+    assert pool.stats()["processed"] == 4
+
+
+def test_failed_jobs_are_retried_then_kept(client, monkeypatch) -> None:
+    """Test a failing job is rescheduled and marked failed after its last attempt."""
+
+    monkeypatch.setattr(settings, "JOB_QUEUE_ENABLED", True)
+    hub_uuid, ally_uuid = create_hub_with_ally(client)
+
+    def fail(connection, city_uuids):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, jobs.ALLIED_POWER, fail)
+    pool = make_pool(max_attempts=1)
+    pool.run_once()
+
+    assert queued_jobs() == {hub_uuid: ("failed", 1), ally_uuid: ("failed", 1)}
+    assert pool.stats()["failed_jobs"] == 2
+
+    with get_engine().connect() as connection:
+        stats = jobs.read_queue_stats(connection)
+    assert stats["pending"] == 0
+    assert stats["failed"] == 2
@@ -0,0 +1,85 @@
+import io
+import json
+import logging
+
+from app.utils.logger import (
+    BatchingLogWriter,
+    BatchingQueueHandler,
+    DebugSampler,
+    StructuredFormatter,
+    parse_log_levels,
+)
+
+
+def build_logger(writer: BatchingLogWriter, name: str) -> logging.Logger:
+    """Build a logger that only writes through the given writer."""
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [BatchingQueueHandler(writer)]
+    return logger
+
+
+def test_writer_flushes_queued_records_on_stop() -> None:
+    """Test records logged while the writer runs are all written by stop()."""
+
+    stream = io.StringIO()
+    writer = BatchingLogWriter(stream, logging.Formatter("%(message)s"), 1000)
+    logger = build_logger(writer, "test.logger.flush")
+
+    writer.start()
+    for index in range(500):
+        logger.info("record %s", index)
+    writer.stop()
+
+    lines = stream.getvalue().splitlines()
+
+    assert len(lines) == 500
+    assert lines[0] == "record 0"
+    assert lines[-1] == "record 499"
+
+
+def test_writer_writes_synchronously_when_not_started() -> None:
+    """Test records are not lost when the background thread never started."""
+
+    stream = io.StringIO()
+    writer = BatchingLogWriter(stream, logging.Formatter("%(message)s"), 1000)
+    logger = build_logger(writer, "test.logger.sync")
+
+    logger.warning("written right away")
+
+    assert stream.getvalue() == "written right away\n"
+
+
+def test_structured_formatter_includes_extra_fields() -> None:
+    """Test JSON output carries the message and the extra fields of the record."""
+
+    stream = io.StringIO()
+    writer = BatchingLogWriter(stream, StructuredFormatter(), 1000)
+    logger = build_logger(writer, "test.logger.json")
+
+    logger.info("city %s created", "Berlin", extra={"city_uuid": "abc"})
+
+    record = json.loads(stream.getvalue())
+
+    assert record["message"] == "city Berlin created"
+    assert record["level"] == "INFO"
+    assert record["city_uuid"] == "abc"
+
+
+def test_debug_sampler() -> None:
+    """Test DEBUG records are sampled and other levels always kept."""
+
+    sampler = DebugSampler(rate=0.0)
+
+    assert not sampler.filter(logging.makeLogRecord({"levelno": logging.DEBUG}))
+    assert sampler.filter(logging.makeLogRecord({"levelno": logging.INFO}))
+
+
+def test_parse_log_levels() -> None:
+    """Test per-module levels are parsed from configuration."""
+
+    assert parse_log_levels("sqlalchemy.engine=info, app.cities=DEBUG,") == {
+        "sqlalchemy.engine": logging.INFO,
+        "app.cities": logging.DEBUG,
+    }
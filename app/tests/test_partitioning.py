@@ -0,0 +1,27 @@
+from app.cities.partitioning import read_city_partitions
+from app.database import get_engine
+from app.tests.conftest import create_city, run_conversion
+
+
+def test_convert_to_hash_partitions(client, db_session) -> None:
+    """Test the conversion keeps every row and the API works on the partitions."""
+
+    city_a = create_city(client, "Testing City A")["city_uuid"]
+    city_b = create_city(client, "Testing City B", allies=[city_a])["city_uuid"]
+    city_c = create_city(client, "Testing City C", allies=[city_a, city_b])["city_uuid"]
+    db_session.rollback()
+
+    partitions = run_conversion(
+        "app.cities.partitioning", "partition_city_tables", CITY_TABLE_PARTITIONS="4"
+    )
+
+    assert partitions == "4"
+    with get_engine().connect() as connection:
+        assert read_city_partitions(connection) == 4
+
+    allies = client.get(f"api/v1/cities/{city_a}").json()["allied_cities"]
+    assert sorted(allies) == sorted([city_b, city_c])
+
+    assert client.delete(f"api/v1/cities/{city_c}").status_code == 204
+    assert client.get(f"api/v1/cities/{city_a}").json()["allied_cities"] == [city_b]
+    assert client.get(f"api/v1/cities/{city_b}").json()["allied_cities"] == [city_a]
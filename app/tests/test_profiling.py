@@ -0,0 +1,107 @@
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.config import settings
+from app.utils import profiling
+from app.utils.profiling import (
+    ProfiledRoute,
+    ProfilingMiddleware,
+    RequestProfile,
+    attach_sql_timing,
+    profile_store,
+)
+
+
+def busy_work() -> int:
+    """Do some work that shows up in the profile."""
+    return sum(index * index for index in range(10000))
+
+
+def build_application(sample_rate: float = 0.0) -> FastAPI:
+    """Build an application with one profiled route."""
+    router = APIRouter(route_class=ProfiledRoute)
+
+    @router.get("/work")
+    def work():
+        return {"result": busy_work()}
+
+    application = FastAPI()
+    application.include_router(router)
+    application.add_middleware(ProfilingMiddleware, sample_rate=sample_rate)
+    return application
+
+
+def test_admin_requested_profile(monkeypatch) -> None:
+    """Test an admin can ask for a request to be profiled."""
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+    with TestClient(build_application()) as client:
+        response = client.get(
+            "/work", headers={"X-Profile": "1", "X-Admin-Token": "secret"}
+        )
+
+    assert response.status_code == 200
+    profile = profile_store.get(response.headers["X-Profile-Id"])
+
+    assert profile.path == "/work"
+    assert 0 < profile.endpoint_ms <= profile.wall_ms
+    assert "busy_work" in profile.stats
+
+
+def test_profile_requires_admin_token(monkeypatch) -> None:
+    """Test the profile header is ignored without the admin token."""
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+    with TestClient(build_application()) as client:
+        response = client.get("/work", headers={"X-Profile": "1"})
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+
+def test_sampled_profile(monkeypatch) -> None:
+    """Test requests are profiled by sampling without any header."""
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+
+    with TestClient(build_application(sample_rate=1.0)) as client:
+        response = client.get("/work")
+
+    assert "X-Profile-Id" in response.headers
+
+
+def test_routes_are_not_wrapped_when_disabled(monkeypatch) -> None:
+    """Test profiling adds nothing to the endpoints when it is disabled."""
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", False)
+
+    route = ProfiledRoute("/work", busy_work)
+
+    assert route.endpoint is busy_work
+
+
+def test_failed_statements_leave_no_timing_behind() -> None:
+    """Test a failed statement does not leave its start time on the connection."""
+
+    engine = create_engine("sqlite://")
+    attach_sql_timing(engine)
+    profile = RequestProfile("GET", "/work")
+    token = profiling._active_profile.set(profile)
+    try:
+        with engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute(text("SELECT * FROM missing"))
+            connection.execute(text("SELECT 1"))
+            assert "profile_sql_started" not in connection.info
+    finally:
+        profiling._active_profile.reset(token)
+
+    assert profile.sql_statements == 1
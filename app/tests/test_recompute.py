@@ -0,0 +1,104 @@
+from sqlalchemy import text
+
+from app.cities.recompute import (
+    compute_partition,
+    map_partitions,
+    recompute_all_allied_power,
+)
+from app.database import get_engine
+from app.utils.common import calculate_allied_power
+
+
+def make_partition(offset: int) -> list:
+    """Build a partition of two cities with an ally each."""
+    return [
+        (f"city-{offset}", 12.432, 54.234, 1000, [(12.5, 54.3, 10)]),
+        (f"city-{offset + 1}", 52.5, 13.4, 500, [(-33.9, 151.2, 400)]),
+    ]
+
+
+def test_compute_partition_matches_allied_power() -> None:
+    """Test the partition result is population plus the allies' contributions."""
+
+    (first, second) = compute_partition(make_partition(0))
+
+    assert first == ("city-0", 1010)
+    assert second == (
+        "city-1",
+        500 + calculate_allied_power((52.5, 13.4), [(-33.9, 151.2, 400)]),
+    )
+
+
+def test_map_partitions_keeps_order_across_processes() -> None:
+    """Test results from worker processes come back in partition order."""
+
+    partitions = [make_partition(offset) for offset in range(0, 12, 2)]
+
+    results = list(map_partitions(partitions, workers=2))
+
+    assert results == [compute_partition(partition) for partition in partitions]
+
+
+def test_recompute_stores_power_of_every_city(client) -> None:
+    """Test the full recompute writes the power the API computes."""
+
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing City A",
+            "beauty": "Average",
+            "population": 1000,
+            "geo_location_latitude": 12.432,
+            "geo_location_longitude": 54.234,
+        },
+    )
+    city_a = response.json()["city_uuid"]
+    response = client.post(
+        "api/v1/cities",
+        json={
+            "name": "Testing City B",
+            "beauty": "Average",
+            "population": 10,
+            "geo_location_latitude": -33.9,
+            "geo_location_longitude": 151.2,
+            "allied_cities": [city_a],
+        },
+    )
+    city_b = response.json()["city_uuid"]
+
+    reports, open_snapshots = [], []
+
+    def record_progress(progress) -> None:
+        with get_engine().connect() as connection:
+            open_snapshots.append(
+                connection.execute(
+                    text(
+                        """
+                        SELECT count(*) FROM pg_stat_activity
+                        WHERE datname = current_database()
+                          AND backend_xmin IS NOT NULL
+                          AND pid <> pg_backend_pid()
+                        """
+                    )
+                ).scalar()
+            )
+        reports.append(progress)
+
+    finished = recompute_all_allied_power(
+        workers=1, partition_size=1, progress=record_progress
+    )
+
+    assert finished.cities_done == finished.cities_total == 2
+    assert [report.cities_done for report in reports] == [1, 2]
+    # No read transaction is held open between partitions.
+    assert open_snapshots == [0, 0]
+    with get_engine().connect() as connection:
+        stored = dict(
+            connection.execute(
+                text("SELECT city_uuid::text, allied_power FROM city_allied_power")
+            ).fetchall()
+        )
+    assert stored == {
+        city: client.get(f"api/v1/cities/{city}").json()["allied_power"]
+        for city in (city_a, city_b)
+    }
@@ -175,3 +175,35 @@ def test_retrieve_all_cities(client) -> None:
     loaded_cities_response = cities_response.json()
 
     assert len(loaded_cities_response) == 3
+
+
+def test_retrieve_all_cities_with_allied_power(client) -> None:
+    """Test the list computes the same allied power as the single city route."""
+
+    city_uuids = []
+    for name, latitude, longitude in (
+        ("Testing City A", 52.531677, 13.381777),
+        ("Testing City B", 53.551086, 9.993682),
+        ("Testing City C", -33.9, 151.2),
+    ):
+        response = client.post(
+            "api/v1/cities",
+            json={
+                "name": name,
+                "beauty": "Average",
+                "population": 1000,
+                "geo_location_latitude": latitude,
+                "geo_location_longitude": longitude,
+                "allied_cities": city_uuids,
+            },
+        )
+        assert response.status_code == 201
+        city_uuids.append(response.json()["city_uuid"])
+
+    cities = client.get("api/v1/cities", params={"include": "allied_power"}).json()
+
+    assert [city["allied_power"] for city in cities] == [
+        client.get(f"api/v1/cities/{city['city_uuid']}").json()["allied_power"]
+        for city in cities
+    ]
+    assert "allied_power" not in client.get("api/v1/cities").json()[0]
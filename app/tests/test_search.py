@@ -0,0 +1,60 @@
+from app.tests.conftest import create_city
+
+
+def test_search_cities_by_prefix(client) -> None:
+    """Test searching cities by a name prefix."""
+
+    berlin = create_city(client, "Berlin", population=3645000)
+    bern = create_city(client, "Bern", population=133000)
+    create_city(client, "Hamburg", population=1841000)
+
+    response = client.get("api/v1/cities/search", params={"q": "berl"})
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    # Bern is only a trigram match, so it ranks after the prefix match.
+    assert [city["city_uuid"] for city in loaded_response] == [
+        berlin["city_uuid"],
+        bern["city_uuid"],
+    ]
+
+
+def test_search_cities_fuzzy_match(client) -> None:
+    """Test searching cities with a misspelled name."""
+
+    hamburg = create_city(client, "Hamburg", population=1841000)
+
+    response = client.get("api/v1/cities/search", params={"q": "Hamburk"})
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    assert loaded_response[0]["city_uuid"] == hamburg["city_uuid"]
+    assert 0 < loaded_response[0]["score"] <= 1
+
+
+def test_search_cities_ranked_by_population(client) -> None:
+    """Test prefix matches are ranked by population when requested."""
+
+    create_city(client, "Springfield", population=1000)
+    large = create_city(client, "Springdale", population=50000)
+
+    response = client.get(
+        "api/v1/cities/search",
+        params={"q": "spring", "rank_by": "population", "limit": 1},
+    )
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    assert len(loaded_response) == 1
+    assert loaded_response[0]["city_uuid"] == large["city_uuid"]
+
+
+def test_search_cities_escapes_wildcards(client) -> None:
+    """Test LIKE wildcards in the query are matched literally."""
+
+    create_city(client, "Berlin", population=3645000)
+
+    response = client.get("api/v1/cities/search", params={"q": "%"})
+
+    assert response.status_code == 200
+    assert response.json() == []
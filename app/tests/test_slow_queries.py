@@ -0,0 +1,106 @@
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import event, text
+
+from app.config import settings
+from app.database import get_engine
+from app.utils.slow_queries import SlowQueryLog, explain_options, slow_query_log
+
+
+def test_slow_query_log_is_bounded() -> None:
+    """Test only the most recent slow statements are kept, newest first."""
+
+    log = SlowQueryLog(threshold_ms=10, max_entries=2, explain=False)
+    for index in range(3):
+        log.record(None, f"SELECT {index}", {}, 20.0, False)
+
+    assert [entry["statement"] for entry in log.entries()] == ["SELECT 2", "SELECT 1"]
+
+
+def test_failed_statements_leave_no_timing_behind() -> None:
+    """Test a statement that never finished does not leave state on the connection."""
+
+    log = SlowQueryLog(threshold_ms=1000, max_entries=2, explain=False)
+    conn = SimpleNamespace(info={}, get_execution_options=dict)
+
+    # The first statement fails, so only the second one finishes.
+    for _ in range(2):
+        log._before_cursor_execute(conn, None, "SELECT 1", {}, None, False)
+    log._after_cursor_execute(conn, None, "SELECT 1", {}, None, False)
+
+    assert conn.info == {}
+
+
+def test_only_plain_reads_are_explained_with_analyze() -> None:
+    """Test writes and locking reads are planned without being run again."""
+
+    assert explain_options("SELECT * FROM city") == "(ANALYZE, BUFFERS) "
+    for statement in (
+        "SELECT city_uuid FROM city WHERE population > 0 ORDER BY city_uuid FOR UPDATE",
+        "SELECT 1 FROM city_job FOR NO KEY UPDATE SKIP LOCKED",
+        "WITH moved AS (DELETE FROM city_job RETURNING *) SELECT count(*) FROM moved",
+        "UPDATE city_job SET status = 'running' WHERE job_id IN (1, 2)",
+        "SELECT pg_advisory_xact_lock(7461204)",
+    ):
+        assert explain_options(statement) == ""
+
+
+def test_slow_query_plan_is_captured(db_session) -> None:
+    """Test a slow statement is recorded with its EXPLAIN ANALYZE plan."""
+
+    log = SlowQueryLog(threshold_ms=20, max_entries=10, explain=True)
+    engine = get_engine()
+    log.attach(engine)
+
+    try:
+        db_session.execute(text("SELECT 1"))
+        db_session.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": 0.05})
+
+        deadline = time.monotonic() + 5
+        while log.entries()[0]["plan"] is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        event.remove(engine, "before_cursor_execute", log._before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", log._after_cursor_execute)
+
+    entries = log.entries()
+
+    assert len(entries) == 1
+    assert "pg_sleep" in entries[0]["statement"]
+    assert "0.05" in entries[0]["parameters"]
+    assert "Execution Time" in entries[0]["plan"]
+
+
+def test_slow_queries_endpoint_requires_admin(client, monkeypatch) -> None:
+    """Test the slow query endpoint is disabled or rejected without the admin token."""
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "")
+    assert client.get("api/v1/admin/slow-queries").status_code == 403
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    response = client.get(
+        "api/v1/admin/slow-queries", headers={"X-Admin-Token": "wrong"}
+    )
+    assert response.status_code == 401
+
+
+def test_slow_queries_endpoint(client, monkeypatch) -> None:
+    """Test the slow query endpoint lists and clears recorded statements."""
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    headers = {"X-Admin-Token": "secret"}
+    slow_query_log.clear()
+    slow_query_log.record(None, "SELECT 1", {"city_uuid": "x"}, 900.0, True)
+
+    response = client.get("api/v1/admin/slow-queries", headers=headers)
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    assert loaded_response[0]["statement"] == "SELECT 1"
+    assert loaded_response[0]["duration_ms"] == 900.0
+
+    response = client.delete("api/v1/admin/slow-queries", headers=headers)
+
+    assert response.status_code == 204
+    assert slow_query_log.entries() == []
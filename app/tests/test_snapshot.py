@@ -0,0 +1,251 @@
+from decimal import Decimal
+from uuid import UUID, uuid4
+
+import numpy as np
+import pytest
+
+from app.cities import snapshot as snapshot_module
+from app.cities.events import CityChange, CityChangeKind
+from app.cities.exceptions import InvalidSnapshotFileException
+from app.cities.snapshot import (
+    BEAUTY_CODES,
+    NO_BEAUTY,
+    CityRow,
+    CitySnapshot,
+    CitySnapshotStore,
+    open_snapshot_file,
+    to_micro_degrees,
+    uuid_key,
+    write_snapshot_file,
+)
+from app.database import get_engine
+
+
+def make_row(name, allied_cities=(), population=100) -> CityRow:
+    """Build a city row."""
+    return CityRow(
+        city_uuid=uuid4(),
+        name=name,
+        beauty="Average",
+        population=population,
+        geo_location_latitude=Decimal("12.432000"),
+        geo_location_longitude=Decimal("-54.234001"),
+        allied_cities=list(allied_cities),
+    )
+
+
+def build_snapshot(rows) -> CitySnapshot:
+    """Build a snapshot in memory, the way CitySnapshot.load lays it out."""
+    rows = sorted(rows, key=lambda row: row.city_uuid.bytes)
+    row_of = {row.city_uuid: index for index, row in enumerate(rows)}
+    names = [row.name.encode() for row in rows]
+    allies = [sorted(row_of[ally] for ally in row.allied_cities) for row in rows]
+    return CitySnapshot(
+        {
+            "uuids": np.array([row.city_uuid.bytes for row in rows], "S16"),
+            "name_order": np.array(
+                sorted(
+                    row_of.values(),
+                    key=lambda i: (rows[i].name, rows[i].city_uuid.bytes),
+                ),
+                np.int32,
+            ),
+            "name_offsets": np.cumsum([0] + [len(name) for name in names]).astype(
+                np.int64
+            ),
+            "name_bytes": np.frombuffer(b"".join(names), np.uint8),
+            "population": np.array([row.population for row in rows], np.int32),
+            "latitude": np.array(
+                [to_micro_degrees(row.geo_location_latitude) for row in rows], np.int32
+            ),
+            "longitude": np.array(
+                [to_micro_degrees(row.geo_location_longitude) for row in rows], np.int32
+            ),
+            "beauty": np.array(
+                [BEAUTY_CODES.get(row.beauty, NO_BEAUTY) for row in rows], np.int8
+            ),
+            "ally_offsets": np.cumsum([0] + [len(a) for a in allies]).astype(np.int64),
+            "ally_rows": np.array([i for a in allies for i in a], np.int32),
+        }
+    )
+
+
+def test_snapshot_round_trips_cities() -> None:
+    """Test a city read from the snapshot matches the row it was built from."""
+
+    city_a = make_row("Ciudad Ñ")
+    city_b = make_row("Berlin", allied_cities=[city_a.city_uuid])
+    snapshot = build_snapshot([city_a, city_b])
+
+    city = snapshot.city_at(snapshot.find_row(city_b.city_uuid))
+
+    assert city.city_uuid == city_b.city_uuid
+    assert city.name == "Berlin"
+    assert city.geo_location_latitude == Decimal("12.432000")
+    assert city.geo_location_longitude == Decimal("-54.234001")
+    assert city.allied_cities == [city_a.city_uuid]
+    assert snapshot.name_at(snapshot.find_row(city_a.city_uuid)) == "Ciudad Ñ"
+    assert snapshot.find_row(uuid4()) is None
+
+
+def test_snapshot_finds_uuid_ending_in_zero_bytes() -> None:
+    """Test UUIDs with trailing zero bytes survive the fixed width column."""
+
+    city = make_row("Zero")._replace(city_uuid=UUID(bytes=b"\x01" + b"\0" * 15))
+    snapshot = build_snapshot([city, make_row("Other")])
+
+    assert (
+        snapshot.city_at(snapshot.find_row(city.city_uuid)).city_uuid == city.city_uuid
+    )
+
+
+def test_store_merges_changed_cities_into_name_order(monkeypatch) -> None:
+    """Test list pages reflect changes fetched since the snapshot was built."""
+
+    cities = [make_row(name) for name in ("Amsterdam", "Cairo", "Lima")]
+    store = CitySnapshotStore(overlay_limit=100)
+    store.install(build_snapshot(cities))
+
+    created = make_row("Boston")
+    renamed = cities[0]._replace(name="Oslo")
+    deleted = cities[2]
+    current = {
+        uuid_key(created.city_uuid): created,
+        uuid_key(renamed.city_uuid): renamed,
+    }
+    monkeypatch.setattr(
+        snapshot_module,
+        "_fetch_city_rows",
+        lambda uuids: {
+            uuid_key(u): current[uuid_key(u)] for u in uuids if uuid_key(u) in current
+        },
+    )
+
+    store.on_change(CityChange(str(created.city_uuid), CityChangeKind.created))
+    store.on_change(CityChange(str(renamed.city_uuid), CityChangeKind.updated))
+    store.on_change(CityChange(str(deleted.city_uuid), CityChangeKind.deleted))
+
+    assert [city.name for city in store.list_cities(0, 10)] == [
+        "Boston",
+        "Cairo",
+        "Oslo",
+    ]
+    assert [city.name for city in store.list_cities(1, 1)] == ["Cairo"]
+    assert [city.name for city in store.list_cities(2, 5)] == ["Oslo"]
+    assert store.get_city(deleted.city_uuid) is None
+    assert store.get_city(renamed.city_uuid).name == "Oslo"
+
+
+def test_store_reloads_when_overlay_is_full(monkeypatch) -> None:
+    """Test a full overlay triggers a snapshot rebuild."""
+
+    cities = [make_row("Amsterdam")]
+    store = CitySnapshotStore(overlay_limit=0)
+    store.install(build_snapshot(cities))
+    reloads = []
+    monkeypatch.setattr(snapshot_module, "_fetch_city_rows", lambda uuids: {})
+    monkeypatch.setattr(store, "reload_in_background", lambda: reloads.append(True))
+
+    store.on_change(CityChange(str(cities[0].city_uuid), CityChangeKind.deleted))
+
+    assert store.list_cities(0, 10) == []
+    assert reloads == [True]
+
+
+def test_snapshot_file_round_trips(tmp_path) -> None:
+    """Test a snapshot file maps back to the same columns and change marker."""
+
+    city_a = make_row("Amsterdam")
+    city_b = make_row("Berlin", allied_cities=[city_a.city_uuid])
+    snapshot = build_snapshot([city_a, city_b])
+    snapshot.change_seq, snapshot.taken_at = 42, 1700000000.5
+    path = str(tmp_path / "cities.snapshot")
+
+    write_snapshot_file(snapshot, path)
+    mapped = open_snapshot_file(path)
+
+    assert (mapped.change_seq, mapped.taken_at) == (42, 1700000000.5)
+    for name, column in snapshot.columns().items():
+        assert np.array_equal(getattr(mapped, name), column)
+        assert not getattr(mapped, name).flags.writeable
+    row = mapped.find_row(city_b.city_uuid)
+    assert mapped.city_at(row).allied_cities == [city_a.city_uuid]
+
+
+def test_snapshot_file_rejects_other_files(tmp_path) -> None:
+    """Test a file that is not a snapshot is rejected instead of mapped."""
+
+    path = tmp_path / "cities.snapshot"
+    path.write_bytes(b"not a snapshot file at all, just some bytes")
+
+    with pytest.raises(InvalidSnapshotFileException):
+        open_snapshot_file(str(path))
+
+
+def test_store_catches_up_from_snapshot_file(tmp_path, monkeypatch) -> None:
+    """Test cities changed after the file was written are re-fetched."""
+
+    cities = [make_row("Amsterdam"), make_row("Berlin")]
+    snapshot = build_snapshot(cities)
+    snapshot.change_seq = 7
+    path = str(tmp_path / "cities.snapshot")
+    write_snapshot_file(snapshot, path)
+
+    renamed = cities[1]._replace(name="Bern")
+    monkeypatch.setattr(
+        snapshot_module,
+        "_fetch_changed_since",
+        lambda change_seq, taken_at: [renamed.city_uuid] if change_seq == 7 else [],
+    )
+    monkeypatch.setattr(
+        snapshot_module,
+        "_fetch_city_rows",
+        lambda uuids: {uuid_key(renamed.city_uuid): renamed},
+    )
+
+    store = CitySnapshotStore(overlay_limit=100)
+    store.load_file(path)
+
+    assert [city.name for city in store.list_cities(0, 10)] == ["Amsterdam", "Bern"]
+
+
+def test_snapshot_loads_cities_from_database(client) -> None:
+    """Test the snapshot built from the database serves what the API returns."""
+
+    response = client.post(
+        "/api/v1/cities/",
+        json={
+            "name": "Testing City A",
+            "beauty": "Average",
+            "population": 52352,
+            "geo_location_latitude": 12.432,
+            "geo_location_longitude": 54.234,
+        },
+    )
+    city_a = response.json()
+    response = client.post(
+        "/api/v1/cities/",
+        json={
+            "name": "Testing City B",
+            "beauty": "Average",
+            "population": 1000,
+            "geo_location_latitude": -1.5,
+            "geo_location_longitude": 2.25,
+            "allied_cities": [city_a["city_uuid"]],
+        },
+    )
+    city_b = response.json()
+
+    with get_engine().connect() as connection:
+        snapshot = CitySnapshot.load(connection)
+
+    store = CitySnapshotStore(overlay_limit=100)
+    store.install(snapshot)
+    listed = [city.model_dump(mode="json") for city in store.list_cities(0, 10)]
+
+    assert [city["city_uuid"] for city in listed] == [
+        city_a["city_uuid"],
+        city_b["city_uuid"],
+    ]
+    assert listed[1]["allied_cities"] == [city_a["city_uuid"]]
+    assert listed[0]["allied_cities"] == [city_b["city_uuid"]]
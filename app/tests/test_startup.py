@@ -0,0 +1,94 @@
+import subprocess
+import sys
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import get_engine
+from app.migrations import SCHEMA_VERSION, migrate_schema
+
+IMPORT_PROBE = """
+import sys
+import time
+
+started = time.perf_counter()
+import app.main
+
+print(time.perf_counter() - started)
+print("geopy" in sys.modules, "psycopg2" in sys.modules)
+"""
+
+
+def test_import_is_lazy_and_within_budget() -> None:
+    """Test importing the application loads no driver or geopy and fits the budget."""
+
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    import_seconds, loaded_modules = result.stdout.splitlines()
+
+    assert loaded_modules == "False False"
+    assert float(import_seconds) < settings.STARTUP_BUDGET_SECONDS
+
+
+def test_migrate_schema_is_idempotent(db_session) -> None:
+    """Test migrating records the version once and is a no-op when repeated."""
+
+    assert migrate_schema(get_engine()) == SCHEMA_VERSION
+    assert migrate_schema(get_engine()) == SCHEMA_VERSION
+
+    versions = db_session.execute(text("SELECT version FROM schema_version")).all()
+
+    assert [row.version for row in versions] == [SCHEMA_VERSION]
+
+
+def test_migrate_adds_search_indexes_to_existing_city_table(db_session) -> None:
+    """Test migrating a database from before name search creates its indexes."""
+
+    migrate_schema(get_engine())
+    db_session.execute(text("DROP INDEX idx_city_name_trgm, idx_city_name_prefix"))
+    db_session.execute(text("UPDATE schema_version SET version = 3"))
+    db_session.commit()
+
+    assert migrate_schema(get_engine()) == SCHEMA_VERSION
+
+    indexes = db_session.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = 'city'")
+    ).scalars()
+    assert {"idx_city_name_trgm", "idx_city_name_prefix"} <= set(indexes)
+
+
+def test_migrate_seeds_stats_from_existing_cities(
+    client, db_session, admin_headers
+) -> None:
+    """Test migrating a database from before the counters fills them from its cities."""
+
+    migrate_schema(get_engine())
+    city_uuid = None
+    for name in ("Testing City A", "Testing City B"):
+        response = client.post(
+            "api/v1/cities",
+            json={
+                "name": name,
+                "beauty": "Average",
+                "population": 1000,
+                "geo_location_latitude": 12.432,
+                "geo_location_longitude": 54.234,
+                "allied_cities": [city_uuid] if city_uuid else [],
+            },
+        )
+        city_uuid = response.json()["city_uuid"]
+    db_session.execute(text("DELETE FROM city_beauty_stats"))
+    db_session.execute(text("DELETE FROM alliance_degree_stats"))
+    db_session.execute(text("UPDATE schema_version SET version = 5"))
+    db_session.commit()
+
+    assert migrate_schema(get_engine()) == SCHEMA_VERSION
+
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.json()["consistent"] is True
+    assert response.json()["counters"]["total_population"] == 2000
+    assert response.json()["counters"]["alliance_degree_distribution"] == {"1": 2}
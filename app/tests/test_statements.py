@@ -0,0 +1,44 @@
+import pytest
+
+from app.utils.statements import Statement, StatementRegistry
+
+
+def test_statement_numbers_parameters_in_order() -> None:
+    """Test named parameters become positional ones, reused names share a slot."""
+
+    statement = Statement(
+        "city_test", "SELECT :b::text, :a, :b FROM city WHERE name = :a;"
+    )
+
+    assert statement.parameters == ["b", "a"]
+    assert statement.prepare_sql == (
+        "PREPARE city_test AS SELECT $1::text, $2, $1 FROM city WHERE name = $2"
+    )
+    assert str(statement.execute_text) == "EXECUTE city_test(:b, :a)"
+
+
+def test_registry_rejects_duplicate_names() -> None:
+    """Test two statements cannot share a name."""
+
+    registry = StatementRegistry(prepared=True)
+    registry.register("city_test", "SELECT 1")
+
+    with pytest.raises(ValueError):
+        registry.register("city_test", "SELECT 2")
+
+
+def test_registry_prepares_once_per_connection(db_session) -> None:
+    """Test a prepared statement is prepared once and then executed by name."""
+
+    registry = StatementRegistry(prepared=True)
+    statement = registry.register(
+        "city_test_count", "SELECT count(*) FROM city WHERE population >= :population"
+    )
+
+    first = registry.execute(db_session, statement, {"population": 0}).scalar()
+    second = registry.execute(db_session, statement, {"population": 0}).scalar()
+
+    assert first == second == 0
+    assert registry.stats() == [
+        {"name": "city_test_count", "executions": 2, "prepares": 1, "prepared": True}
+    ]
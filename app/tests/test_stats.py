@@ -0,0 +1,164 @@
+import threading
+
+from sqlalchemy import text
+
+from app.cities import services
+from app.cities.schemas import CityCreate
+from app.cities.services import CityService
+from app.database import SessionLocal, get_engine
+from app.tests.conftest import city_payload, create_city
+
+
+def test_stats_after_create(client) -> None:
+    """Test the statistics counters are kept up to date when creating cities."""
+
+    city_a = create_city(client, "Testing City A", "Average", 100)
+    city_b = create_city(client, "Testing City B", "Ugly", 300)
+    create_city(
+        client,
+        "Testing City C",
+        "Average",
+        200,
+        [city_a["city_uuid"], city_b["city_uuid"]],
+    )
+
+    response = client.get("api/v1/cities/stats")
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    assert loaded_response["total_cities"] == 3
+    assert loaded_response["total_population"] == 600
+    assert loaded_response["average_population"] == 200
+    assert loaded_response["cities_by_beauty"] == {
+        "Ugly": 1,
+        "Average": 2,
+        "Gorgeous": 0,
+    }
+    assert loaded_response["alliance_degree_distribution"] == {"1": 2, "2": 1}
+
+
+def test_stats_after_update_and_delete(client) -> None:
+    """Test the statistics counters are kept up to date when updating and deleting cities."""
+
+    city_a = create_city(client, "Testing City A", "Average", 100)
+    city_b = create_city(client, "Testing City B", "Ugly", 300)
+    city_c = create_city(
+        client,
+        "Testing City C",
+        "Average",
+        200,
+        [city_a["city_uuid"], city_b["city_uuid"]],
+    )
+
+    response = client.put(
+        f"api/v1/cities/{city_b['city_uuid']}",
+        json={"beauty": "Gorgeous", "population": 500},
+    )
+    assert response.status_code == 200
+
+    response = client.delete(f"api/v1/cities/{city_c['city_uuid']}")
+    assert response.status_code == 204
+
+    response = client.get("api/v1/cities/stats")
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    assert loaded_response["total_cities"] == 2
+    assert loaded_response["total_population"] == 600
+    assert loaded_response["cities_by_beauty"] == {
+        "Ugly": 0,
+        "Average": 1,
+        "Gorgeous": 1,
+    }
+    assert loaded_response["alliance_degree_distribution"] == {"0": 2}
+
+
+def test_stats_reconcile(client, db_session, admin_headers) -> None:
+    """Test reconciling detects drifted counters and repairs them."""
+
+    create_city(client, "Testing City A", "Average", 100)
+
+    response = client.post("api/v1/cities/stats/reconcile", params={"repair": True})
+    assert response.status_code == 401
+
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["consistent"] is True
+
+    db_session.execute(text("UPDATE city_beauty_stats SET city_count = 7"))
+    db_session.commit()
+
+    response = client.post(
+        "api/v1/cities/stats/reconcile",
+        params={"repair": True},
+        headers=admin_headers,
+    )
+    loaded_response = response.json()
+
+    assert response.status_code == 200
+    assert loaded_response["consistent"] is False
+    assert loaded_response["repaired"] is True
+    assert loaded_response["ground_truth"]["total_cities"] == 1
+
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.json()["consistent"] is True
+
+
+def test_stats_after_concurrent_creates(client, db_session, admin_headers) -> None:
+    """Test concurrent creates allied to the same city keep the counters exact."""
+
+    city_a = create_city(client, "Testing City A", "Average", 100)
+    db_session.rollback()
+
+    errors = []
+
+    def create(name: str) -> None:
+        session = SessionLocal(bind=get_engine())
+        try:
+            CityService(session).create_city(
+                CityCreate(**city_payload(name, "Ugly", 10, [city_a["city_uuid"]]))
+            )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [
+        threading.Thread(target=create, args=(f"Testing City {index}",))
+        for index in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.json()["consistent"] is True
+    degrees = client.get("api/v1/cities/stats").json()["alliance_degree_distribution"]
+    assert degrees == {"1": 8, "8": 1}
+
+
+def test_stats_reconcile_ignores_writes_during_the_check(
+    client, db_session, monkeypatch, admin_headers
+) -> None:
+    """Test a write committed while the check runs is not reported as drift."""
+
+    create_city(client, "Testing City A", "Average", 100)
+    fetch_ground_truth_stats = services.fetch_ground_truth_stats
+
+    def fetch_after_a_write(db):
+        session = SessionLocal(bind=get_engine())
+        try:
+            CityService(session).create_city(
+                CityCreate(**city_payload("Testing City B", "Ugly", 10))
+            )
+        finally:
+            session.close()
+        return fetch_ground_truth_stats(db)
+
+    monkeypatch.setattr(services, "fetch_ground_truth_stats", fetch_after_a_write)
+
+    response = client.post("api/v1/cities/stats/reconcile", headers=admin_headers)
+    assert response.json()["consistent"] is True
+    assert response.json()["counters"]["total_cities"] == 1
@@ -0,0 +1,222 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from starlette.responses import JSONResponse
+
+from app.config import settings
+
+READ = "read"
+WRITE = "write"
+BULK = "bulk"
+
+# Cities routes holding a connection for long, whatever their method.
+BULK_PATHS = (
+    "/cities/export",
+    "/cities/bulk",
+    "/cities/bulk-delete",
+    "/cities/stats/reconcile",
+)
+
+# Weight of the latest request in the running average of service times.
+SERVICE_TIME_SMOOTHING = 0.1
+
+
+# The change feed waits on the event loop and holds a connection only while it
+# reads the log, so its long-lived requests must not take up read slots.
+UNLIMITED_PATHS = ("/cities/changes",)
+
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    """Return the budget a cities request counts against, None for other routes."""
+    if "/cities" not in path or path.rstrip("/").endswith(UNLIMITED_PATHS):
+        return None
+    if path.rstrip("/").endswith(BULK_PATHS):
+        return BULK
+    if method in ("GET", "HEAD"):
+        return READ
+    return WRITE
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded queue and a deadline for waiting.
+
+    Lives on the event loop, so waiting requests hold neither a threadpool
+    thread nor a database connection. A request is turned away at once when
+    the queue is full or the expected wait already exceeds the deadline.
+    """
+
+    def __init__(
+        self, name: str, max_concurrent: int, max_queue: int, max_wait_seconds: float
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.service_seconds = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        """Seconds a request joining the queue now is expected to wait."""
+        return (self.queued + 1) * self.service_seconds / self.max_concurrent
+
+    def retry_after(self) -> int:
+        """Whole seconds a rejected client should wait before trying again."""
+        return max(1, math.ceil(min(self.expected_wait(), 60.0)))
+
+    async def acquire(self) -> bool:
+        """Wait for a slot; False when the request should be rejected."""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        if self.queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            return False
+        if self.expected_wait() > self.max_wait_seconds:
+            self.rejected_deadline += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.rejected_deadline += 1
+            return False
+        except BaseException:
+            self._discard(waiter)
+            # Handed a slot just before being cancelled: pass it on.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+        self.admitted += 1
+        return True
+
+    def release(self, service_seconds: Optional[float] = None) -> None:
+        """Free a slot, handing it straight to the oldest waiter if any."""
+        if service_seconds is not None:
+            self.service_seconds += SERVICE_TIME_SMOOTHING * (
+                service_seconds - self.service_seconds
+            )
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "service_ms": round(self.service_seconds * 1000, 3),
+        }
+
+
+class AdmissionController:
+    """One limiter per budget: reads, writes and bulk requests."""
+
+    def __init__(self, limiters: List[AdmissionLimiter]):
+        self.limiters: Dict[str, AdmissionLimiter] = {
+            limiter.name: limiter for limiter in limiters
+        }
+
+    def stats(self) -> List[dict]:
+        return [limiter.stats() for limiter in self.limiters.values()]
+
+
+def _build_controller() -> AdmissionController:
+    max_wait_seconds = settings.ADMISSION_MAX_WAIT_MS / 1000
+    return AdmissionController(
+        [
+            AdmissionLimiter(
+                READ,
+                settings.ADMISSION_READ_CONCURRENCY,
+                settings.ADMISSION_QUEUE_SIZE,
+                max_wait_seconds,
+            ),
+            AdmissionLimiter(
+                WRITE,
+                settings.ADMISSION_WRITE_CONCURRENCY,
+                settings.ADMISSION_QUEUE_SIZE,
+                max_wait_seconds,
+            ),
+            AdmissionLimiter(
+                BULK,
+                settings.ADMISSION_BULK_CONCURRENCY,
+                settings.ADMISSION_QUEUE_SIZE,
+                max_wait_seconds,
+            ),
+        ]
+    )
+
+
+admission_controller = _build_controller()
+
+
+class AdmissionMiddleware:
+    """Admits requests against their budget, or answers 503 with Retry-After.
+
+    The slot is held until the response, streamed or not, has been sent.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController = admission_controller,
+        classify: Callable[[str, str], Optional[str]] = classify_request,
+    ):
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        budget = None
+        if scope["type"] == "http":
+            budget = self.classify(scope["method"], scope["path"])
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.controller.limiters[budget]
+        if not await limiter.acquire():
+            response = JSONResponse(
+                {"detail": "Service is overloaded, try again later."},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - started)
@@ -1,6 +1,26 @@
+import math
 import sys
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
 
-import geopy.distance
+from app.config import settings
+
+# Mean Earth radius (IUGG), used by the spherical approximations.
+EARTH_RADIUS_KM = 6371.0088
+
+# Distances at which an ally's contribution changes.
+DISTANCE_BOUNDARIES_KM = (1000, 10000)
+
+# Largest relative errors against geopy's geodesic, measured over several
+# hundred thousand random pairs (benchmarks/bench_distance.py measures them
+# again), rounded up:
+#   haversine: 0.561% anywhere on the globe.
+#   equirectangular: 0.56% below 1000 km and 1.24% from 1000 to 1500 km, with
+#   both points within 70 degrees of the equator. Beyond that it is used only
+#   as a guess and haversine takes over.
+HAVERSINE_MAX_ERROR = 0.006
+EQUIRECTANGULAR_MAX_ERROR = 0.015
+EQUIRECTANGULAR_MAX_KM = 1500.0
+EQUIRECTANGULAR_MAX_LATITUDE = 70.0
 
 
 def is_testing() -> bool:
@@ -10,7 +30,205 @@ def is_testing() -> bool:
 
 def calculate_distance(origin: tuple, destination: tuple) -> int:
     """Calculate distance between two points in km."""
+    # Imported on first use to keep geopy off the startup path.
+    import geopy.distance
 
     distance = geopy.distance.geodesic(origin, destination).km
 
     return int(distance)
+
+
+def haversine_km(origin: tuple, destination: tuple) -> float:
+    """Great circle distance in km on a sphere of the mean Earth radius."""
+    latitude_1, longitude_1 = map(math.radians, map(float, origin))
+    latitude_2, longitude_2 = map(math.radians, map(float, destination))
+    h = (
+        math.sin((latitude_2 - latitude_1) / 2) ** 2
+        + math.cos(latitude_1)
+        * math.cos(latitude_2)
+        * math.sin((longitude_2 - longitude_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def equirectangular_km(origin: tuple, destination: tuple) -> float:
+    """Distance in km on a plane projected at the mean latitude of both points."""
+    latitude_1, longitude_1 = map(math.radians, map(float, origin))
+    latitude_2, longitude_2 = map(math.radians, map(float, destination))
+    longitude_delta = (longitude_2 - longitude_1 + math.pi) % (2 * math.pi) - math.pi
+    return EARTH_RADIUS_KM * math.hypot(
+        longitude_delta * math.cos((latitude_1 + latitude_2) / 2),
+        latitude_2 - latitude_1,
+    )
+
+
+def _haversine_estimate(origin: tuple, destination: tuple) -> Tuple[float, float]:
+    distance = haversine_km(origin, destination)
+    return distance, distance * HAVERSINE_MAX_ERROR
+
+
+def _equirectangular_estimate(origin: tuple, destination: tuple) -> Tuple[float, float]:
+    if (
+        abs(float(origin[0])) <= EQUIRECTANGULAR_MAX_LATITUDE
+        and abs(float(destination[0])) <= EQUIRECTANGULAR_MAX_LATITUDE
+    ):
+        distance = equirectangular_km(origin, destination)
+        if distance < EQUIRECTANGULAR_MAX_KM:
+            return distance, distance * EQUIRECTANGULAR_MAX_ERROR
+    return _haversine_estimate(origin, destination)
+
+
+def _haversine_estimates(origins, destinations):
+    """Vectorized _haversine_estimate over (n, 2) arrays of degrees."""
+    import numpy as np
+
+    latitude_1, longitude_1 = np.radians(origins).T
+    latitude_2, longitude_2 = np.radians(destinations).T
+    h = (
+        np.sin((latitude_2 - latitude_1) / 2) ** 2
+        + np.cos(latitude_1)
+        * np.cos(latitude_2)
+        * np.sin((longitude_2 - longitude_1) / 2) ** 2
+    )
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+    return distances, distances * HAVERSINE_MAX_ERROR
+
+
+def _equirectangular_estimates(origins, destinations):
+    """Vectorized _equirectangular_estimate over (n, 2) arrays of degrees."""
+    import numpy as np
+
+    distances, margins = _haversine_estimates(origins, destinations)
+    latitude_1, longitude_1 = np.radians(origins).T
+    latitude_2, longitude_2 = np.radians(destinations).T
+    longitude_delta = (longitude_2 - longitude_1 + np.pi) % (2 * np.pi) - np.pi
+    planar = EARTH_RADIUS_KM * np.hypot(
+        longitude_delta * np.cos((latitude_1 + latitude_2) / 2),
+        latitude_2 - latitude_1,
+    )
+    usable = (
+        (np.abs(origins[:, 0]) <= EQUIRECTANGULAR_MAX_LATITUDE)
+        & (np.abs(destinations[:, 0]) <= EQUIRECTANGULAR_MAX_LATITUDE)
+        & (planar < EQUIRECTANGULAR_MAX_KM)
+    )
+    return (
+        np.where(usable, planar, distances),
+        np.where(usable, planar * EQUIRECTANGULAR_MAX_ERROR, margins),
+    )
+
+
+class DistanceModel(NamedTuple):
+    """Estimates a distance in km together with the most it can be off by.
+
+    ``estimate`` takes one pair of points, ``estimate_many`` arrays of them.
+    Without estimates the model is the exact geodesic.
+    """
+
+    name: str
+    estimate: Optional[Callable[[tuple, tuple], Tuple[float, float]]]
+    estimate_many: Optional[Callable] = None
+
+
+DISTANCE_MODELS: Dict[str, DistanceModel] = {
+    model.name: model
+    for model in (
+        DistanceModel("geodesic", None),
+        DistanceModel("haversine", _haversine_estimate, _haversine_estimates),
+        DistanceModel(
+            "equirectangular", _equirectangular_estimate, _equirectangular_estimates
+        ),
+    )
+}
+
+
+def ally_distance_km(
+    origin: tuple, destination: tuple, model: Optional[DistanceModel] = None
+) -> int:
+    """Distance in whole km, as calculate_distance, for picking a contribution.
+
+    Approximate models fall back to the exact geodesic whenever their estimate
+    is within its error margin of a boundary, so the contribution is always
+    the one the geodesic distance gives.
+    """
+    model = model or DISTANCE_MODELS[settings.DISTANCE_MODEL]
+    if model.estimate is None:
+        return calculate_distance(origin, destination)
+
+    distance, margin = model.estimate(origin, destination)
+    if any(abs(distance - boundary) <= margin for boundary in DISTANCE_BOUNDARIES_KM):
+        return calculate_distance(origin, destination)
+    return int(distance)
+
+
+def ally_distances_km(
+    origins: Sequence[tuple],
+    destinations: Sequence[tuple],
+    model: Optional[DistanceModel] = None,
+) -> List[int]:
+    """ally_distance_km for many pairs, estimated in one vectorized pass."""
+    model = model or DISTANCE_MODELS[settings.DISTANCE_MODEL]
+    if model.estimate_many is None or not origins:
+        return [
+            calculate_distance(origin, destination)
+            for origin, destination in zip(origins, destinations)
+        ]
+
+    import numpy as np
+
+    distances, margins = model.estimate_many(
+        np.asarray(origins, dtype=np.float64).reshape(-1, 2),
+        np.asarray(destinations, dtype=np.float64).reshape(-1, 2),
+    )
+    near_boundary = np.zeros(len(distances), dtype=bool)
+    for boundary in DISTANCE_BOUNDARIES_KM:
+        near_boundary |= np.abs(distances - boundary) <= margins
+
+    result = distances.astype(np.int64).tolist()
+    for index in np.flatnonzero(near_boundary).tolist():
+        result[index] = calculate_distance(origins[index], destinations[index])
+    return result
+
+
+def calculate_ally_contribution(distance_in_km: int, population: int) -> int:
+    """Return how much of an ally's population counts towards allied power."""
+    if 1000 <= distance_in_km < 10000:
+        return int(population / 2)
+    elif distance_in_km >= 10000:
+        return int(population / 4)
+    return population
+
+
+def calculate_allied_power(
+    origin: tuple, allies: Iterable[Tuple], model: Optional[DistanceModel] = None
+) -> int:
+    """Sum the contributions of allies given as (latitude, longitude, population)."""
+    model = model or DISTANCE_MODELS[settings.DISTANCE_MODEL]
+    return sum(
+        calculate_ally_contribution(
+            ally_distance_km(origin, (latitude, longitude), model), population
+        )
+        for latitude, longitude, population in allies
+    )
+
+
+def calculate_allied_powers(
+    cities: Sequence[Tuple[tuple, Sequence[Tuple]]],
+    model: Optional[DistanceModel] = None,
+) -> List[int]:
+    """calculate_allied_power for many (origin, allies) at once.
+
+    Every city-ally pair goes through one ally_distances_km call.
+    """
+    origins, destinations, populations, owners = [], [], [], []
+    for index, (origin, allies) in enumerate(cities):
+        for latitude, longitude, population in allies:
+            origins.append(origin)
+            destinations.append((latitude, longitude))
+            populations.append(population)
+            owners.append(index)
+
+    powers = [0] * len(cities)
+    distances = ally_distances_km(origins, destinations, model)
+    for owner, distance, population in zip(owners, distances, populations):
+        powers[owner] += calculate_ally_contribution(distance, population)
+    return powers
@@ -1,19 +1,227 @@
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from typing import Dict, List, Optional, TextIO
 
+from app.config import settings
 
-def logger_config(module: str, level=logging.DEBUG) -> logging.Logger:
-    """Creates and configures a logger for a given module."""
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
 
-    logger = logging.getLogger(module)
-    if not logger.hasHandlers():
-        formatter = logging.Formatter(
-            "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+RESERVED_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in RESERVED_RECORD_ATTRIBUTES
+        )
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps only a fraction of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (
+            record.levelno > logging.DEBUG
+            or self.rate >= 1
+            or random.random() < self.rate
         )
 
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
 
+class BatchingLogWriter:
+    """Formats queued records and writes them in batches from a background thread.
+
+    While the thread is not running, records are written synchronously, so
+    scripts that never start it still get their output.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        stream: TextIO,
+        formatter: logging.Formatter,
+        queue_size: int,
+        batch_size: int = 256,
+    ):
+        self.stream = stream
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._state_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        with self._state_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write everything still queued and stop the thread."""
+        with self._state_lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+
+        self._queue.put(self._STOP)
+        thread.join(timeout)
+
+    def submit(self, record: logging.LogRecord) -> None:
+        """Queue a record without blocking, dropping it when the queue is full."""
+        if not self.running:
+            self.write([record])
+            return
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def write(self, records: List[logging.LogRecord]) -> None:
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                lines.append(f"unformattable log record from {record.name}")
+
+        with self._write_lock:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(record is self._STOP for record in batch)
+            records = [record for record in batch if record is not self._STOP]
+            if records:
+                self.write(records)
+            if stop:
+                return
+
+
+class BatchingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that hands records to a BatchingLogWriter."""
+
+    def __init__(self, writer: BatchingLogWriter):
+        super().__init__(None)
+        self.writer = writer
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Resolve the message and traceback; formatting is left to the writer thread."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.writer.submit(record)
+
+
+def parse_log_levels(value: str) -> Dict[str, int]:
+    """Parse "logger=LEVEL,..." into a mapping of logger names to levels."""
+    levels = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+log_writer = BatchingLogWriter(
+    stream=sys.stderr,
+    formatter=(
+        StructuredFormatter()
+        if settings.LOG_FORMAT == "json"
+        else logging.Formatter(TEXT_FORMAT)
+    ),
+    queue_size=settings.LOG_QUEUE_SIZE,
+)
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _configure_logging() -> None:
+    """Route every logger through the batching queue handler, once."""
+    global _configured
+
+    with _configure_lock:
+        if _configured:
+            return
+
+        handler = BatchingQueueHandler(log_writer)
+        handler.addFilter(DebugSampler(settings.LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+
+        for name, level in parse_log_levels(settings.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _configured = True
+
+
+def start_logging() -> None:
+    """Start writing log records from the background thread."""
+    _configure_logging()
+    log_writer.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued log records and stop the background thread."""
+    log_writer.stop()
+
+
+def logger_config(module: str, level: Optional[int] = None) -> logging.Logger:
+    """Returns the logger for a given module, routed through the logging pipeline."""
+    _configure_logging()
+
+    logger = logging.getLogger(module)
+    if level is not None:
         logger.setLevel(level)
-        logger.addHandler(handler)
 
     return logger
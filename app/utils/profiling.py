@@ -0,0 +1,180 @@
+import asyncio
+import cProfile
+import functools
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Deque, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from app.admin.dependencies import is_admin_token
+from app.config import settings
+
+PROFILE_HEADER = b"x-profile"
+ADMIN_TOKEN_HEADER = b"x-admin-token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+MAX_STATS_LINES = 40
+
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar(
+    "active_profile", default=None
+)
+_profile_ids = itertools.count(1)
+
+
+class RequestProfile:
+    """Timings and call statistics gathered while serving one request."""
+
+    def __init__(self, method: str, path: str):
+        self.profile_id = str(next(_profile_ids))
+        self.method = method
+        self.path = path
+        self.recorded_at = datetime.now(timezone.utc)
+        self.wall_ms = 0.0
+        self.endpoint_ms = 0.0
+        self.sql_ms = 0.0
+        self.sql_statements = 0
+        self.stats = ""
+        self._started = time.perf_counter()
+
+    def add_endpoint_profile(self, profiler: cProfile.Profile, elapsed: float) -> None:
+        """Keep the call statistics of the endpoint function."""
+        self.endpoint_ms += elapsed * 1000
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(MAX_STATS_LINES)
+        self.stats += stream.getvalue()
+
+    def finish(self) -> None:
+        self.wall_ms = (time.perf_counter() - self._started) * 1000
+
+
+class ProfileStore:
+    """Bounded store of the most recent request profiles."""
+
+    def __init__(self, max_profiles: int):
+        self._profiles: Deque[RequestProfile] = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[RequestProfile]:
+        """Return the stored profiles, newest first."""
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.profile_id == profile_id), None)
+
+
+profile_store = ProfileStore(settings.PROFILE_STORE_SIZE)
+
+
+class ProfilingMiddleware:
+    """Profiles requests sampled at random or asked for by an admin.
+
+    An admin asks for a profile by sending ``X-Profile: 1`` together with the
+    admin token; the profile id is returned in the ``X-Profile-Id`` header.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _active_profile.set(profile)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(
+                    PROFILE_ID_HEADER, profile.profile_id
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _active_profile.reset(token)
+            profile.finish()
+            profile_store.add(profile)
+
+    def _should_profile(self, scope) -> bool:
+        headers = dict(scope["headers"])
+        if headers.get(PROFILE_HEADER) and is_admin_token(
+            headers.get(ADMIN_TOKEN_HEADER, b"").decode("latin-1")
+        ):
+            return True
+
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+
+def _profiled(endpoint: Callable) -> Callable:
+    """Wrap an endpoint so it runs under cProfile, in its own thread, when profiled."""
+    # Async endpoints share the event loop thread with other requests, and
+    # include_router builds the route again from the already wrapped endpoint.
+    if asyncio.iscoroutinefunction(endpoint) or hasattr(endpoint, "__profiled__"):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile = _active_profile.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profile.add_endpoint_profile(profiler, time.perf_counter() - started)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route whose sync endpoint can be profiled; a plain route when profiling is off."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if settings.PROFILING_ENABLED:
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def attach_sql_timing(engine: Engine) -> None:
+    """Attribute the time spent in SQL statements to the active profile."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        # One start time per connection: a failed statement gets no
+        # after_cursor_execute, and its start is overwritten by the next one.
+        if _active_profile.get() is not None:
+            conn.info["profile_sql_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info.pop("profile_sql_started", None)
+        profile = _active_profile.get()
+        if profile is not None and started is not None:
+            profile.sql_ms += (time.perf_counter() - started) * 1000
+            profile.sql_statements += 1
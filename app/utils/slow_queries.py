@@ -0,0 +1,155 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+
+from app.config import settings
+from app.utils.logger import logger_config
+
+logger = logger_config(__name__)
+
+EXPLAINABLE_PREFIXES = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+MAX_PARAMETERS_LENGTH = 2000
+
+# Statements that write or take locks (FOR UPDATE and FOR SHARE included, as are
+# advisory locks and notifications); re-running them under ANALYZE would do the
+# work and wait for or hold the locks a second time.
+_WRITES_OR_LOCKS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|SHARE)\b|\bpg_(try_)?advisory|\bpg_notify\b",
+    re.IGNORECASE,
+)
+
+
+def explain_options(statement: str) -> str:
+    """EXPLAIN options for a statement: only reads are re-run under ANALYZE."""
+    return "" if _WRITES_OR_LOCKS.search(statement) else "(ANALYZE, BUFFERS) "
+
+
+class SlowQueryLog:
+    """Times statements on an engine and keeps the slowest recent ones in a ring buffer.
+
+    Plans are captured on a background thread, inside a transaction that is
+    always rolled back. Reads are re-run under EXPLAIN (ANALYZE, BUFFERS); writes
+    and locking reads only get a plain EXPLAIN, which plans them without running.
+    """
+
+    def __init__(self, threshold_ms: float, max_entries: int, explain: bool):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self._explain_slot = threading.Semaphore(1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def attach(self, engine: Engine) -> None:
+        """Start timing the statements executed on an engine."""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Return the recorded slow statements, newest first."""
+        with self._lock:
+            return [dict(entry) for entry in reversed(self._entries)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        # A connection runs one statement at a time, and a failed statement (which
+        # gets no after_cursor_execute) just has its start overwritten by the next.
+        conn.info["slow_query_started"] = time.perf_counter()
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        started = conn.info.pop("slow_query_started", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        if duration_ms < self.threshold_ms:
+            return
+        if conn.get_execution_options().get("slow_query_explain"):
+            return
+
+        self.record(conn, statement, parameters, duration_ms, executemany)
+
+    def record(
+        self,
+        conn: Connection,
+        statement: str,
+        parameters: Any,
+        duration_ms: float,
+        executemany: bool,
+    ) -> None:
+        """Keep a slow statement and schedule the capture of its plan."""
+        entry: Dict[str, Any] = {
+            "statement": statement.strip(),
+            "parameters": repr(parameters)[:MAX_PARAMETERS_LENGTH],
+            "duration_ms": round(duration_ms, 3),
+            "executemany": executemany,
+            "recorded_at": datetime.now(timezone.utc),
+            "plan": None,
+            "explain_error": None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+        logger.warning("slow query (%.1f ms): %s", duration_ms, entry["statement"])
+
+        if (
+            self.explain
+            and not executemany
+            and entry["statement"].upper().startswith(EXPLAINABLE_PREFIXES)
+            # At most one plan capture at a time; the rest are skipped, not queued.
+            and self._explain_slot.acquire(blocking=False)
+        ):
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="slow-query-explain"
+                )
+            self._executor.submit(
+                self._capture_plan, conn.engine, entry, statement, parameters
+            )
+
+    def _capture_plan(
+        self, engine: Engine, entry: Dict[str, Any], statement: str, parameters: Any
+    ) -> None:
+        """Capture the plan of a slow statement without keeping any effects."""
+        try:
+            with engine.connect() as connection:
+                connection = connection.execution_options(slow_query_explain=True)
+                transaction = connection.begin()
+                try:
+                    rows = connection.exec_driver_sql(
+                        f"EXPLAIN {explain_options(statement)}{statement}",
+                        parameters,
+                    ).fetchall()
+                finally:
+                    transaction.rollback()
+
+            plan, error = "\n".join(row[0] for row in rows), None
+        except Exception as e:
+            plan, error = None, str(e)
+        finally:
+            self._explain_slot.release()
+
+        with self._lock:
+            entry["plan"] = plan
+            entry["explain_error"] = error
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    max_entries=settings.SLOW_QUERY_LOG_SIZE,
+    explain=settings.SLOW_QUERY_EXPLAIN,
+)
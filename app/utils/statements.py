@@ -0,0 +1,140 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Set, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Result
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+# SQLSTATE for EXECUTE of a statement the connection does not have, e.g. after
+# a pooler reset the server session.
+INVALID_STATEMENT_NAME = "26000"
+
+# Matches :name bind parameters, but not :: casts.
+BIND_PARAMETER = re.compile(r"(?<![:\w]):(\w+)")
+
+Parameters = Union[Dict[str, Any], Sequence[Dict[str, Any]], None]
+
+
+class Statement:
+    """A named SQL statement compiled once.
+
+    Parameters are bound by name as with ``text()``; they must be scalars, since
+    a server-side prepared statement has a fixed number of parameters.
+    """
+
+    def __init__(self, name: str, sql: str, prepare: bool = True):
+        self.name = name
+        self.sql = sql
+        self.prepare = prepare
+        self.parameters = list(dict.fromkeys(BIND_PARAMETER.findall(sql)))
+        self.text = text(sql)
+
+        positions = {name: index for index, name in enumerate(self.parameters, 1)}
+        self.prepare_sql = f"PREPARE {name} AS " + BIND_PARAMETER.sub(
+            lambda match: f"${positions[match.group(1)]}", sql
+        ).strip().rstrip(";")
+        arguments = ", ".join(f":{parameter}" for parameter in self.parameters)
+        self.execute_text = text(
+            f"EXECUTE {name}({arguments})" if arguments else f"EXECUTE {name}"
+        )
+
+
+class StatementRegistry:
+    """Registry of the statements a service runs, with per-statement counters.
+
+    With ``prepared`` set, each statement is PREPAREd once per database
+    connection and run with EXECUTE, so Postgres parses and plans it once
+    instead of on every call. Connections remember what they prepared in their
+    ``info`` dict, which lives as long as the pooled connection.
+    """
+
+    INFO_KEY = "prepared_statements"
+
+    def __init__(self, prepared: bool):
+        self.prepared = prepared
+        self._statements: Dict[str, Statement] = {}
+        self._executions: Dict[str, int] = {}
+        self._prepares: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, sql: str, prepare: bool = True) -> Statement:
+        """Register a statement; ``prepare=False`` keeps it planned per call."""
+        if name in self._statements:
+            raise ValueError(f"Statement {name} is already registered.")
+
+        statement = Statement(name, sql, prepare)
+        self._statements[name] = statement
+        self._executions[name] = 0
+        self._prepares[name] = 0
+        return statement
+
+    def execute(
+        self, db: Session, statement: Statement, parameters: Parameters = None
+    ) -> Result:
+        """Run a registered statement on the session's connection."""
+        with self._lock:
+            self._executions[statement.name] += 1
+
+        if not (self.prepared and statement.prepare):
+            return db.execute(statement.text, parameters)
+
+        connection = db.connection()
+        prepared = self._prepare(connection, statement)
+
+        try:
+            return connection.execute(statement.execute_text, parameters)
+        except DBAPIError as e:
+            if getattr(e.orig, "pgcode", None) == INVALID_STATEMENT_NAME:
+                prepared.clear()
+            raise
+
+    def _prepare(self, connection: Connection, statement: Statement) -> Set[str]:
+        """PREPARE the statement unless the connection already has; return its set."""
+        prepared = connection.info.setdefault(self.INFO_KEY, set())
+        if statement.name not in prepared:
+            connection.execution_options(no_parameters=True).exec_driver_sql(
+                statement.prepare_sql
+            )
+            prepared.add(statement.name)
+            with self._lock:
+                self._prepares[statement.name] += 1
+        return prepared
+
+    def prepare_all(self, connection: Connection) -> int:
+        """PREPARE every preparable statement on a connection ahead of its first use.
+
+        Returns how many the connection has prepared, 0 when not ``prepared``.
+        """
+        if not self.prepared:
+            return 0
+
+        for statement in list(self._statements.values()):
+            if statement.prepare:
+                self._prepare(connection, statement)
+        return len(connection.info.get(self.INFO_KEY, ()))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Return the execution counts, most executed first."""
+        with self._lock:
+            return sorted(
+                (
+                    {
+                        "name": name,
+                        "executions": self._executions[name],
+                        "prepares": self._prepares[name],
+                        "prepared": self.prepared and self._statements[name].prepare,
+                    }
+                    for name in self._statements
+                ),
+                key=lambda entry: (-entry["executions"], entry["name"]),
+            )
+
+    def get(self, name: str) -> Optional[Statement]:
+        return self._statements.get(name)
+
+
+statement_registry = StatementRegistry(prepared=settings.PREPARED_STATEMENTS_ENABLED)
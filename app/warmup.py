@@ -0,0 +1,185 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.cities.statements import CITY_BY_UUID, LIST_CITIES
+from app.config import settings
+from app.database import get_engine, replica_pool
+from app.utils.logger import logger_config
+from app.utils.statements import statement_registry
+
+logger = logger_config(__name__)
+
+# Relations loaded into shared buffers by WARMUP_PREWARM; those missing from the
+# configured layout are skipped.
+PREWARM_RELATIONS = (
+    "city",
+    "city_pkey",
+    "allied_city",
+    "allied_city_pkey",
+    "idx_alliedcity_city_uuid",
+    "idx_alliedcity_ally_uuid",
+    "alliance",
+    "alliance_pkey",
+    "idx_alliance_ally_uuid",
+)
+
+
+def warm_engine(engine: Engine, connections: int, prepare: bool) -> int:
+    """Open pooled connections and plan, or prepare, the hot reads on each.
+
+    The connections are all checked out at once so the pool opens distinct
+    ones, and are kept by the pool when they are returned.
+    """
+    connections = min(connections, engine.pool.size())
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            opened.append(connection)
+            # Loads the catalog entries the hot reads need into the backend.
+            connection.execute(LIST_CITIES.text, {"skip": 0, "limit": 1}).fetchall()
+            connection.execute(CITY_BY_UUID.text, {"city_uuid": uuid4()}).fetchall()
+            if prepare:
+                statement_registry.prepare_all(connection)
+            connection.rollback()
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+def warm_distance_models() -> None:
+    """Import geopy and NumPy and run the allied power code once."""
+    from app.utils.common import calculate_allied_power, calculate_allied_powers
+
+    origin, allies = (52.5, 13.4), [(53.55, 9.99, 1), (-33.9, 151.2, 1)]
+    calculate_allied_power(origin, allies)
+    calculate_allied_powers([(origin, allies)])
+
+
+def prewarm_relations(engine: Engine) -> List[str]:
+    """Load the city tables and indexes into shared buffers with pg_prewarm.
+
+    Partitioned relations are loaded partition by partition; views have no
+    storage and are skipped.
+    """
+    with engine.connect() as connection:
+        installed = connection.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+        ).scalar()
+        if not installed:
+            logger.warning("warmup: pg_prewarm is not installed, skipping prewarm")
+            return []
+
+        return [
+            relation
+            for relation in PREWARM_RELATIONS
+            if connection.execute(
+                text(
+                    """
+                    SELECT pg_prewarm(t.relid)
+                    FROM (
+                        -- pg_partition_tree has no rows for a plain relation.
+                        SELECT to_regclass(:relation) AS relid
+                        UNION
+                        SELECT relid FROM pg_partition_tree(to_regclass(:relation))
+                    ) t
+                    JOIN pg_class c ON c.oid = t.relid
+                    WHERE c.relkind IN ('r', 'i')
+                    """
+                ),
+                {"relation": relation},
+            ).fetchall()
+        ]
+
+
+class Warmup:
+    """Background warmup after startup; the worker reports ready once it is done.
+
+    A failed step is logged and recorded but does not hold readiness back: the
+    worker serves the same requests warm or cold.
+    """
+
+    def __init__(self, steps: Optional[List[Tuple[str, Callable[[], Any]]]] = None):
+        self._steps = steps
+        self.ready = False
+        self.seconds: Optional[float] = None
+        self.step_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._state_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def steps(self) -> List[Tuple[str, Callable[[], Any]]]:
+        if self._steps is not None:
+            return self._steps
+
+        prepare = statement_registry.prepared
+        steps = [
+            (
+                "primary",
+                lambda: warm_engine(get_engine(), settings.WARMUP_CONNECTIONS, prepare),
+            ),
+            *(
+                (
+                    f"replica_{index}",
+                    lambda replica=replica: warm_engine(
+                        replica, settings.WARMUP_CONNECTIONS, prepare=False
+                    ),
+                )
+                for index, replica in enumerate(replica_pool.engines)
+            ),
+            ("distance_models", warm_distance_models),
+        ]
+        if settings.WARMUP_PREWARM:
+            steps.append(("prewarm", lambda: prewarm_relations(get_engine())))
+        return steps
+
+    def run(self) -> None:
+        """Run every step, then mark the worker ready."""
+        started = time.perf_counter()
+        for name, step in self.steps():
+            if self._stop_event.is_set():
+                return
+
+            step_started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.exception("warmup: %s failed", name)
+                self.errors[name] = str(e)
+            self.step_seconds[name] = time.perf_counter() - step_started
+
+        self.seconds = time.perf_counter() - started
+        self.ready = True
+        logger.info("warmup: ready in %.3fs", self.seconds)
+
+    def start(self) -> None:
+        with self._state_lock:
+            if self._thread is None:
+                self._stop_event.clear()
+                self._thread = threading.Thread(
+                    target=self.run, name="warmup", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Report not ready, skip the remaining steps and wait for the current one."""
+        self.ready = False
+        self._stop_event.set()
+        with self._state_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+
+warmup = Warmup()
@@ -0,0 +1,103 @@
+"""Measure the speed and error of the distance models against the geodesic.
+
+    python -m benchmarks.bench_distance --pairs 200000
+
+Reports the largest relative error of each raw approximation (the margins in
+app/utils/common.py must stay above them), how often each model falls back to
+the geodesic, and any pair whose contribution differs from the geodesic one.
+"""
+
+import argparse
+import random
+import time
+
+import geopy.distance
+
+from app.utils.common import (
+    DISTANCE_BOUNDARIES_KM,
+    DISTANCE_MODELS,
+    EQUIRECTANGULAR_MAX_KM,
+    EQUIRECTANGULAR_MAX_LATITUDE,
+    ally_distance_km,
+    calculate_ally_contribution,
+    equirectangular_km,
+    haversine_km,
+)
+
+
+def generate_pairs(count: int) -> list:
+    """Half of the pairs anywhere on the globe, half within a few hundred km."""
+    rng = random.Random(42)
+    pairs = []
+    for index in range(count):
+        origin = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+        if index % 2:
+            destination = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+        else:
+            destination = (
+                max(-90.0, min(90.0, origin[0] + rng.uniform(-15, 15))),
+                origin[1] + rng.uniform(-20, 20),
+            )
+        pairs.append((origin, destination))
+    return pairs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=200000)
+    arguments = parser.parse_args()
+
+    pairs = generate_pairs(arguments.pairs)
+    geodesic = [geopy.distance.geodesic(*pair).km for pair in pairs]
+    exact = [int(distance) for distance in geodesic]
+    haversine_error = max(
+        abs(haversine_km(*pair) - distance) / distance
+        for pair, distance in zip(pairs, geodesic)
+        if distance > 1
+    )
+    equirectangular_error = max(
+        (
+            abs(estimate - distance) / estimate
+            for pair, distance in zip(pairs, geodesic)
+            for estimate in (equirectangular_km(*pair),)
+            if 1 < estimate < EQUIRECTANGULAR_MAX_KM
+            and abs(pair[0][0]) <= EQUIRECTANGULAR_MAX_LATITUDE
+            and abs(pair[1][0]) <= EQUIRECTANGULAR_MAX_LATITUDE
+        ),
+        default=0.0,
+    )
+    print(f"haversine max relative error:       {haversine_error:.4%}")
+    print(f"equirectangular max relative error: {equirectangular_error:.4%}")
+    print()
+
+    print(f"{'model':<16}{'us/pair':>10}{'fallbacks':>12}{'mismatches':>12}")
+    for model in DISTANCE_MODELS.values():
+        started = time.perf_counter()
+        distances = [ally_distance_km(*pair, model) for pair in pairs]
+        seconds = time.perf_counter() - started
+
+        fallbacks = 0
+        if model.estimate is not None:
+            fallbacks = sum(
+                1
+                for pair in pairs
+                for distance, margin in (model.estimate(*pair),)
+                if any(
+                    abs(distance - boundary) <= margin
+                    for boundary in DISTANCE_BOUNDARIES_KM
+                )
+            )
+        mismatches = sum(
+            1
+            for distance, exact_distance in zip(distances, exact)
+            if calculate_ally_contribution(distance, 1000)
+            != calculate_ally_contribution(exact_distance, 1000)
+        )
+        print(
+            f"{model.name:<16}{seconds / len(pairs) * 1e6:>10.2f}"
+            f"{fallbacks / len(pairs):>12.2%}{mismatches:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Compare plain and hash-partitioned city and allied_city tables at scale.
+
+Builds both layouts side by side, in the schemas ``bench_plain`` and
+``bench_hash``, of the database in DATABASE_URI (Postgres 13 or newer), loads
+the same generated cities and alliances into each and measures the operations
+partitioning is meant to help:
+
+    python -m benchmarks.bench_partitioning --cities 1000000 --allies 8 --partitions 16
+
+The schemas are dropped afterwards unless ``--keep`` is given.
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.cities.statements import CITY_BY_UUID
+from app.config import settings
+
+# The alliance delete used on partitioned tables: both lookups are by city_uuid.
+DELETE_ALLIANCES_BY_CITY_ROWS = """
+    DELETE FROM allied_city
+    WHERE (city_uuid, ally_uuid) IN (
+        SELECT city_uuid, ally_uuid FROM allied_city WHERE city_uuid = :city_id
+        UNION ALL
+        SELECT ally_uuid, city_uuid FROM allied_city WHERE city_uuid = :city_id
+    )
+"""
+
+# The alliance delete used on plain tables: partitioned, its ally_uuid arm
+# probes the ally index of every partition.
+DELETE_ALLIANCES_BY_EITHER_SIDE = """
+    DELETE FROM allied_city
+    WHERE city_uuid = :city_id OR ally_uuid = :city_id
+"""
+
+
+def create_tables(connection, partitions: int) -> None:
+    partition_by = " PARTITION BY HASH (city_uuid)" if partitions else ""
+    connection.execute(
+        text(
+            f"""
+            CREATE TABLE city (
+                city_uuid uuid PRIMARY KEY,
+                name varchar(64) NOT NULL,
+                beauty text,
+                population integer NOT NULL,
+                geo_location_latitude numeric(9, 6) NOT NULL,
+                geo_location_longitude numeric(9, 6) NOT NULL
+            ){partition_by};
+            CREATE TABLE allied_city (
+                city_uuid uuid REFERENCES city (city_uuid),
+                ally_uuid uuid,
+                PRIMARY KEY (city_uuid, ally_uuid)
+            ){partition_by};
+            CREATE INDEX idx_alliedcity_ally_uuid ON allied_city (ally_uuid);
+            """
+        )
+    )
+    if not partitions:
+        connection.execute(
+            text("CREATE INDEX idx_alliedcity_city_uuid ON allied_city (city_uuid)")
+        )
+    for table in ("city", "allied_city"):
+        for remainder in range(partitions):
+            connection.execute(
+                text(
+                    f"CREATE TABLE {table}_p{remainder} PARTITION OF {table} "
+                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                )
+            )
+
+
+def load(connection, cities: int, allies: int) -> float:
+    """Load cities, each allied both ways with the ``allies`` following ones."""
+    started = time.perf_counter()
+    connection.execute(
+        text(
+            """
+            INSERT INTO city
+            SELECT gen_random_uuid(), 'City ' || i, 'Average', i % 1000000,
+                   random() * 180 - 90, random() * 360 - 180
+            FROM generate_series(1, :cities) i
+            """
+        ),
+        {"cities": cities},
+    )
+    connection.execute(
+        text(
+            """
+            CREATE TEMP TABLE city_number AS
+            SELECT row_number() OVER () AS number, city_uuid FROM city;
+            CREATE INDEX ON city_number (number);
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO allied_city
+            SELECT pair.city_uuid, pair.ally_uuid
+            FROM city_number a
+            CROSS JOIN generate_series(1, :half) step
+            JOIN city_number b ON b.number = (a.number + step - 1) % :cities + 1
+            CROSS JOIN LATERAL (
+                VALUES (a.city_uuid, b.city_uuid), (b.city_uuid, a.city_uuid)
+            ) AS pair (city_uuid, ally_uuid)
+            ON CONFLICT DO NOTHING
+            """
+        ),
+        {"half": max(1, allies // 2), "cities": cities},
+    )
+    connection.execute(text("DROP TABLE city_number"))
+    return time.perf_counter() - started
+
+
+def time_per_call(connection, sql, parameters: list, rollback: bool = False) -> float:
+    """Average milliseconds per execution; writes are rolled back each time."""
+    started = time.perf_counter()
+    for values in parameters:
+        if rollback:
+            savepoint = connection.begin_nested()
+            connection.execute(text(sql), values)
+            savepoint.rollback()
+        else:
+            connection.execute(text(sql), values).fetchall()
+    return (time.perf_counter() - started) / len(parameters) * 1000
+
+
+def index_megabytes(connection):
+    """Total size of allied_city's indexes and the size of the largest one."""
+    row = connection.execute(
+        text(
+            """
+            SELECT sum(pg_relation_size(i.indexrelid)) AS total,
+                   max(pg_relation_size(i.indexrelid)) AS largest
+            FROM (
+                -- pg_partition_tree has no rows for a plain table.
+                SELECT CAST('allied_city' AS regclass) AS relid
+                UNION
+                SELECT relid FROM pg_partition_tree('allied_city')
+            ) t
+            JOIN pg_index i ON i.indrelid = t.relid
+            """
+        )
+    ).one()
+    return row.total / 2**20, row.largest / 2**20
+
+
+def vacuum_seconds(engine, schema: str, delete_fraction: float) -> float:
+    """Delete a slice of the alliances and time the VACUUM that cleans them up."""
+    with engine.begin() as connection:
+        connection.execute(text(f"SET search_path TO {schema}"))
+        connection.execute(
+            text("DELETE FROM allied_city WHERE random() < :fraction"),
+            {"fraction": delete_fraction},
+        )
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(f"SET search_path TO {schema}"))
+        started = time.perf_counter()
+        connection.execute(text("VACUUM allied_city"))
+        return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cities", type=int, default=1_000_000)
+    parser.add_argument("--allies", type=int, default=8)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--keep", action="store_true")
+    arguments = parser.parse_args()
+
+    engine = create_engine(
+        settings.DATABASE_URI,
+        connect_args={
+            "options": "-c enable_partitionwise_join=on"
+            " -c enable_partitionwise_aggregate=on"
+        },
+    )
+    layouts = (("bench_plain", 0), ("bench_hash", arguments.partitions))
+
+    print(
+        f"{'layout':<12}{'load s':>8}{'read ms':>9}{'pruned del ms':>15}"
+        f"{'either del ms':>15}{'index MB':>10}{'largest MB':>12}{'vacuum s':>10}"
+    )
+    try:
+        for schema, partitions in layouts:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+                connection.execute(text(f"CREATE SCHEMA {schema}"))
+                connection.execute(text(f"SET search_path TO {schema}"))
+                create_tables(connection, partitions)
+                load_seconds = load(connection, arguments.cities, arguments.allies)
+
+            with engine.connect() as connection:
+                connection.execution_options(isolation_level="AUTOCOMMIT").execute(
+                    text(f"ANALYZE {schema}.city; ANALYZE {schema}.allied_city")
+                )
+
+            with engine.connect() as connection:
+                connection.execute(text(f"SET search_path TO {schema}"))
+                sample = [
+                    row.city_uuid
+                    for row in connection.execute(
+                        text("SELECT city_uuid FROM city TABLESAMPLE SYSTEM (1)")
+                    )
+                ]
+                sample = random.Random(42).sample(
+                    sample, min(arguments.samples, len(sample))
+                )
+                read_ms = time_per_call(
+                    connection, CITY_BY_UUID.sql, [{"city_uuid": c} for c in sample]
+                )
+                delete_ms = time_per_call(
+                    connection,
+                    DELETE_ALLIANCES_BY_CITY_ROWS,
+                    [{"city_id": c} for c in sample],
+                    rollback=True,
+                )
+                either_delete_ms = time_per_call(
+                    connection,
+                    DELETE_ALLIANCES_BY_EITHER_SIDE,
+                    [{"city_id": c} for c in sample],
+                    rollback=True,
+                )
+                total_mb, largest_mb = index_megabytes(connection)
+                connection.rollback()
+
+            vacuum_s = vacuum_seconds(engine, schema, delete_fraction=0.05)
+            print(
+                f"{schema:<12}{load_seconds:>8.1f}{read_ms:>9.3f}{delete_ms:>15.3f}"
+                f"{either_delete_ms:>15.3f}{total_mb:>10.0f}{largest_mb:>12.0f}"
+                f"{vacuum_s:>10.2f}"
+            )
+    finally:
+        if not arguments.keep:
+            with engine.begin() as connection:
+                for schema, _ in layouts:
+                    connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
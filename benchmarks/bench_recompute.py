@@ -0,0 +1,71 @@
+"""Measure how the allied power recompute scales with worker processes.
+
+Runs the compute step of ``python -m app.cities.recompute`` on generated cities,
+without a database:
+
+    python -m benchmarks.bench_recompute --cities 20000 --allies 8
+"""
+
+import argparse
+import os
+import random
+import time
+
+from app.cities.recompute import map_partitions
+
+
+def generate_partitions(cities: int, allies: int, partition_size: int) -> list:
+    rng = random.Random(42)
+
+    def point():
+        return rng.uniform(-90, 90), rng.uniform(-180, 180)
+
+    partitions, partition = [], []
+    for index in range(cities):
+        latitude, longitude = point()
+        partition.append(
+            (
+                f"city-{index}",
+                latitude,
+                longitude,
+                rng.randint(1, 10_000_000),
+                [(*point(), rng.randint(1, 10_000_000)) for _ in range(allies)],
+            )
+        )
+        if len(partition) == partition_size:
+            partitions.append(partition)
+            partition = []
+    if partition:
+        partitions.append(partition)
+    return partitions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cities", type=int, default=20000)
+    parser.add_argument("--allies", type=int, default=8)
+    parser.add_argument("--partition-size", type=int, default=1000)
+    arguments = parser.parse_args()
+
+    partitions = generate_partitions(
+        arguments.cities, arguments.allies, arguments.partition_size
+    )
+    cores = os.cpu_count() or 1
+    counts = sorted({count for count in (1, 2, 4, 8, 16) if count < cores} | {cores})
+
+    print(f"{'workers':>8}{'seconds':>10}{'cities/s':>12}{'speedup':>10}")
+    baseline = None
+    for workers in counts:
+        started = time.perf_counter()
+        for _ in map_partitions(partitions, workers):
+            pass
+        seconds = time.perf_counter() - started
+        baseline = baseline or seconds
+        print(
+            f"{workers:>8}{seconds:>10.2f}{arguments.cities / seconds:>12.0f}"
+            f"{baseline / seconds:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
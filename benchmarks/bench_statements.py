@@ -0,0 +1,86 @@
+"""Compare CityService statements run as plain SQL and as prepared statements.
+
+Run against a database migrated with ``python -m app.migrations``:
+
+    python -m benchmarks.bench_statements --iterations 5000
+
+Lookups read existing cities; inserts run in a transaction that is rolled back.
+"""
+
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from app.cities import statements  # noqa: F401  (registers the statements)
+from app.cities.schemas import CityCreate
+from app.cities.services import CityService
+from app.database import SessionLocal, get_engine
+from app.utils.statements import statement_registry
+
+
+def time_lookups(iterations: int, city_uuids: list) -> float:
+    session = SessionLocal(bind=get_engine())
+    try:
+        service = CityService(session)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            service._fetch_city_by_uuid(random.choice(city_uuids))
+        return time.perf_counter() - started
+    finally:
+        session.close()
+
+
+def time_inserts(iterations: int) -> float:
+    city = CityCreate(
+        name="Benchmark City",
+        beauty="Average",
+        population=1000,
+        geo_location_latitude=Decimal("12.432"),
+        geo_location_longitude=Decimal("54.234"),
+    )
+    session = SessionLocal(bind=get_engine())
+    try:
+        service = CityService(session)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            service._insert_city(city)
+        return time.perf_counter() - started
+    finally:
+        session.rollback()
+        session.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    arguments = parser.parse_args()
+
+    with get_engine().connect() as connection:
+        city_uuids = [
+            str(row.city_uuid)
+            for row in connection.exec_driver_sql(
+                "SELECT city_uuid FROM city LIMIT 10000"
+            )
+        ]
+    if not city_uuids:
+        parser.error("the city table is empty; create some cities first")
+
+    print(f"{'statement':<22}{'mode':<10}{'us/op':>10}{'ops/s':>12}")
+    for name, run in (
+        ("_fetch_city_by_uuid", lambda: time_lookups(arguments.iterations, city_uuids)),
+        ("_insert_city", lambda: time_inserts(arguments.iterations)),
+    ):
+        for prepared in (False, True):
+            statement_registry.prepared = prepared
+            run()  # warm up the pool, and the prepared statements on its connection
+            seconds = run()
+            print(
+                f"{name:<22}{'prepared' if prepared else 'plain':<10}"
+                f"{seconds / arguments.iterations * 1e6:>10.1f}"
+                f"{arguments.iterations / seconds:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
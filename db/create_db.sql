@@ -1,2 +1,3 @@
 CREATE DATABASE web;
-CREATE DATABASE web_test;
\ No newline at end of file
+CREATE DATABASE web_test;
+CREATE DATABASE web_test_replica;